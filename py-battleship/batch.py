@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Vectorized battleship operations on many boards at once
+
+Classes:
+
+1. BatchGame -- K boards fired at in lockstep, one shot per board per step
+2. RandomBatchController -- fires at every cell of each board once in a random order
+3. ParityBatchController -- hunts on a checkerboard, targets the neighbours of open hits
+
+Functions:
+
+1. deploy_batch -- deploy thousands of fleets in a handful of NumPy operations
+2. unpack_placements -- expand packed placement ids into (n, grid, grid) ship id boards
+
+BatchGame holds all K boards as struct of arrays: one (K, n, n) uint8
+array of ship ids and fired-at flags plus per board counters.  A step resolves one
+shot on every board still in play with a few NumPy operations, with the
+same outcomes as Game.take_turn ('hit', 'sunk', 'out_bounds', 'gone' or
+'miss'), and retires the boards whose fleet has been sunk.
+
+Batch controllers have the interface
+
+select_targets(games) -- returns (rows, cols) int arrays, one target per game
+record_results(games, rows, cols, results, sunk_sizes) -- told the outcomes
+
+where games is the array of indexes of the boards in play, results are
+codes into record.RESULTS and sunk_sizes is 0 where nothing was sunk.
+
+A two player match between controllers a and b, with a firing first, is
+won by a if a needs no more shots than b, so playing each controller
+against its own BatchGame of the same fleets gives the result of K
+matches.
+
+"""
+
+import numpy as np
+
+from placements import placement_index
+from record import RESULT_CODES
+from seeding import make_generator, make_rng
+from targeting import CELL_HIT, CELL_MISSED, CELL_UNKNOWN
+
+MISS = RESULT_CODES['miss']
+HIT = RESULT_CODES['hit']
+SUNK = RESULT_CODES['sunk']
+GONE = RESULT_CODES['gone']
+OUT_BOUNDS = RESULT_CODES['out_bounds']
+
+#(row, col) offsets of the cells next to a cell
+NEIGHBOURS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+#a BatchGame cell holds the ship id in its low bits and FIRED once fired at
+SHIP_BITS = 0x3F
+FIRED = 0x80
+
+#rounds of vectorized rejection before the remaining fleets are
+#deployed one at a time by the backtracking engine
+MAX_REJECTION_ROUNDS = 100
+
+
+def deploy_batch(engine, n, packed, rng):
+   '''
+   Deploy n fleets for a RandomDeployEngine.
+
+   Ships are placed largest first.  For each ship every pending fleet
+   draws a placement uniformly at random; fleets where the placement
+   overlaps an earlier ship redraw in the next round.  Any fleets still
+   pending after MAX_REJECTION_ROUNDS rounds are deployed by the engine's
+   backtracking deploy_placements() so crowded boards cannot spin.  They
+   draw from a random.Random seeded from rng, so the fleets depend only on
+   rng and not on the engine's own random state.
+
+   Returns an (n, n_ships) array of placement ids if packed is True
+   otherwise an (n, grid_size, grid_size) array of 1 based ship ids.
+
+   Keyword arguments:
+   engine -- a RandomDeployEngine
+   n -- number of fleets
+   packed -- return placement ids rather than boards
+   rng -- numpy.random.Generator
+   '''
+   grid_size = engine.grid_size
+   sizes = sorted(engine.ship_sizes, reverse=True)
+   cells = {size: index.cell_table for size, index in engine._indexes.items()}
+
+   occupied = np.zeros((n, grid_size * grid_size), dtype=bool)
+   placements = np.empty((n, len(sizes)), dtype=np.int32)
+   stuck = np.zeros(n, dtype=bool)
+
+   for ship, size in enumerate(sizes):
+      table = cells[size]
+      pending = np.flatnonzero(~stuck)
+
+      for _ in range(MAX_REJECTION_ROUNDS):
+         if len(pending) == 0:
+            break
+
+         choice = rng.integers(0, len(table), size=len(pending))
+         ship_cells = table[choice]
+         overlap = occupied[pending[:, None], ship_cells].any(axis=1)
+
+         accepted = pending[~overlap]
+         occupied[accepted[:, None], ship_cells[~overlap]] = True
+         placements[accepted, ship] = choice[~overlap]
+
+         pending = pending[overlap]
+
+      stuck[pending] = True
+
+   if stuck.any():
+      fallback_rng = make_rng(rng)
+      for fleet in np.flatnonzero(stuck):
+         _, chosen = engine.deploy_placements(fallback_rng)
+         placements[fleet] = chosen
+
+   if packed:
+      return placements
+
+   return unpack_placements(placements, sizes, grid_size)
+
+
+def unpack_placements(placements, sizes, grid_size):
+   '''
+   Returns an (n, grid_size, grid_size) array of 1 based ship ids
+   (0 = sea) from an (n, n_ships) array of placement ids
+
+   Keyword arguments:
+   placements -- (n, n_ships) array of placement ids
+   sizes -- ship size of each column of placements
+   grid_size -- size of the n X n board
+   '''
+   n = len(placements)
+   dtype = np.min_scalar_type(len(sizes))
+   boards = np.zeros((n, grid_size * grid_size), dtype=dtype)
+   rows = np.arange(n)[:, None]
+
+   for ship, size in enumerate(sizes):
+      table = placement_index(grid_size, size).cell_table
+      boards[rows, table[placements[:, ship]]] = ship + 1
+
+   return boards.reshape(n, grid_size, grid_size)
+
+
+class BatchGame(object):
+   """
+   K independent boards, each with its own randomly deployed fleet, fired
+   at in lockstep.
+
+   boards is one (K, grid_size, grid_size) uint8 array.  The low bits of
+   a cell hold the 1 based id of the ship in it (0 = sea) and FIRED is
+   set once the cell has been fired at, so a shot is resolved with one
+   read and one write per board.  remaining[k, s] is the number of cells
+   of ship s on board k not yet hit, afloat[k] the ships not yet sunk and
+   shots[k] the shots fired at board k.  active holds the indexes of the
+   boards still in play.
+
+   Key methods are fire() and play()
+   """
+
+   def __init__(self, k, deploy_engine, rng=None):
+      '''
+      Keyword arguments:
+      k -- number of boards
+      deploy_engine -- RandomDeployEngine giving the board size and fleet
+      rng -- numpy.random.Generator (or any seed accepted by
+      seeding.make_generator) used to deploy the fleets (default = None
+      i.e. seeded from the engine's rng)
+      '''
+      grid_size = deploy_engine.grid_size
+      if len(deploy_engine.ship_sizes) > SHIP_BITS:
+         raise ValueError(f'A batch board holds at most {SHIP_BITS} ships')
+
+      self.k = k
+      self.grid_size = grid_size
+      self.sizes = np.array(sorted(deploy_engine.ship_sizes, reverse=True))
+      self.boards = deploy_engine.deploy_batch(k, rng=rng).astype(np.uint8)
+
+      self.remaining = np.tile(np.concatenate([[0], self.sizes]), (k, 1)).astype(np.int16)
+      self.afloat = np.full(k, len(self.sizes), dtype=np.int16)
+      self.shots = np.zeros(k, dtype=np.int64)
+      self.active = np.arange(k)
+
+   @property
+   def ships(self):
+      '''
+      (K, grid_size, grid_size) array of 1 based ship ids, 0 = sea
+      '''
+      return self.boards & SHIP_BITS
+
+   @property
+   def status(self):
+      '''
+      (K, grid_size, grid_size) array of CELL_UNKNOWN, CELL_MISSED or CELL_HIT
+      '''
+      fired = self.boards >= FIRED
+      status = np.full(self.boards.shape, CELL_UNKNOWN, dtype=np.uint8)
+      status[fired] = CELL_MISSED
+      status[fired & (self.ships > 0)] = CELL_HIT
+      return status
+
+   def finished(self):
+      return len(self.active) == 0
+
+   def fire(self, rows, cols):
+      '''
+      Fire one missile at every board in play and retire the boards whose
+      last ship was sunk.
+
+      Returns (games, results, sunk_sizes): the boards fired at, the
+      result code of each shot (see record.RESULTS) and the size of the
+      ship sunk (0 if none).
+
+      Keyword arguments:
+      rows -- int array of the row targeted on each board in active
+      cols -- int array of the col targeted on each board in active
+      '''
+      n = self.grid_size
+      games = self.active
+      rows = np.asarray(rows)
+      cols = np.asarray(cols)
+
+      in_bounds = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n)
+      flat = games * (n * n) + np.where(in_bounds, rows * n + cols, 0)
+
+      boards = self.boards.reshape(-1)
+      cells = boards.take(flat)
+      fresh = in_bounds & (cells < FIRED)
+      boards.put(flat[fresh], cells[fresh] | FIRED)
+
+      ship = cells & SHIP_BITS
+      hit = fresh & (ship > 0)
+
+      #one shot per board so no ship is decremented twice
+      remaining = self.remaining.reshape(-1)
+      ship_flat = games[hit] * self.remaining.shape[1] + ship[hit]
+      left = remaining.take(ship_flat) - 1
+      remaining.put(ship_flat, left)
+
+      sunk = np.zeros_like(hit)
+      sunk[hit] = left == 0
+      self.afloat[games[sunk]] -= 1
+
+      results = np.where(in_bounds, GONE, OUT_BOUNDS).astype(np.uint8)
+      results[fresh] = MISS
+      results[hit] = HIT
+      results[sunk] = SUNK
+
+      sunk_sizes = np.zeros(len(games), dtype=np.int16)
+      sunk_sizes[sunk] = self.sizes[ship[sunk] - 1]
+
+      self.shots[games] += 1
+      if sunk.any():
+         self.active = games[self.afloat[games] > 0]
+
+      return games, results, sunk_sizes
+
+   def step(self, controller):
+      '''
+      Let controller choose one target on every board in play, fire and
+      report the outcomes.  Returns the number of shots fired.
+      '''
+      games = self.active
+      rows, cols = controller.select_targets(games)
+      _, results, sunk_sizes = self.fire(rows, cols)
+      controller.record_results(games, rows, cols, results, sunk_sizes)
+      return len(games)
+
+   def play(self, controller, max_shots=None):
+      '''
+      Step until every fleet is sunk (or max_shots steps have been taken).
+      Returns shots, the number of shots fired at each board.
+
+      Keyword arguments:
+      controller -- a batch controller for this game's boards
+      max_shots -- maximum steps (default = None i.e. no limit)
+      '''
+      steps = 0
+      while len(self.active) and (max_shots is None or steps < max_shots):
+         self.step(controller)
+         steps += 1
+
+      return self.shots
+
+
+class RandomBatchController(object):
+   """
+   Fires at the cells of each board in its own random order without
+   repeating a cell, so no shot is ever 'gone'.
+   """
+
+   def __init__(self, k, grid_size, rng=None):
+      '''
+      Keyword arguments:
+      k -- number of boards
+      grid_size -- boards are grid_size X grid_size
+      rng -- numpy.random.Generator (or any seed accepted by
+      seeding.make_generator) (default = None)
+      '''
+      rng = make_generator(rng)
+      cells = np.arange(grid_size * grid_size, dtype=np.min_scalar_type(grid_size * grid_size))
+
+      self.grid_size = grid_size
+      self.order = rng.permuted(np.tile(cells, (k, 1)), axis=1)
+      self.position = np.zeros(k, dtype=np.int64)
+
+   @classmethod
+   def for_game(cls, game, rng=None):
+      return cls(game.k, game.grid_size, rng)
+
+   def select_targets(self, games):
+      position = self.position[games]
+      cells = self.order.reshape(-1).take(games * self.order.shape[1] + position)
+      self.position[games] = position + 1
+      return np.divmod(cells.astype(np.int64), self.grid_size)
+
+   def record_results(self, games, rows, cols, results, sunk_sizes):
+      pass
+
+
+class ParityBatchController(object):
+   """
+   Hunt / target.  Hunts by firing at the cells of one checkerboard
+   colour in a random order (then the other colour, for fleets with 1x1
+   ships).  Every hit pushes its neighbours onto the board's stack and
+   while there are hits not accounted for by the ships reported sunk the
+   controller targets the cells popped from the stack.
+   """
+
+   def __init__(self, k, grid_size, ship_cells, rng=None):
+      '''
+      Keyword arguments:
+      k -- number of boards
+      grid_size -- boards are grid_size X grid_size
+      ship_cells -- total length of the fleet (bounds the stack size)
+      rng -- numpy.random.Generator (or any seed accepted by
+      seeding.make_generator) (default = None)
+      '''
+      self.rng = make_generator(rng)
+      n = grid_size
+      cell_type = np.min_scalar_type(n * n)
+      cells = np.arange(n * n, dtype=cell_type)
+      black = cells[(cells // n + cells % n) % 2 == 0]
+      white = cells[(cells // n + cells % n) % 2 == 1]
+
+      self.grid_size = n
+      self.order = np.concatenate([self.rng.permuted(np.tile(black, (k, 1)), axis=1),
+                                   self.rng.permuted(np.tile(white, (k, 1)), axis=1)],
+                                  axis=1)
+      self.position = np.zeros(k, dtype=np.int64)
+      self.status = np.full((k, n * n), CELL_UNKNOWN, dtype=np.uint8)
+
+      #neighbours of hits still to try, stack[k, :top[k]]
+      self.stack = np.zeros((k, 4 * ship_cells), dtype=cell_type)
+      self.top = np.zeros(k, dtype=np.int64)
+
+      #hits not yet accounted for by the ships reported sunk
+      self.open_hits = np.zeros(k, dtype=np.int64)
+
+   @classmethod
+   def for_game(cls, game, rng=None):
+      return cls(game.k, game.grid_size, int(game.sizes.sum()), rng)
+
+   def select_targets(self, games):
+      cells = np.empty(len(games), dtype=np.int64)
+      status = self.status.reshape(-1)
+      n_cells = self.grid_size * self.grid_size
+
+      #pop the stacks until an unknown cell comes up or the stack is empty
+      pending = np.flatnonzero(self.top[games] > 0)
+      hunting = [np.flatnonzero(self.top[games] == 0)]
+      while len(pending):
+         g = games[pending]
+         self.top[g] -= 1
+         cell = self.stack[g, self.top[g]].astype(np.int64)
+         fresh = status.take(g * n_cells + cell) == CELL_UNKNOWN
+         cells[pending[fresh]] = cell[fresh]
+
+         pending = pending[~fresh]
+         empty = self.top[games[pending]] == 0
+         hunting.append(pending[empty])
+         pending = pending[~empty]
+
+      hunting = np.concatenate(hunting)
+      cells[hunting] = self._hunt_cells(games[hunting])
+
+      return np.divmod(cells, self.grid_size)
+
+   def record_results(self, games, rows, cols, results, sunk_sizes):
+      n = self.grid_size
+      status = self.status.reshape(-1)
+      flat = games * (n * n) + rows * n + cols
+      hit = (results == HIT) | (results == SUNK)
+      miss = results == MISS
+
+      status.put(flat[hit], CELL_HIT)
+      status.put(flat[miss], CELL_MISSED)
+
+      self.open_hits[games[hit]] += 1
+      self.open_hits[games] -= sunk_sizes
+
+      g = games[hit]
+      r = rows[hit]
+      c = cols[hit]
+      for dr, dc in NEIGHBOURS[self.rng.permutation(len(NEIGHBOURS))]:
+         inside = (r + dr >= 0) & (r + dr < n) & (c + dc >= 0) & (c + dc < n)
+         pushed = g[inside]
+         self.stack[pushed, self.top[pushed]] = (r + dr)[inside] * n + (c + dc)[inside]
+         self.top[pushed] += 1
+
+      #nothing left to target once every hit belongs to a sunk ship
+      done = games[self.open_hits[games] == 0]
+      self.top[done] = 0
+
+   def _hunt_cells(self, games):
+      '''
+      Returns the next unknown cell in each game's hunting order
+      '''
+      status = self.status.reshape(-1)
+      n_cells = self.grid_size * self.grid_size
+      order = self.order.reshape(-1)
+      position = self.position[games]
+      cells = order.take(games * n_cells + position).astype(np.int64)
+
+      #skip cells already fired at while targeting
+      known = np.flatnonzero(status.take(games * n_cells + cells) != CELL_UNKNOWN)
+      while len(known):
+         position[known] += 1
+         cells[known] = order.take(games[known] * n_cells + position[known])
+         known = known[status.take(games[known] * n_cells + cells[known]) != CELL_UNKNOWN]
+
+      self.position[games] = position + 1
+      return cells
+
+
+if __name__ == "__main__":
+
+   import time
+
+   from classic_battleship import RandomDeployEngine
+
+   k = 100000
+   for controller_class in (RandomBatchController, ParityBatchController):
+      game = BatchGame(k, RandomDeployEngine([5, 4, 3, 3, 2], 10, 42))
+      controller = controller_class.for_game(game, rng=7)
+
+      start = time.perf_counter()
+      shots = game.play(controller)
+      elapsed = time.perf_counter() - start
+
+      print(f'{controller_class.__name__}: {k} games, mean shots {shots.mean():.2f}, '
+            f'{shots.sum() / elapsed:,.0f} shots/s')
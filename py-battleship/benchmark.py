@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Battleship benchmarks
+
+Functions:
+
+1. time_games -- games per second for a Simulator
+2. bench_quiet_mode -- per game cost of debug output vs the silent default
+3. fleet_for_density -- ship sizes covering a fraction of the board
+4. time_call -- best per call time of a function
+5. run_suite -- time the hot paths across grid sizes and fleet densities
+6. host_info -- the machine and python a suite ran on
+7. compare_to_baseline -- find timings that regressed against a baseline
+8. bench_memory -- bytes held per game while many games are in memory
+9. bench_simulator -- games per minute the default Simulator plays
+
+Run from this directory e.g.
+
+python benchmark.py                         run the suite and print JSON
+python benchmark.py --output results.json   save the results
+python benchmark.py --baseline benchmark_baseline.json
+                                            fail if a timing regressed
+                                            or the baseline is from
+                                            another host
+python benchmark.py --baseline benchmark_baseline.json --allow-host-mismatch
+                                            skip the comparison instead
+python benchmark.py --quiet-mode            debug output vs silent games
+python benchmark.py --memory                bytes per game in memory
+python benchmark.py --simulator             games per minute, fail if
+                                            below SIMULATOR_TARGET
+
+Suite results are keyed 'operation/grid=<n>/density=<d>' and hold the
+best mean seconds per call.  Boards, fleets and targets are drawn from
+fixed seeds so every run times the same work.  Full games fire at most
+every cell of both boards, so they are only timed on grids of up to
+FULL_GAME_MAX_GRID.
+
+Timings are absolute, so a baseline only means something on the host
+that recorded it.  run_suite() stores host_info() in its 'meta' and a
+baseline from another host is not compared against: only the
+COMPARABLE_HOST_KEYS of host_info() (machine, CPU count and python) have
+to match, so the machine's name may differ.  Without a comparable
+baseline main() fails unless --allow-host-mismatch is given.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from random import Random
+
+import classic_battleship
+from classic_battleship import Game, GameBoard, RandomDeployEngine
+from simulation import Simulator
+
+GRID_SIZES = (10, 50, 200, 1000)
+DENSITIES = (0.05, 0.2)
+CLASSIC_FLEET = (5, 4, 3, 3, 2)
+FULL_GAME_MAX_GRID = 50
+
+#bench_memory holds about this many cells of boards per grid size
+MEMORY_CELLS = 2000000
+
+#a timing this much slower than the baseline is a regression
+DEFAULT_TOLERANCE = 0.25
+
+#host_info() entries that must match for timings to be compared
+COMPARABLE_HOST_KEYS = ('machine', 'cpus', 'python')
+
+#classic games per minute the default Simulator must sustain on one core
+SIMULATOR_TARGET = 100000
+
+
+def time_games(simulator, n_games):
+   '''
+   Returns the mean wall clock seconds per game for a Simulator
+
+   Keyword arguments:
+   simulator -- a Simulator
+   n_games -- number of games to time
+   '''
+   start = time.perf_counter()
+   simulator.run(n_games)
+   return (time.perf_counter() - start) / n_games
+
+
+def bench_quiet_mode(n_games=500, seed=42, stream=None):
+   '''
+   Compare the time per game with debug events written to a stream (the
+   equivalent of the old print calls) against the silent default.
+
+   Returns a dict of seconds per game for 'debug' and 'silent' and the
+   'speedup' of silent over debug.
+
+   Keyword arguments:
+   n_games -- number of games to time in each mode (default = 500)
+   seed -- Simulator seed so both modes play identical games (default = 42)
+   stream -- file like object for debug output (default = None i.e. os.devnull)
+   '''
+   devnull = None
+   if stream is None:
+      devnull = stream = open(os.devnull, 'w')
+
+   handler = logging.StreamHandler(stream)
+   handler.setFormatter(logging.Formatter('%(message)s'))
+
+   try:
+      classic_battleship.set_debug(True, handler)
+      debug = time_games(Simulator(seed=seed), n_games)
+   finally:
+      classic_battleship.set_debug(False)
+      classic_battleship.logger.removeHandler(handler)
+      if devnull is not None:
+         devnull.close()
+
+   silent = time_games(Simulator(seed=seed), n_games)
+
+   return {'debug': debug, 'silent': silent, 'speedup': debug / silent}
+
+
+def fleet_for_density(grid_size, density):
+   '''
+   Returns a list of ship sizes, cycling through the classic fleet, that
+   covers at least density of the cells on a grid_size X grid_size board
+
+   Keyword arguments:
+   grid_size -- size of the n X n board
+   density -- fraction of the cells to cover with ships
+   '''
+   sizes = []
+   covered = 0
+   while covered < density * grid_size * grid_size:
+      size = CLASSIC_FLEET[len(sizes) % len(CLASSIC_FLEET)]
+      sizes.append(size)
+      covered += size
+
+   return sizes
+
+
+def time_call(func, args_list, repeat=3, min_time=0.2):
+   '''
+   Returns the best, over repeat runs, of the mean seconds per call of
+   func(*args) for args in args_list.  Each run loops over args_list
+   enough times to take at least min_time.
+
+   Keyword arguments:
+   func -- function to time
+   args_list -- list of argument tuples, one per call
+   repeat -- number of runs (default = 3)
+   min_time -- minimum seconds per run (default = 0.2)
+   '''
+   def run():
+      for args in args_list:
+         func(*args)
+
+   timer = timeit.Timer(run)
+   number, elapsed = timer.autorange()
+   while elapsed < min_time:
+      number *= 2
+      elapsed = timer.timeit(number)
+
+   best = min([elapsed] + timer.repeat(repeat - 1, number))
+   return best / (number * len(args_list))
+
+
+def _bench_board(grid_size, density, seed):
+   '''
+   Returns the seeded timings of one grid size and fleet density
+   '''
+   sizes = fleet_for_density(grid_size, density)
+   engine = RandomDeployEngine(sizes, grid_size, seed)
+   board = GameBoard(grid_size, engine)
+   board.deploy_battleships()
+
+   rng = Random(seed)
+   occupied = {tuple(c) for ship in board.battleships for c in ship.coordinates}
+   cells = [[rng.randrange(grid_size), rng.randrange(grid_size)] for _ in range(256)]
+   #misses scan every ship and leave the board unchanged
+   misses = [[c] for c in cells if tuple(c) not in occupied][:64]
+
+   #a horizontal ship of 5 tested against a deployed ship as during deployment
+   candidates = []
+   for row, col in cells[:64]:
+      col = min(col, grid_size - 5)
+      candidates.append((board.battleships[0], [[row, c] for c in range(col, col + 5)]))
+
+   return {'deploy': time_call(engine.deploy, [()], min_time=0.05),
+           'missile_on_target': time_call(board.missile_on_target, misses),
+           'previously_targetted': time_call(board.previously_targetted,
+                                             [[c] for c in cells]),
+           'coordinates_overlap': time_call(lambda ship, coordinates:
+                                            ship.coordinates_overlap(coordinates),
+                                            candidates),
+           'unhide_ships': time_call(board.unhide_ships, [()], min_time=0.05),
+           'clone': time_call(board.clone, [()]),
+           'apply_undo_shot': time_call(lambda coordinate: (board.apply_shot(coordinate),
+                                                           board.undo_shot()),
+                                        [[c] for c in cells])}
+
+
+def run_suite(grid_sizes=GRID_SIZES, densities=DENSITIES, n_games=50, seed=42):
+   '''
+   Time the hot paths on every grid size and fleet density.
+
+   Returns a dict with 'meta' (python version, platform, host_info(),
+   parameters) and 'results' of 'operation/grid=<n>/density=<d>': seconds
+   per call.  Full games are timed as 'full_game/grid=<n>/density=classic' with the
+   classic fleet on grids up to FULL_GAME_MAX_GRID.
+
+   Keyword arguments:
+   grid_sizes -- board sizes to time (default = GRID_SIZES)
+   densities -- fractions of the board covered by ships (default = DENSITIES)
+   n_games -- full games to time per grid size (default = 50)
+   seed -- seed for boards, fleets and targets (default = 42)
+   '''
+   results = {}
+
+   for grid_size in grid_sizes:
+      for density in densities:
+         timings = _bench_board(grid_size, density, seed)
+         for operation, seconds in timings.items():
+            results[f'{operation}/grid={grid_size}/density={density}'] = seconds
+
+      if grid_size <= FULL_GAME_MAX_GRID:
+         simulator = Simulator(grid_size=grid_size, ship_sizes=CLASSIC_FLEET,
+                               seed=seed)
+         key = f'full_game/grid={grid_size}/density=classic'
+         results[key] = time_games(simulator, n_games)
+
+   meta = {'python': platform.python_version(),
+           'platform': platform.platform(),
+           'host': host_info(),
+           'grid_sizes': list(grid_sizes),
+           'densities': list(densities),
+           'n_games': n_games,
+           'seed': seed}
+
+   return {'meta': meta, 'results': results}
+
+
+def host_info():
+   '''
+   Returns a dict describing the machine and python timings are taken on
+   '''
+   return {'node': platform.node(),
+           'machine': platform.machine(),
+           'processor': platform.processor(),
+           'cpus': os.cpu_count(),
+           'python': platform.python_implementation() + ' ' + platform.python_version()}
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+   '''
+   Returns a list of (name, baseline seconds, seconds, ratio) for every
+   timing more than tolerance slower than the baseline, or None if the
+   baseline was recorded on another host (its COMPARABLE_HOST_KEYS differ,
+   or it has no host, from an older run_suite()) so its timings cannot be
+   compared.  Timings missing from either side are ignored.
+
+   Keyword arguments:
+   results -- dict returned by run_suite()
+   baseline -- dict returned by an earlier run_suite()
+   tolerance -- allowed fractional slowdown (default = DEFAULT_TOLERANCE)
+   '''
+   if not _comparable(baseline['meta'].get('host'), results['meta'].get('host')):
+      return None
+
+   regressions = []
+   for name, seconds in results['results'].items():
+      before = baseline['results'].get(name)
+      if before and seconds > before * (1 + tolerance):
+         regressions.append((name, before, seconds, seconds / before))
+
+   return regressions
+
+
+def _comparable(host, other):
+   '''
+   Returns True if timings taken on hosts (dicts from host_info()) can be
+   compared
+   '''
+   if not host or not other:
+      return False
+   return all(host.get(key) == other.get(key) for key in COMPARABLE_HOST_KEYS)
+
+
+def bench_memory(n_games=10000, grid_size=10, ship_sizes=CLASSIC_FLEET, seed=42):
+   '''
+   Measure the memory held by n_games live Games, each a player and an
+   enemy GameBoard with a deployed fleet, with tracemalloc.  The deploy
+   engine is shared by every board, as on a server, so it is not counted.
+
+   Returns a dict of 'bytes_per_game', 'bytes_per_board' (a board and its
+   fleet) and 'bytes_per_ship'.
+
+   Keyword arguments:
+   n_games -- number of games to hold in memory (default = 10000)
+   grid_size -- size of the n X n boards (default = 10)
+   ship_sizes -- fleet deployed on each board (default = CLASSIC_FLEET)
+   seed -- seed for the deploy engine (default = 42)
+   '''
+   engine = RandomDeployEngine(list(ship_sizes), grid_size, rng=Random(seed))
+   engine.deploy()
+
+   tracemalloc.start()
+   try:
+      start = tracemalloc.get_traced_memory()[0]
+      fleets = [engine.deploy() for _ in range(n_games)]
+      ship_bytes = tracemalloc.get_traced_memory()[0] - start
+
+      start = tracemalloc.get_traced_memory()[0]
+      games = []
+      for _ in range(n_games):
+         player = GameBoard(grid_size, engine, 'PLAYER')
+         enemy = GameBoard(grid_size, engine, 'ENEMY')
+         player.deploy_battleships()
+         enemy.deploy_battleships()
+         games.append(Game(player, enemy))
+      game_bytes = tracemalloc.get_traced_memory()[0] - start
+   finally:
+      tracemalloc.stop()
+
+   return {'bytes_per_game': game_bytes / n_games,
+           'bytes_per_board': game_bytes / n_games / 2,
+           'bytes_per_ship': ship_bytes / (n_games * len(ship_sizes))}
+
+
+def bench_simulator(n_games=20000, repeat=3, seed=42):
+   '''
+   Returns the best games per minute over repeat runs of n_games classic
+   games between the Simulator's default controllers, on a single core
+
+   Keyword arguments:
+   n_games -- games per run (default = 20000)
+   repeat -- number of runs (default = 3)
+   seed -- Simulator seed so every run plays the same games (default = 42)
+   '''
+   best = min(time_games(Simulator(seed=seed), n_games) for _ in range(repeat))
+   return 60 / best
+
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description='Battleship benchmarks')
+   parser.add_argument('--grid-sizes', type=int, nargs='+', default=GRID_SIZES)
+   parser.add_argument('--densities', type=float, nargs='+', default=DENSITIES)
+   parser.add_argument('--games', type=int, default=50,
+                       help='full games timed per grid size')
+   parser.add_argument('--seed', type=int, default=42)
+   parser.add_argument('--output', help='write the results as JSON to this file')
+   parser.add_argument('--baseline', help='JSON results to compare against')
+   parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+   parser.add_argument('--allow-host-mismatch', action='store_true',
+                       help='skip the comparison rather than fail when the '
+                            'baseline is from another host')
+   parser.add_argument('--quiet-mode', action='store_true',
+                       help='only compare debug output with silent games')
+   parser.add_argument('--memory', action='store_true',
+                       help='only measure the bytes held per game')
+   parser.add_argument('--simulator', action='store_true',
+                       help='only measure the games per minute of the Simulator')
+   args = parser.parse_args(argv)
+
+   if args.quiet_mode:
+      results = bench_quiet_mode()
+      print(f"debug events:  {results['debug'] * 1e3:.3f} ms per game")
+      print(f"silent:        {results['silent'] * 1e3:.3f} ms per game")
+      print(f"speedup:       {results['speedup']:.1f}x")
+      return 0
+
+   if args.memory:
+      for grid_size in args.grid_sizes:
+         n_games = max(10, MEMORY_CELLS // (2 * grid_size * grid_size))
+         results = bench_memory(n_games, grid_size, seed=args.seed)
+         print(f"grid={grid_size}: {results['bytes_per_game']:,.0f} bytes per game, "
+               f"{results['bytes_per_board']:,.0f} per board, "
+               f"{results['bytes_per_ship']:,.0f} per ship")
+      return 0
+
+   if args.simulator:
+      rate = bench_simulator(seed=args.seed)
+      print(f'simulator: {rate:,.0f} games per minute '
+            f'(target {SIMULATOR_TARGET:,})')
+      return 0 if rate >= SIMULATOR_TARGET else 1
+
+   results = run_suite(args.grid_sizes, args.densities, args.games, args.seed)
+
+   if args.output:
+      with open(args.output, 'w') as f:
+         json.dump(results, f, indent=2)
+   else:
+      print(json.dumps(results, indent=2))
+
+   if args.baseline:
+      with open(args.baseline) as f:
+         baseline = json.load(f)
+
+      regressions = compare_to_baseline(results, baseline, args.tolerance)
+      if regressions is None:
+         print(f'{args.baseline} was recorded on another host '
+               f"({baseline['meta'].get('host')}), not comparing", file=sys.stderr)
+         if args.allow_host_mismatch:
+            return 0
+         print('pass --allow-host-mismatch to skip the comparison', file=sys.stderr)
+         return 1
+      for name, before, seconds, ratio in regressions:
+         print(f'REGRESSION {name}: {before * 1e6:.2f} -> {seconds * 1e6:.2f} us '
+               f'({ratio:.2f}x)', file=sys.stderr)
+      if regressions:
+         return 1
+
+   return 0
+
+
+if __name__ == "__main__":
+
+   sys.exit(main())
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Compact NumPy backed game board
+
+Classes:
+
+1. BitboardGameBoard -- drop in replacement for GameBoard that stores the
+   ocean as NumPy planes instead of a list of lists of strings
+
+The board is held as two grid_size X grid_size planes
+
+state   -- uint8 code for each sector: unknown, missed or hit
+ship_id -- the (1 based) index of the ship occupying each sector, 0 = sea
+
+plus a count of the unhit cells of each ship and the Battleships
+themselves.  Shot resolution and sink detection are O(1) and a 1000 X
+1000 board needs a few MB rather than a million str references.
+
+battleships, clone(), snapshot(), restore(), apply_shot() and
+undo_shot() behave as on GameBoard, so record.RecordWriter,
+solver.Position.from_board and search AIs take either board.
+replay.GameReplay always rebuilds GameBoards.
+
+"""
+
+import numpy as np
+
+from classic_battleship import UNKNOWN, MISSED, HIT, Battleship, GameBoard
+
+#codes used in the state plane
+STATE_UNKNOWN = 0
+STATE_MISSED = 1
+STATE_HIT = 2
+
+
+class BitboardGameBoard(object):
+   """
+   Encapsulates a game board backed by NumPy arrays.
+
+   Exposes the same public methods as GameBoard so it can be used by
+   Game.take_turn unchanged.
+   """
+
+   def __init__(self, grid_size, deploy_engine, name='PLAYER'):
+
+      self.grid_size = grid_size
+      self.deploy_engine = deploy_engine
+      self.name = name
+      self._observers = []
+      self._unhidden = False
+
+      self.state = np.zeros((grid_size, grid_size), dtype=np.uint8)
+      self.ship_id = np.zeros((grid_size, grid_size), dtype=np.uint8)
+      self._cells_remaining = [0]
+      self._ship_lengths = [0]
+      self._afloat = 0
+      self.last_sunk_size = None
+
+      #Battleship with each ship_id, _ships[0] is the sea
+      self._ships = [None]
+
+      #shots played by apply_shot() that undo_shot() can take back
+      self._undo = None
+
+   def register_observer(self, observer):
+      self._observers.append(observer)
+
+   def notify_observers(self, *args, **kwargs):
+      for observer in self._observers:
+         observer.notify(self, *args, **kwargs)
+
+   def deploy_battleships(self):
+      self.set_battleships(self.deploy_engine.deploy())
+
+   def set_battleships(self, battleships):
+      '''
+      Place a list of Battleships on the board
+
+      Keyword arguments:
+      battleships -- list of Battleship e.g. from a deploy engine
+      '''
+      dtype = np.min_scalar_type(len(battleships))
+      self.ship_id = np.zeros((self.grid_size, self.grid_size), dtype=dtype)
+      self._cells_remaining = [0]
+      self._ship_lengths = [0]
+      self._ships = [None]
+      self._undo = None
+
+      #ships may have been hit already, see restore()
+      for index, ship in enumerate(battleships, start=1):
+         coordinates = ship.coordinates
+         if coordinates:
+            rows, cols = zip(*coordinates)
+            self.ship_id[rows, cols] = index
+         self._cells_remaining.append(len(coordinates))
+         self._ship_lengths.append(ship.length)
+         self._ships.append(ship)
+
+      self._afloat = sum(1 for remaining in self._cells_remaining if remaining)
+
+   @property
+   def battleships(self):
+      '''
+      The Battleships still afloat, in deployment order as on GameBoard
+      '''
+      return [ship for index, ship in enumerate(self._ships)
+              if index and self._cells_remaining[index]]
+
+   def battleships_remaining(self):
+      return self._afloat
+
+   #same instrumentation surface as GameBoard
+   _TIMED_METHODS = GameBoard._TIMED_METHODS
+   enable_timing = GameBoard.enable_timing
+   disable_timing = GameBoard.disable_timing
+
+   def unhide_ships(self):
+      self._unhidden = True
+
+   @property
+   def board(self):
+      '''
+      The board as a list of lists of str (for display only)
+      '''
+      board = np.full((self.grid_size, self.grid_size), UNKNOWN, dtype=object)
+      if self._unhidden:
+         ships = self.ship_id > 0
+         board[ships] = self.ship_id[ships].astype(str)
+      board[self.state == STATE_MISSED] = MISSED
+      board[self.state == STATE_HIT] = HIT
+      return board.tolist()
+
+   @property
+   def occupancy(self):
+      '''
+      Bool plane of sectors containing an unhit ship cell
+      '''
+      return self.ship_id > 0
+
+   @property
+   def hits(self):
+      '''
+      Bool plane of sectors recorded as a hit
+      '''
+      return self.state == STATE_HIT
+
+   @property
+   def misses(self):
+      '''
+      Bool plane of sectors recorded as a miss
+      '''
+      return self.state == STATE_MISSED
+
+   def missile_on_target(self, coordinate):
+      '''
+      Returns (hit, sunk).  A hit ship cell is removed from the ship_id
+      plane so a second missile on the same sector does not hit.
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      row, col = coordinate[0], coordinate[1]
+
+      if row < 0 or row >= self.grid_size or col < 0 or col >= self.grid_size:
+         return False, False
+
+      index = self.ship_id.item(row, col)
+
+      if index == 0:
+         return False, False
+
+      self.ship_id[row, col] = 0
+      self._cells_remaining[index] -= 1
+      ship = self._ships[index]
+      ship.hits |= 1 << ship._offset(row, col)
+
+      if self._cells_remaining[index] == 0:
+         self._afloat -= 1
+         self.last_sunk_size = self._ship_lengths[index]
+         return True, True
+
+      return True, False
+
+   def record_hit(self, coordinate):
+      '''
+      Update board with hit
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      self.state[coordinate[0], coordinate[1]] = STATE_HIT
+
+   def record_miss(self, coordinate):
+      '''
+      Update board with a miss
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      self.state[coordinate[0], coordinate[1]] = STATE_MISSED
+
+   def missile_out_of_bounds(self, coordinate):
+      '''
+      Returns boolean indicating if target is outside of the game play zone
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      return (coordinate[0] < 0 or coordinate[0] >= self.grid_size) or (coordinate[1] < 0 or coordinate[1] >= self.grid_size)
+
+   def previously_targetted(self, coordinate):
+      '''
+      Returns boolean indicating if target has been hit by a missile previously
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      return self.state.item(coordinate[0], coordinate[1]) != STATE_UNKNOWN
+
+   def clone(self):
+      '''
+      Returns a new board in the same state as this one that shares no
+      mutable state with it (observers, timing and the undo stack are not
+      copied)
+      '''
+      board = object.__new__(type(self))
+      board.grid_size = self.grid_size
+      board.deploy_engine = self.deploy_engine
+      board.name = self.name
+      board._observers = []
+      board._unhidden = self._unhidden
+      board.state = self.state.copy()
+      board.ship_id = self.ship_id.copy()
+      board._cells_remaining = self._cells_remaining[:]
+      board._ship_lengths = self._ship_lengths[:]
+      board._ships = [None] + [ship.copy() for ship in self._ships[1:]]
+      board._afloat = self._afloat
+      board.last_sunk_size = self.last_sunk_size
+      board._undo = None
+      return board
+
+   def snapshot(self):
+      '''
+      Returns an immutable copy of the state of the board that restore()
+      can rebuild: (state bytes, ship states, last_sunk_size)
+      '''
+      return (self.state.tobytes(),
+              tuple(ship.state() for ship in self._ships[1:]),
+              self.last_sunk_size)
+
+   def restore(self, snapshot):
+      '''
+      Put the board back in the state captured by snapshot().  Clears the
+      undo stack.
+
+      Keyword arguments:
+      snapshot -- tuple returned by snapshot() on a board of the same size
+      '''
+      state, ships, last_sunk_size = snapshot
+      self.set_battleships([Battleship.from_state(ship) for ship in ships])
+      self.state = np.frombuffer(state, dtype=np.uint8).reshape(self.state.shape).copy()
+      self.last_sunk_size = last_sunk_size
+
+   def apply_shot(self, coordinate):
+      '''
+      Fire a missile at coordinate, update the board and push the change
+      onto the undo stack so that undo_shot() can take it back.  No events
+      are published.
+
+      Returns 'hit', 'sunk', 'out_bounds', 'gone' or 'miss'.  After 'sunk'
+      last_sunk_size is the length of the ship sunk.
+
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      undo = self._undo
+      if undo is None:
+         undo = self._undo = []
+
+      if self.missile_out_of_bounds(coordinate):
+         undo.append(None)
+         return 'out_bounds'
+
+      if self.previously_targetted(coordinate):
+         undo.append(None)
+         return 'gone'
+
+      row, col = coordinate[0], coordinate[1]
+      index = self.ship_id.item(row, col)
+      undo.append((row, col, index, self.last_sunk_size))
+
+      hit, sunk = self.missile_on_target(coordinate)
+      if hit:
+         self.state[row, col] = STATE_HIT
+         return 'sunk' if sunk else 'hit'
+
+      self.state[row, col] = STATE_MISSED
+      return 'miss'
+
+   def undo_shot(self):
+      '''
+      Take back the last shot played by apply_shot()
+      '''
+      change = self._undo.pop()
+      if change is None:
+         return
+
+      row, col, index, self.last_sunk_size = change
+      self.state[row, col] = STATE_UNKNOWN
+
+      if index:
+         self.ship_id[row, col] = index
+         if not self._cells_remaining[index]:
+            self._afloat += 1
+         self._cells_remaining[index] += 1
+         ship = self._ships[index]
+         ship.hits &= ~(1 << ship._offset(row, col))
@@ -18,6 +18,10 @@ Beginnings of two player game... still WIP
 
 Displays enemy and player board
 
+Debug events (ship deployment, shots, hits) are sent to the 'battleship'
+logger once set_debug() has been called.  By default the game is silent and
+the only cost on the hot path is a check of the module level _debug flag.
+
 """
 
 
@@ -25,28 +29,142 @@ UNKNOWN = '.'
 MISSED = 'X'
 HIT = '*'
 
-from random import randint
-from copy import deepcopy
+#GameBoard.cells holds the ASCII code of each symbol
+_UNKNOWN_CODE = ord(UNKNOWN)
+_MISSED_CODE = ord(MISSED)
+_HIT_CODE = ord(HIT)
+
+#undo record of a shot that did not change the board
+_NO_CHANGE = (-1, None, 0, -1, None)
+
+import logging
+from random import random
+from time import perf_counter
 from colorama import Fore, Style
 import colorama
 
+from events import (AlreadyTargeted, BoardsUpdated, Event, EventDispatcher, 
+                    GameOver, Hit, Miss, OutOfBounds, Sunk)
+from instrumentation import PhaseTimings, time_methods, untime_methods
+from placements import PlacementPool, placement_index
+from seeding import make_generator, make_rng
+
+
+logger = logging.getLogger('battleship')
+
+#debug events are only built when True. See set_debug()
+_debug = False
+
+
+def set_debug(enabled=True, handler=None):
+   '''
+   Turn debug events on or off.  Each event is logged at DEBUG level to the
+   'battleship' logger with its fields in the record's extra 'event' and 
+   'data' attributes so handlers can consume them as structured data.
+   
+   Keyword arguments:
+   enabled -- True to emit debug events (default = True)
+   handler -- optional logging.Handler to attach to the 'battleship' logger
+   '''
+   global _debug
+   _debug = enabled
+   
+   if handler is not None:
+      logger.addHandler(handler)
+   
+   logger.setLevel(logging.DEBUG if enabled else logging.NOTSET)
+
+
+def debug_enabled():
+   '''
+   Returns True if set_debug() has turned debug events on
+   '''
+   return _debug
+
+
+def _log_event(event, msg, *args, **data):
+   logger.debug(msg, *args, extra={'event': event, 'data': data})
+
 
 class Game(object):
    """
    A game 'has-a' player GameBoard and a enemy GameBoard
+   
+   Publishes typed events (see events.py).  Observers subscribe to the
+   event types they care about; an event is only built if its type has a
+   subscriber.
    """
+   __slots__ = ('player_board', 'enemy_board', 'buffer_events', 'events', 
+                'timings', '_timings')
    
-   def __init__(self, player_board, enemy_board):
+   def __init__(self, player_board, enemy_board, buffer_events=None):
+      """
+      Keyword arguments:
+      player_board -- the player's GameBoard
+      enemy_board -- the enemy's GameBoard
+      buffer_events -- None to deliver events as they happen, 'turn' to 
+      deliver them in a batch at the end of each turn or 'game' to deliver
+      them at the end of play() or flush_events() (default = None)
+      """
       self.player_board = player_board
       self.enemy_board = enemy_board
-      self._observers = []
+      self.buffer_events = buffer_events
+      self.events = EventDispatcher(buffered=buffer_events is not None)
+      self.timings = None
+
+   def subscribe(self, event_type, handler):
+      """
+      Call handler(event) for each event of event_type (Event = all)
+      """
+      self.events.subscribe(event_type, handler)
+   
+   def subscribe_batch(self, handler, event_types=(Event,)):
+      """
+      Call handler(events) with the list of events of event_types at the
+      end of each turn, or when flushed if buffer_events is 'game'.  Other
+      subscribers are not held back.
+      """
+      self.events.subscribe_batch(handler, event_types)
+   
+   def flush_events(self):
+      """
+      Deliver any buffered events
+      """
+      self.events.flush()
 
    def register_observer(self, to_register):
-      self._observers.append(to_register)
+      """
+      Register an observer with a notify(observable, event) method for 
+      every event type
+      """
+      self.events.subscribe(Event, lambda event: to_register.notify(self, event))
       
-   def notify_observers(self, *args, **kwargs):
-      for observer in self._observers:
-         observer.notify(self, *args, *kwargs)
+   def notify_observers(self, event):
+      self.events.publish(event)
+   
+   _TIMED_METHODS = {'_broadcast': 'dispatch'}
+   
+   def enable_timing(self, timings=None):
+      """
+      Count and time each phase of a turn (see instrumentation.py) for
+      this game and both of its boards.  Returns the PhaseTimings.
+      
+      Keyword arguments:
+      timings -- PhaseTimings to add to (default = None i.e. a new one)
+      """
+      self.disable_timing()
+      self.timings = PhaseTimings() if timings is None else timings
+      time_methods(self, self.timings, self._TIMED_METHODS)
+      self.player_board.enable_timing(self.timings)
+      self.enemy_board.enable_timing(self.timings)
+      return self.timings
+   
+   def disable_timing(self):
+      if self.timings is not None:
+         untime_methods(self, self._TIMED_METHODS)
+         self.player_board.disable_timing()
+         self.enemy_board.disable_timing()
+         self.timings = None
       
    def setup_board(self):
       self.enemy_board.deploy_battleships()
@@ -67,7 +185,7 @@ class Game(object):
    '''
          
 
-   def play(self):
+   def play(self, player_target_controller=None, enemy_target_controller=None):
       """
       Main game loop
       
@@ -76,75 +194,132 @@ class Game(object):
       
       The game then terminates.
       
+      Keyword arguments:
+      player_target_controller -- selects the player's targets on the enemy 
+      board (default = UserTargetController)
+      enemy_target_controller -- selects the enemy's targets on the player 
+      board (default = RandomTargetController)
       """
       
-      player_target_controller = UserTargetController()
-      #player_target_controller = RandomTargetController(self.enemy_board.grid_size)
-      enemy_target_controller = RandomTargetController(self.enemy_board.grid_size)
+      if player_target_controller is None:
+         player_target_controller = UserTargetController()
+      
+      if enemy_target_controller is None:
+         enemy_target_controller = RandomTargetController(self.player_board.grid_size)
       
-      while self.enemy_board.battleships_remaining() > 0 and self.player_board.battleships_remaining() > 0:
+      while True:
             
-         self.take_turn(enemy_board, player_target_controller)  # players turn
-         self.take_turn(player_board, enemy_target_controller) # enemys turn
-         self._broadcast("display_board", player_board, enemy_board)
+         self.take_turn(self.enemy_board, player_target_controller)  # players turn
+         
+         if self.enemy_board.battleships_remaining() == 0:
+            break
+         
+         self.take_turn(self.player_board, enemy_target_controller) # enemys turn
+         self._broadcast(BoardsUpdated, self.player_board, self.enemy_board)
+         
+         if self.player_board.battleships_remaining() == 0:
+            break
       
       self._display_winner()
+      self.flush_events()
          
    
    def take_turn(self, board, target_controller): 
       '''
       Battleship game loop.
       
+      Returns the outcome of the shot: 'hit', 'sunk', 'out_bounds', 'gone'
+      or 'miss'.
+      
       Keyword arguments:
    
       board -- a GameBoard encapsulating one of the boards in play.
+      target_controller -- selects the coordinate to target on board and is
+      told the outcome via record_result()
       '''
    
-      #could be missiles per turn... instead.
-      #the there is an outer loop that switches between the two players
-      #basically all of the code below becomes take_turn
-      #board becomes a class
-      #board.
-
-      #This is the bit that varies between player and enemy
-      # parameter or encapsulate whole function?
-      #coordinate = read_coordinate('Row, Col to target')
-      #coordinate = random_shot(board.grid_size)
-      coordinate = target_controller.select_target()
+      if self.timings is None:
+         coordinate = target_controller.select_target()
+      else:
+         start = perf_counter()
+         coordinate = target_controller.select_target()
+         self.timings.add('select_target', perf_counter() - start)
+      
+      result, sunk_size = self.resolve_shot(board, coordinate)
+      target_controller.record_result(coordinate, result, sunk_size)
       
+      self.end_turn()
+      return result
+   
+   def resolve_shot(self, board, coordinate):
+      '''
+      Fire a missile at coordinate on board, update the board and publish
+      the outcome.
+      
+      Returns a tuple of (result, sunk_size) where result is 'hit', 'sunk',
+      'out_bounds', 'gone' or 'miss' and sunk_size is the length of the 
+      ship sunk (or None).
+      
+      Keyword arguments:
+      board -- the GameBoard targeted
+      coordinate -- list with 2 items [row, col]
+      '''
       hit, sunk = board.missile_on_target(coordinate)
+      sunk_size = None
       
       if hit:
          
-         self._broadcast('hit')
+         self._broadcast(Hit, board, coordinate)
          board.record_hit(coordinate)
+         result = 'hit'
          
          if sunk:  
-            self._broadcast('sunk')
+            sunk_size = board.last_sunk_size
+            self._broadcast(Sunk, board, coordinate, sunk_size)
+            result = 'sunk'
 
       elif board.missile_out_of_bounds(coordinate):
-         self._broadcast('out_bounds')
+         self._broadcast(OutOfBounds, board, coordinate)
+         result = 'out_bounds'
          
       elif board.previously_targetted(coordinate):
-         self._broadcast('gone')
-         
+         self._broadcast(AlreadyTargeted, board, coordinate)
+         result = 'gone'
       
       else:
          
-         self._broadcast("miss")
+         self._broadcast(Miss, board, coordinate)
          board.record_miss(coordinate)
+         result = 'miss'
+      
+      if _debug:
+         _log_event('shot', '%s fired at %s: %s', board.name, coordinate, result,
+                    board=board.name, coordinate=coordinate, result=result)
+      
+      return result, sunk_size
+   
+   def end_turn(self):
+      '''
+      Deliver events buffered during the turn if buffer_events is 'turn',
+      and the batch subscribers' events unless it is 'game'
+      '''
+      if self.buffer_events == 'turn' or (self.events.batched
+                                          and self.buffer_events != 'game'):
+         self.events.flush()
 
 
    def _display_winner(self):
       if self.enemy_board.battleships_remaining() == 0:
-         self._broadcast("You sunk all my battleships!  You WIN!")
+         self._broadcast(GameOver, self.enemy_board, True)
       else:
-         self._broadcast("The enemy has sunk all of your battleships. You lose!")
+         self._broadcast(GameOver, self.player_board, False)
          
-   def _broadcast(self, *args):
-      for observer in self._observers:
-         kwargs = {}
-         observer.notify(self, *args, **kwargs)
+   def _broadcast(self, event_type, *args):
+      """
+      Build and publish an event_type event if anything subscribes to it
+      """
+      if event_type in self.events.handlers:
+         self.events.publish(event_type(*args))
          
       
      
@@ -156,50 +331,51 @@ class BattleshipTerminalView(object):
    """
    
    def __init__(self, observable):
-      observable.register_observer(self)
+      observable.subscribe(Hit, self.on_hit)
+      observable.subscribe(Sunk, self.on_sunk)
+      observable.subscribe(OutOfBounds, self.on_out_bounds)
+      observable.subscribe(AlreadyTargeted, self.on_already_targeted)
+      observable.subscribe(Miss, self.on_miss)
+      observable.subscribe(BoardsUpdated, self.on_boards_updated)
+      observable.subscribe(GameOver, self.on_game_over)
    
-   def notify(self, observerable, *args, **kwargs):
-      if len(args) > 0:
-         
-         msg = args[0].lower()
-         
-         if msg== 'hit':
-            print(f'{Style.BRIGHT}{Fore.YELLOW}Hit!{Style.RESET_ALL}')
-         elif msg == 'sunk':
-            print(f"{Style.BRIGHT}{Fore.GREEN}You sunk my Battleship!{Style.RESET_ALL}")
-         elif msg == 'out_bounds':
-            print(f"{Style.BRIGHT}{Fore.RED}Sector is out of game play bounds{Style.RESET_ALL}")
-         elif msg == "gone":
-            print("This sector of the ocean grid has already been targeted.")
-         elif msg == 'miss':
-            print("Missed")
-         elif msg == 'display_board':
-            player_board = args[1]
-            enemy_board = args[2]
-            self._show_board("ENEMY", enemy_board.board)
-            self._show_board("PLAYER", player_board.board)
-         else:
-            print(msg)
+   def on_hit(self, event):
+      print(f'{Style.BRIGHT}{Fore.YELLOW}Hit!{Style.RESET_ALL}')
+   
+   def on_sunk(self, event):
+      print(f"{Style.BRIGHT}{Fore.GREEN}You sunk my Battleship!{Style.RESET_ALL}")
+   
+   def on_out_bounds(self, event):
+      print(f"{Style.BRIGHT}{Fore.RED}Sector is out of game play bounds{Style.RESET_ALL}")
+   
+   def on_already_targeted(self, event):
+      print("This sector of the ocean grid has already been targeted.")
+   
+   def on_miss(self, event):
+      print("Missed")
+   
+   def on_boards_updated(self, event):
+      self._show_board("ENEMY", event.enemy_board.board)
+      self._show_board("PLAYER", event.player_board.board)
+   
+   def on_game_over(self, event):
+      if event.player_won:
+         print("You sunk all my battleships!  You WIN!")
+      else:
+         print("The enemy has sunk all of your battleships. You lose!")
          
 
    def _show_board(self, name, board):
       
       headers = [str(i) for i in range(len(board))] 
-      blanks = [' ' for i in range(len(board))]
       
-      to_view = deepcopy(board)
-   
-      for row in range(len(to_view)):
-         to_view[row].insert(0, headers[row]+'\t')
-      
-      headers.insert(0, name + '\t')
-      blanks.insert(0, ' \t')
-      to_view.insert(0, blanks)
-      to_view.insert(0, headers)
+      lines = [name + '\t ' + ' '.join(headers), 
+               ' \t ' + ' '.join(' ' * len(board))]
       
+      for row in range(len(board)):
+         lines.append(headers[row] + '\t ' + ' '.join(board[row]))
       
-      for row in range(len(to_view)):
-            print(' '.join(to_view[row]))  
+      print('\n'.join(lines))
 
    def display_title(self):
       print(f"\n{Style.BRIGHT}{Fore.GREEN}BATTLESHIP!{Style.RESET_ALL}")
@@ -213,16 +389,48 @@ class UserTargetController(object):
    def select_target(self):
       return read_coordinate('Row, Col to target')
    
+   def record_result(self, coordinate, result, sunk_size=None):
+      pass
+   
 
 
 
 class RandomTargetController(object):
    
-   def __init__(self, grid_size):
+   def __init__(self, grid_size, rng=None):
+      """
+      Keyword arguments:
+      grid_size -- size of the n X n board to target
+      rng -- random.Random (or any seed accepted by seeding.make_rng) used to
+      select targets (default = None i.e. the global random module)
+      """
       self.grid_size = grid_size
+      self.rng = None if rng is None else make_rng(rng)
+   
+   @classmethod
+   def from_board(cls, board, rng=None):
+      """
+      Create a controller that targets board
+      
+      Keyword arguments:
+      board -- the GameBoard to be targeted
+      rng -- random.Random (or seed) used to select targets
+      """
+      return cls(board.grid_size, rng)
    
    def select_target(self):
-      return random_shot(self.grid_size)
+      return random_shot(self.grid_size, self.rng)
+   
+   def record_result(self, coordinate, result, sunk_size=None):
+      """
+      Outcome of the last target selected.  Random targeting ignores it.
+      
+      Keyword arguments:
+      coordinate -- the [row, col] targeted
+      result -- 'hit', 'sunk', 'out_bounds', 'gone' or 'miss'
+      sunk_size -- length of the ship sunk if result is 'sunk'
+      """
+      pass
 
 
 class RandomDeployEngine(object):
@@ -230,12 +438,35 @@ class RandomDeployEngine(object):
    Encapsulates logic to deploy ships randomly on a
    n X n board.
    
+   Each ship is placed uniformly at random among the placements that are 
+   still legal.  The placements for each ship size are held in a 
+   PlacementPool; a placement drawn from the pool that overlaps a deployed 
+   ship is removed so it is never drawn again.  If a ship has no legal 
+   placement left the engine backtracks rather than retrying forever.
+   
    Key method is deploy()
    """
    
-   def __init__(self, ship_sizes, grid_sizes):
+   def __init__(self, ship_sizes, grid_sizes, rng=None, max_backtracks=10000):
+      """
+      Keyword arguments:
+      ship_sizes -- list of the lengths of ships to deploy
+      grid_sizes -- size of the n X n board
+      rng -- random.Random (or any seed accepted by seeding.make_rng) used 
+      for deployment (default = None i.e. seeded from the operating system)
+      max_backtracks -- deploy() gives up with a ValueError after this many
+      backtracks (default = 10000)
+      """
       self.ship_sizes = ship_sizes
       self.grid_size = grid_sizes
+      self.rng = make_rng(rng)
+      self.max_backtracks = max_backtracks
+      
+      #number of backtracks made by the last call to deploy()
+      self.backtracks = 0
+      
+      self._indexes = {size: self._placement_index(size) 
+                       for size in set(ship_sizes)}
 
    def deploy(self):
       """
@@ -244,74 +475,128 @@ class RandomDeployEngine(object):
       
       Randomly distribute ships on a board of grid_size X grid_size
       
-      Trys until there is no overlap between ships
+      Largest ships are placed first.  Every placement is drawn or 
+      discarded at most once per backtrack so the time taken is bounded.
+      Raises ValueError if the fleet cannot be deployed.
 
       """
-      battleships = []
+      sizes, chosen = self.deploy_placements()
+      
+      return [Battleship(self._indexes[size].start(placement), 
+                         self._indexes[size].end(placement))
+              for size, placement in zip(sizes, chosen)]
+   
+   def deploy_placements(self, rng=None):
+      """
+      Returns a tuple of (ship sizes, placement ids).  The sizes are sorted
+      largest first and each placement id refers to the PlacementIndex of 
+      that size.
+      
+      Used by deploy() to randomly distribute ships on the board.
+      
+      Keyword arguments:
+      rng -- random.Random to draw from (default = None i.e. this 
+      engine's rng)
+      """
+      sizes = sorted(self.ship_sizes, reverse=True)
+      indexes = self._indexes
+      pools = {size: PlacementPool(index) for size, index in indexes.items()}
+      rng = self.rng if rng is None else rng
+      
+      occupied = 0
+      chosen = []
+      
+      #placements taken out of a pool at each depth. Restored on backtrack.
+      discarded = [[]]
       
-      #largest ships placed first
-      ship_sizes.sort(reverse=True)
+      self.backtracks = 0
+      depth = 0
       
-      for ship_size in self.ship_sizes:
+      while depth < len(sizes):
          
-         while True:
+         size = sizes[depth]
+         index = indexes[size]
+         pool = pools[size]
+         placement = None
          
-            start_row = self._random_location(self.grid_size, ship_size)
-            start_col = self._random_location(self.grid_size, ship_size)
-            
-            if self._random_vertical_orientation():
-               #vertical orientation
-               end_row = start_row
-               end_col = start_col + ship_size - 1
+         while len(pool) > 0:
+            candidate = pool.choice(rng)
+            if index.mask(candidate) & occupied:
+               pool.remove(candidate)
+               discarded[depth].append(candidate)
+               if _debug:
+                  _log_event('discarded', 'could not add ship of size %d at %s',
+                             size, index.start(candidate), size=size,
+                             start=index.start(candidate))
             else:
-               #vertical orientation
-               end_row = start_row + ship_size - 1
-               end_col = start_col 
+               placement = candidate
+               break
+         
+         if placement is None:
+            #dead end: undo the previous ship and rule out its placement
+            for candidate in discarded.pop():
+               pool.restore(candidate)
             
-            to_add = Battleship([start_row, start_col], [end_row, end_col])
+            if depth == 0:
+               raise ValueError(f'Cannot deploy ships {self.ship_sizes} on '
+                                f'{self._board_description()}')
             
-            if self._deploy_battleship(battleships, to_add):
-               break
+            self.backtracks += 1
+            if _debug:
+               _log_event('backtrack', 'backtracking from ship %d of %d',
+                          depth, len(sizes), depth=depth)
+            if self.backtracks > self.max_backtracks:
+               raise ValueError(f'Gave up deploying ships {self.ship_sizes} after '
+                                f'{self.max_backtracks} backtracks')
             
-      return battleships
+            depth -= 1
+            previous = chosen.pop()
+            occupied ^= indexes[sizes[depth]].mask(previous)
+            
+            if pools[sizes[depth]].remove(previous):
+               discarded[depth].append(previous)
+            continue
+         
+         occupied |= index.mask(placement)
+         chosen.append(placement)
+         discarded.append([])
+         depth += 1
+      
+      return sizes, chosen
    
-   def _random_location(self, grid_size, ship_size):
-      """1
-      Returns a uniformly distributed random number
-      between 0 and grid_size - 1 representing a deployment of a Battleship
+   def _placement_index(self, size):
       """
-      return randint(0, grid_size - 1 - ship_size) 
-
-   def _random_vertical_orientation(self):
+      Returns the PlacementIndex of the placements a ship of size may take
       """
-      Returns True = vertical orientation
-      Returns False = horizontal orientation
+      return placement_index(self.grid_size, size)
+   
+   def _board_description(self):
+      return f'a {self.grid_size} X {self.grid_size} board'
+   
+   def deploy_batch(self, n, packed=False, rng=None):
       """
-      if randint(1, 10) >= 5:
-         return True
-      else:
-         return False
-      
-      
-   def _deploy_battleship(self, battleships, to_add):
-       """
-       Attempts to add a battleship to the list of battleships
-       Reject to to_add Battleship if there is an overlap with 
-       existing battleships
-       """
-       if len(battleships) == 0:
-           battleships.append(to_add)
-           print("added")
-       else:
-           for bs in battleships:
-               if(bs.coordinates_overlap(to_add.coordinates)):
-                   print("could not add")
-                   return False
-           
-           print("added")
-           battleships.append(to_add)
-       
-       return True   
+      Returns n independently deployed fleets as a single NumPy array.
+      
+      Sampling and overlap rejection are vectorized across all of the 
+      fleets (see batch.deploy_batch).
+      
+      Keyword arguments:
+      n -- the number of fleets to deploy
+      packed -- if True return an (n, n_ships) array of placement ids 
+      (ships ordered largest first) instead of an 
+      (n, grid_size, grid_size) array of 1 based ship ids 0 = sea 
+      (default = False)
+      rng -- numpy.random.Generator (or any seed accepted by 
+      seeding.make_generator) (default = None i.e. a Generator seeded from 
+      this engine's rng)
+      """
+      #batch builds on this module (and needs numpy) so import it on first use
+      from batch import deploy_batch
+      
+      if rng is None:
+         rng = self.rng
+      
+      return deploy_batch(self, n, packed, make_generator(rng))
       
 
 class GameBoard(object):
@@ -334,31 +619,68 @@ class GameBoard(object):
    register_observer(observer)
    notify_observers(observable, *args, **kwargs)
    
+   The ocean sectors are held in cells, a bytearray of grid_size * 
+   grid_size codes (row major) for UNKNOWN, MISSED and HIT.  board builds
+   the list of lists of str for display.  A board has __slots__ so that 
+   many games can be held in memory at once.
+   
+   Search and rollout AIs can copy a board with clone(), save and rebuild
+   its state with snapshot() and restore() or play shots with apply_shot()
+   and take them back with undo_shot() without allocating new boards.
    """
+   __slots__ = ('cells', 'battleships', 'last_sunk_size', 'grid_size', 
+                'deploy_engine', 'name', '_observers', '_labels', '_timings',
+                '_undo')
+   
    def __init__(self, grid_size, deploy_engine, name='PLAYER'):
 
-      self.board = []
+      self.cells = None
       self.battleships = []
+      self.last_sunk_size = None
       self.grid_size = grid_size
       self.deploy_engine = deploy_engine
       self.name = name
-      self._observers = []
+      self._observers = None
       
-      self._init_board(self.board, self.grid_size)
+      #str label of each unhidden ship cell, see unhide_ships()
+      self._labels = None
+      self._timings = None
       
+      #shots played by apply_shot() that undo_shot() can take back
+      self._undo = None
       
-   def _init_board(self, board, grid_size):
-      """Initialises a board of ocean sectors '0' as a list of lists.
+      self._init_board(self.grid_size)
+      
+      
+   def _init_board(self, grid_size):
+      """Initialises a board of ocean sectors '.' as a bytearray.
       Size is specified by grid_size."""
       
-      for x in range(grid_size):
-         board.append([UNKNOWN] * grid_size)
+      self.cells = bytearray([_UNKNOWN_CODE]) * (grid_size * grid_size)
+   
+   @property
+   def board(self):
+      """
+      The board as a list of lists of str (for display)
+      """
+      n = self.grid_size
+      text = self.cells.decode('ascii')
+      rows = [list(text[i:i + n]) for i in range(0, n * n, n)]
+      
+      if self._labels is not None:
+         for (row, col), label in self._labels.items():
+            if rows[row][col] == UNKNOWN:
+               rows[row][col] = label
+      
+      return rows
          
    def register_observer(self, observer):
+      if self._observers is None:
+         self._observers = []
       self._observers.append(observer)
  
    def notify_observers(self, *args, **kwargs):
-      for observer in self._observers:
+      for observer in self._observers or ():
          observer.notify(self, *args, **kwargs)   
    
    def deploy_battleships(self):
@@ -367,12 +689,28 @@ class GameBoard(object):
    def battleships_remaining(self):
       return len(self.battleships)
    
+   _TIMED_METHODS = {'missile_on_target': 'hit_resolution',
+                     'record_hit': 'board_update',
+                     'record_miss': 'board_update'}
+   
+   def enable_timing(self, timings):
+      '''
+      Count and time hit resolution and board updates in timings, an
+      instrumentation.PhaseTimings
+      '''
+      self.disable_timing()
+      time_methods(self, timings, self._TIMED_METHODS)
+   
+   def disable_timing(self):
+      untime_methods(self, self._TIMED_METHODS)
+   
    def unhide_ships(self):
+      self._labels = {}
       ship_index = 0
       for ship in self.battleships:
          ship_index += 1
          for coordinate in ship.coordinates:
-            self.board[coordinate[0]][coordinate[1]] = str(ship_index)
+            self._labels[coordinate[0], coordinate[1]] = str(ship_index)
             
 
    def missile_on_target(self, coordinate):
@@ -387,6 +725,7 @@ class GameBoard(object):
             hit = True
             
             if self.battleships[i].sunk():
+               self.last_sunk_size = self.battleships[i].length
                del self.battleships[i]
                sunk= True
                
@@ -402,7 +741,7 @@ class GameBoard(object):
       Keyword arguments:
       coordinate -- list with 2 items [row, col]
       '''
-      self.board[coordinate[0]][coordinate[1]] = HIT # f'{Style.BRIGHT}{Fore.GREEN}' + HIT + f'{Style.RESET_ALL}'
+      self.cells[coordinate[0] * self.grid_size + coordinate[1]] = _HIT_CODE
       
       
    def record_miss(self, coordinate):
@@ -412,7 +751,7 @@ class GameBoard(object):
       Keyword arguments:
       coordinate -- list with 2 items [row, col]
       '''
-      self.board[coordinate[0]][coordinate[1]] = MISSED
+      self.cells[coordinate[0] * self.grid_size + coordinate[1]] = _MISSED_CODE
       
    
    def missile_out_of_bounds(self, coordinate):
@@ -432,7 +771,126 @@ class GameBoard(object):
       Keyword arguments:
       coordinate -- list with 2 items [row, col]
       '''
-      return (self.board[coordinate[0]][coordinate[1]] == MISSED or self.board[coordinate[0]][coordinate[1]] == HIT)
+      return self.cells[coordinate[0] * self.grid_size + coordinate[1]] != _UNKNOWN_CODE
+   
+   
+   def clone(self):
+      '''
+      Returns a new board in the same state as this one that shares no
+      mutable state with it (observers and the undo stack are not copied)
+      '''
+      board = object.__new__(type(self))
+      board.cells = self.cells[:]
+      board.battleships = [ship.copy() for ship in self.battleships]
+      board.last_sunk_size = self.last_sunk_size
+      board.grid_size = self.grid_size
+      board.deploy_engine = self.deploy_engine
+      board.name = self.name
+      board._observers = None
+      board._labels = self._labels
+      board._timings = self._timings
+      board._undo = None
+      return board
+   
+   
+   def snapshot(self):
+      '''
+      Returns an immutable copy of the state of the board that restore()
+      can rebuild: (cells, ship states, last_sunk_size)
+      '''
+      return (bytes(self.cells), 
+              tuple(ship.state() for ship in self.battleships),
+              self.last_sunk_size)
+   
+   
+   def restore(self, snapshot):
+      '''
+      Put the board back in the state captured by snapshot().  Clears the
+      undo stack.
+      
+      Keyword arguments:
+      snapshot -- tuple returned by snapshot() on a board of the same size
+      '''
+      cells, ships, self.last_sunk_size = snapshot
+      self.cells[:] = cells
+      self.battleships = [Battleship.from_state(state) for state in ships]
+      self._undo = None
+   
+   
+   def apply_shot(self, coordinate):
+      '''
+      Fire a missile at coordinate, update the board and push the change 
+      onto the undo stack so that undo_shot() can take it back.  No events
+      are published.
+      
+      Returns 'hit', 'sunk', 'out_bounds', 'gone' or 'miss'.  After 'sunk' 
+      last_sunk_size is the length of the ship sunk.
+      
+      Keyword arguments:
+      coordinate -- list with 2 items [row, col]
+      '''
+      undo = self._undo
+      if undo is None:
+         undo = self._undo = []
+      
+      row, col = coordinate[0], coordinate[1]
+      n = self.grid_size
+      
+      if row < 0 or row >= n or col < 0 or col >= n:
+         undo.append(_NO_CHANGE)
+         return 'out_bounds'
+      
+      index = row * n + col
+      if self.cells[index] != _UNKNOWN_CODE:
+         undo.append(_NO_CHANGE)
+         return 'gone'
+      
+      #Battleship._offset inlined: this is the hot path of a simulation
+      battleships = self.battleships
+      for ship in battleships:
+         if ship.vertical:
+            if col != ship.col:
+               continue
+            offset = row - ship.row
+         else:
+            if row != ship.row:
+               continue
+            offset = col - ship.col
+         
+         if 0 <= offset < ship.length:
+            ship.hits |= 1 << offset
+            self.cells[index] = _HIT_CODE
+            
+            if ship.sunk():
+               position = battleships.index(ship)
+               del battleships[position]
+               undo.append((index, ship, offset, position, self.last_sunk_size))
+               self.last_sunk_size = ship.length
+               return 'sunk'
+            
+            undo.append((index, ship, offset, -1, self.last_sunk_size))
+            return 'hit'
+      
+      self.cells[index] = _MISSED_CODE
+      undo.append((index, None, 0, -1, self.last_sunk_size))
+      return 'miss'
+   
+   
+   def undo_shot(self):
+      '''
+      Take back the last shot played by apply_shot()
+      '''
+      index, ship, offset, position, last_sunk_size = self._undo.pop()
+      if index < 0:
+         return
+      
+      self.cells[index] = _UNKNOWN_CODE
+      self.last_sunk_size = last_sunk_size
+      
+      if ship is not None:
+         ship.hits &= ~(1 << offset)
+         if position >= 0:
+            self.battleships.insert(position, ship)
 
 
             
@@ -444,7 +902,13 @@ class Battleship(object):
     """
     Represents a 1 x n or n X 1 battleship.
     The battleship can be targetted and destroyed.
+    
+    A ship is held as its start cell (row, col), length and orientation.
+    hits is a bitmask with bit i set once the i'th cell from the start 
+    has been hit.
     """
+    __slots__ = ('row', 'col', 'length', 'vertical', 'hits')
+    
     def __init__(self, start, end):
         """
         Constructor method
@@ -453,34 +917,97 @@ class Battleship(object):
         start -- list of length 2. row, col coordinates of start of ship
         end -- list of ength 2. row, col coordinates of end of ship
         """
-        self.coordinates = []
         self.set_coordinates(start, end)
     
     def set_coordinates(self, start, end):
         """
-        Store all coordinates that the ship occupies.  Assume width of 1.
+        Store the cells that the ship occupies.  Assume width of 1.
         
         Keyword argument:
         start -- list of length 2. row, col coordinates of start of ship
         end -- list of ength 2. row, col coordinates of end of ship
         """
-        if start[0] == end[0]:
-            self.coordinates = [[start[0], x] for x in range(start[1], end[1]+1)]
-            #to see the list of coordinates generated by the comprehension          
-            print(self.coordinates)
+        self.row = start[0]
+        self.col = start[1]
+        self.vertical = start[0] != end[0]
+        
+        if self.vertical:
+            self.length = end[0] - start[0] + 1
         else:
-            self.coordinates = [[x, start[1]] for x in range(start[0], end[0]+1)]
-            print(self.coordinates)
+            self.length = end[1] - start[1] + 1
+        
+        self.hits = 0
+        
+        if _debug:
+            _log_event('deployed', 'added ship at %s', self.coordinates, 
+                       coordinates=self.coordinates)
+    
+    def state(self):
+        """Returns the ship as a tuple (row, col, length, vertical, hits)"""
+        return (self.row, self.col, self.length, self.vertical, self.hits)
+    
+    @classmethod
+    def from_state(cls, state):
+        """
+        Returns a Battleship rebuilt from a tuple returned by state()
+        """
+        ship = cls.__new__(cls)
+        ship.row, ship.col, ship.length, ship.vertical, ship.hits = state
+        return ship
+    
+    def copy(self):
+        """Returns a new Battleship with the same cells and hits"""
+        ship = type(self).__new__(type(self))
+        ship.row = self.row
+        ship.col = self.col
+        ship.length = self.length
+        ship.vertical = self.vertical
+        ship.hits = self.hits
+        return ship
+    
+    @property
+    def start(self):
+        """[row, col] of the first cell of the ship"""
+        return [self.row, self.col]
+    
+    @property
+    def end(self):
+        """[row, col] of the last cell of the ship"""
+        if self.vertical:
+            return [self.row + self.length - 1, self.col]
+        return [self.row, self.col + self.length - 1]
+    
+    @property
+    def coordinates(self):
+        """List of [row, col] of the cells that have not been hit"""
+        row, col, hits = self.row, self.col, self.hits
+        if self.vertical:
+            return [[row + i, col] for i in range(self.length) if not hits >> i & 1]
+        return [[row, col + i] for i in range(self.length) if not hits >> i & 1]
+    
+    def _offset(self, row, col):
+        """Returns the index of cell (row, col) along the ship or -1"""
+        if self.vertical:
+            offset = row - self.row
+            if col != self.col:
+                return -1
+        else:
+            offset = col - self.col
+            if row != self.row:
+                return -1
+        
+        return offset if 0 <= offset < self.length else -1
    
     def coordinate_overlap(self, coordinate):
         """Returns True/False is coordinate list [x,y] overlaps
-        with the battleships coordinates
+        with the battleships coordinates that have not been hit
         
         Keyword arguments:
         coordinate - [row, col] list to check for overlap with ship
            
            """ 
-        return coordinate in self.coordinates             
+        offset = self._offset(coordinate[0], coordinate[1])
+        return offset >= 0 and not self.hits >> offset & 1
         
         
     def coordinates_overlap(self, coordinates):
@@ -489,7 +1016,7 @@ class Battleship(object):
         and the the coordinates of this battleship
         """
         for c in coordinates:
-            if c in self.coordinates:
+            if self.coordinate_overlap(c):
                 return True
         
         return False
@@ -499,18 +1026,21 @@ class Battleship(object):
         Is the missle on target?  Does it hit the battleship?
         Returns True or False
         """
-        if self.coordinate_overlap([target_row, target_col]):
-            
-            self.coordinates.remove([target_row, target_col])
-            #for debug - we can see that hit coordinate pair has been removed. 
-            print(self.coordinates)
-            return True
-        else:
+        offset = self._offset(target_row, target_col)
+        if offset < 0 or self.hits >> offset & 1:
             return False
+        
+        self.hits |= 1 << offset
+        if _debug:
+            _log_event('hit', 'ship hit at %s, remaining %s', 
+                       [target_row, target_col], self.coordinates,
+                       coordinate=[target_row, target_col],
+                       remaining=self.coordinates)
+        return True
 
             
     def sunk(self):
-        return len(self.coordinates) == 0 
+        return self.hits == (1 << self.length) - 1
         
     
 
@@ -519,14 +1049,36 @@ class Battleship(object):
 
          
 #functions to incorporate into gmae class later on?
-def random_shot(grid_size):
+def random_shot(grid_size, rng=None):
    """
-   Returns a uniformly distributed random number
-   between 0 and grid_size - 1 representing a deployment of a Battleship
+   Returns a uniformly distributed random [row, col] coordinate
+   between 0 and grid_size - 1
+   
+   Keyword arguments:
+   grid_size -- size of the n X n board
+   rng -- random.Random to draw from (default = None i.e. the global 
+   random module)
    """
-   return [randint(0, grid_size - 1), randint(0, grid_size - 1)]    
+   rand = random if rng is None else rng.random
+   return [int(rand() * grid_size), int(rand() * grid_size)]
       
       
+def parse_coordinate(text):
+   '''
+   Returns the coordinate [row, col] in text formatted as "1,2".
+   Raises ValueError if text is not a valid coordinate, including one
+   with more or fewer than 2 values.
+   
+   Keyword arguments:
+   text -- str to parse
+   '''
+   values = text.split(',')
+   if len(values) != 2:
+      raise ValueError(f'Invalid coordinate {text!r}')
+   
+   return [int(i) for i in values]
+
+
 def read_coordinate(prompt):
    '''
    Loops until valid input has been made to game.  
@@ -545,11 +1097,7 @@ def read_coordinate(prompt):
       x = input("{0} >>> ".format(prompt))
 
       try:
-         if len(x.split(',')) < 2:
-            raise ValueError()
-         else:
-            
-            coordinate = [int(i) for i in x.split(",")]
+         coordinate = parse_coordinate(x)
       except ValueError:
             
             print("Invalid input please input {0}".format(prompt))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Typed game events and a dispatch table to deliver them
+
+Classes:
+
+1. Event -- base class of every game event
+2. Hit, Sunk, Miss, OutOfBounds, AlreadyTargeted -- outcome of a shot
+3. BoardsUpdated -- both boards should be redrawn
+4. GameOver -- one fleet has been sunk
+5. Eliminated -- a player in a multiplayer game has lost their fleet
+6. EventDispatcher -- subscribe handlers per event type, optionally buffer events
+
+Events are only constructed if something has subscribed to their type,
+so an observer that only listens for GameOver adds no per-shot cost.
+
+"""
+
+
+class Event(object):
+   """
+   Base class of every game event.  Subscribing to Event receives all
+   event types.
+   """
+   __slots__ = ()
+
+   def __repr__(self):
+      names = [name for cls in reversed(type(self).__mro__)
+               for name in getattr(cls, '__slots__', ())]
+      fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in names)
+      return f'{type(self).__name__}({fields})'
+
+
+class ShotEvent(Event):
+   """
+   Outcome of a missile fired at coordinate on board
+   """
+   __slots__ = ('board', 'coordinate')
+
+   def __init__(self, board, coordinate):
+      self.board = board
+      self.coordinate = coordinate
+
+
+class Hit(ShotEvent):
+   __slots__ = ()
+
+
+class Miss(ShotEvent):
+   __slots__ = ()
+
+
+class OutOfBounds(ShotEvent):
+   __slots__ = ()
+
+
+class AlreadyTargeted(ShotEvent):
+   __slots__ = ()
+
+
+class Sunk(ShotEvent):
+   """
+   A ship of length size was sunk by the missile at coordinate
+   """
+   __slots__ = ('size',)
+
+   def __init__(self, board, coordinate, size):
+      super().__init__(board, coordinate)
+      self.size = size
+
+
+class BoardsUpdated(Event):
+   """
+   A round of turns is complete and the boards can be redrawn
+   """
+   __slots__ = ('player_board', 'enemy_board')
+
+   def __init__(self, player_board, enemy_board):
+      self.player_board = player_board
+      self.enemy_board = enemy_board
+
+
+class GameOver(Event):
+   """
+   All of the ships on loser (a board) have been sunk
+   """
+   __slots__ = ('loser', 'player_won')
+
+   def __init__(self, loser, player_won):
+      self.loser = loser
+      self.player_won = player_won
+
+
+class Eliminated(Event):
+   """
+   Every ship of player (a multiplayer.Player) has been sunk
+   """
+   __slots__ = ('player',)
+
+   def __init__(self, player):
+      self.player = player
+
+
+EVENT_TYPES = (Hit, Sunk, Miss, OutOfBounds, AlreadyTargeted, BoardsUpdated,
+               GameOver, Eliminated)
+
+
+class EventDispatcher(object):
+   """
+   Delivers events to the handlers subscribed to their type.
+
+   handlers maps each event type to the list of callables to deliver it
+   to.  Only types with at least one subscriber appear in handlers so a
+   publisher can skip building events nobody wants:
+
+   if Hit in dispatcher.handlers:
+      dispatcher.publish(Hit(board, coordinate))
+
+   If buffered, events are held until flush() and then delivered in order.
+   Batch handlers are buffered on their own, whether or not the
+   dispatcher is, and each flush() calls every batch handler once with
+   the list of its events since the last flush.
+   """
+   __slots__ = ('buffered', 'handlers', '_batch_handlers', '_batched_types',
+                '_buffer', '_batch_buffer')
+
+   def __init__(self, buffered=False):
+      '''
+      Keyword arguments:
+      buffered -- hold events until flush() (default = False)
+      '''
+      self.buffered = buffered
+      self.handlers = {}
+      self._batch_handlers = []
+      self._batched_types = set()
+      self._buffer = []
+      self._batch_buffer = []
+
+   @property
+   def batched(self):
+      '''
+      True if any batch handler is subscribed
+      '''
+      return bool(self._batch_handlers)
+
+   def subscribe(self, event_type, handler):
+      '''
+      Call handler(event) for every event of event_type.  Subscribing to
+      Event receives every event type.
+
+      Keyword arguments:
+      event_type -- an Event subclass
+      handler -- callable accepting one event
+      '''
+      for concrete in self._concrete_types(event_type):
+         self.handlers.setdefault(concrete, []).append(handler)
+
+   def unsubscribe(self, event_type, handler):
+      '''
+      Stop delivering event_type to handler
+      '''
+      for concrete in self._concrete_types(event_type):
+         handlers = self.handlers.get(concrete, [])
+         if handler in handlers:
+            handlers.remove(handler)
+         batched = any(concrete in wanted for _, wanted in self._batch_handlers)
+         if not handlers and not batched:
+            self.handlers.pop(concrete, None)
+
+   def subscribe_batch(self, handler, event_types=(Event,)):
+      '''
+      Call handler(events) with the list of events of event_types since
+      the last flush each time the dispatcher is flushed.  Other handlers
+      still receive events as they happen unless the dispatcher is
+      buffered.
+
+      Keyword arguments:
+      handler -- callable accepting a list of events
+      event_types -- the event types to buffer for handler (default = all)
+      '''
+      wanted = set()
+      for event_type in event_types:
+         wanted.update(self._concrete_types(event_type))
+         for concrete in self._concrete_types(event_type):
+            self.handlers.setdefault(concrete, [])
+      self._batch_handlers.append((handler, wanted))
+      self._batched_types.update(wanted)
+
+   def publish(self, event):
+      '''
+      Deliver event now, or hold it until flush() if buffered.  Events
+      wanted by a batch handler are held for it until flush().
+      '''
+      if self.buffered:
+         self._buffer.append(event)
+      else:
+         for handler in self.handlers.get(type(event), ()):
+            handler(event)
+
+      if type(event) in self._batched_types:
+         self._batch_buffer.append(event)
+
+   def flush(self):
+      '''
+      Deliver all buffered events, then each batch handler's events
+      '''
+      if self._buffer:
+         events = self._buffer
+         self._buffer = []
+
+         for event in events:
+            for handler in self.handlers.get(type(event), ()):
+               handler(event)
+
+      if not self._batch_buffer:
+         return
+
+      events = self._batch_buffer
+      self._batch_buffer = []
+
+      for handler, wanted in self._batch_handlers:
+         batch = [event for event in events if type(event) in wanted]
+         if batch:
+            handler(batch)
+
+   def _concrete_types(self, event_type):
+      return [t for t in EVENT_TYPES if issubclass(t, event_type)]
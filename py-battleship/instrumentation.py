@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Opt-in per phase counters and timings for Game and GameBoard
+
+Classes:
+
+1. PhaseTimings -- call counts and cumulative seconds per phase of a turn
+
+Functions:
+
+1. time_methods -- replace methods of an object with timed wrappers
+2. untime_methods -- restore the original methods
+
+Phases of a turn:
+
+select_target -- the target controller choosing a coordinate
+hit_resolution -- GameBoard.missile_on_target
+board_update -- GameBoard.record_hit and record_miss
+dispatch -- Game._broadcast (building and publishing events)
+
+Timing is switched on per object with Game.enable_timing() or
+GameBoard.enable_timing().  The timed wrappers are instance attributes
+that shadow the class methods, so while timing is off the only cost is a
+single check per turn for select_target.  Objects of classes with 
+__slots__ (e.g. GameBoard) have no instance dict to shadow methods in, so
+they are switched to a subclass with timed methods instead and must have 
+a _timings slot.
+
+"""
+
+from time import perf_counter
+
+PHASES = ('select_target', 'hit_resolution', 'board_update', 'dispatch')
+
+
+class PhaseTimings(object):
+   """
+   Call counts and cumulative wall clock seconds for each phase.  One
+   PhaseTimings can be shared by many games and boards.
+   """
+
+   def __init__(self):
+      self.calls = dict.fromkeys(PHASES, 0)
+      self.seconds = dict.fromkeys(PHASES, 0.0)
+
+   def add(self, phase, seconds):
+      '''
+      Record one call of phase that took seconds
+      '''
+      self.calls[phase] += 1
+      self.seconds[phase] += seconds
+
+   def wrap(self, func, phase):
+      '''
+      Returns a function that calls func and records its time under phase
+      '''
+      calls = self.calls
+      totals = self.seconds
+
+      def timed(*args):
+         start = perf_counter()
+         result = func(*args)
+         totals[phase] += perf_counter() - start
+         calls[phase] += 1
+         return result
+
+      return timed
+
+   def reset(self):
+      for phase in self.calls:
+         self.calls[phase] = 0
+         self.seconds[phase] = 0.0
+
+   def as_dict(self):
+      '''
+      Returns a dict of phase: {'calls', 'seconds', 'mean_seconds'}
+      '''
+      return {phase: {'calls': self.calls[phase],
+                      'seconds': self.seconds[phase],
+                      'mean_seconds': self.seconds[phase] / self.calls[phase]
+                                      if self.calls[phase] else 0.0}
+              for phase in self.calls}
+
+   def to_prometheus(self, prefix='battleship'):
+      '''
+      Returns the counters in the Prometheus text exposition format
+
+      Keyword arguments:
+      prefix -- metric name prefix (default = 'battleship')
+      '''
+      lines = [f'# HELP {prefix}_phase_calls_total Calls made in each phase of a turn',
+               f'# TYPE {prefix}_phase_calls_total counter']
+      lines += [f'{prefix}_phase_calls_total{{phase="{phase}"}} {calls}'
+                for phase, calls in self.calls.items()]
+
+      lines += [f'# HELP {prefix}_phase_seconds_total Seconds spent in each phase of a turn',
+                f'# TYPE {prefix}_phase_seconds_total counter']
+      lines += [f'{prefix}_phase_seconds_total{{phase="{phase}"}} {seconds!r}'
+                for phase, seconds in self.seconds.items()]
+
+      return '\n'.join(lines) + '\n'
+
+
+def time_methods(obj, timings, phases):
+   '''
+   Shadow methods of obj with wrappers that record their time in timings
+
+   Keyword arguments:
+   obj -- object whose methods are timed
+   timings -- PhaseTimings
+   phases -- dict of method name: phase
+   '''
+   if not hasattr(obj, '__dict__'):
+      obj._timings = timings
+      obj.__class__ = _timed_class(type(obj), phases)
+      return
+
+   for name, phase in phases.items():
+      method = getattr(type(obj), name).__get__(obj)
+      setattr(obj, name, timings.wrap(method, phase))
+
+
+def untime_methods(obj, phases):
+   '''
+   Remove the wrappers added by time_methods
+   '''
+   if not hasattr(obj, '__dict__'):
+      obj.__class__ = getattr(obj, '_untimed_class', type(obj))
+      obj._timings = None
+      return
+
+   for name in phases:
+      obj.__dict__.pop(name, None)
+
+
+#timed subclasses of slotted classes keyed by (class, phases)
+_timed_classes = {}
+
+
+def _timed_class(cls, phases):
+   '''
+   Returns a subclass of cls whose methods in phases add their time to
+   self._timings.  The subclass adds no slots so an object can switch
+   between cls and the subclass by assigning __class__.
+   '''
+   key = (cls, tuple(sorted(phases.items())))
+   timed = _timed_classes.get(key)
+
+   if timed is None:
+      namespace = {'__slots__': (), '__module__': cls.__module__,
+                   '_untimed_class': cls}
+      for name, phase in phases.items():
+         namespace[name] = _timed_method(getattr(cls, name), phase)
+
+      timed = _timed_classes[key] = type(cls.__name__, (cls,), namespace)
+
+   return timed
+
+
+def _timed_method(func, phase):
+   def timed(self, *args):
+      start = perf_counter()
+      result = func(self, *args)
+      self._timings.add(phase, perf_counter() - start)
+      return result
+
+   return timed
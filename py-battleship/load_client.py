@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Load generator for the asyncio battleship server
+
+Classes:
+
+1. LoadResults -- games played, per move latency and peak concurrency
+
+Functions:
+
+1. play_client -- play one match over a connection to the server
+2. generate_load -- play many concurrent matches against the server
+3. measure_server -- start a BattleshipServer in process and load it
+
+Each simulated player shoots at every cell once in a random order.  With
+a think_time the players spend most of their time idle, which is how a
+server hosting thousands of human players mostly looks.
+
+Run from this directory e.g.
+
+python load_client.py 2000
+
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+from seeding import make_rng, seed_sequence
+from server import BattleshipServer
+
+
+class LoadResults(object):
+   """
+   Results of a load test.  latencies are the seconds between sending a
+   move and receiving the server's RESULT for it.
+   """
+
+   def __init__(self):
+      self.games = 0
+      self.wins = 0
+      self.errors = 0
+      self.latencies = []
+      self.active = 0
+      self.peak_active = 0
+      self.elapsed = 0.0
+
+   def percentile(self, p):
+      '''
+      Returns the p-th percentile move latency in seconds
+      '''
+      if not self.latencies:
+         return float('nan')
+      ordered = sorted(self.latencies)
+      return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+   def summary(self):
+      '''
+      Returns a dict summarising the load test
+      '''
+      moves = len(self.latencies)
+      return {'games': self.games,
+              'errors': self.errors,
+              'peak_concurrent_games': self.peak_active,
+              'moves': moves,
+              'moves_per_second': moves / self.elapsed if self.elapsed else 0.0,
+              'mean_latency_ms': statistics.fmean(self.latencies) * 1e3 if moves else float('nan'),
+              'p50_latency_ms': self.percentile(50) * 1e3,
+              'p99_latency_ms': self.percentile(99) * 1e3}
+
+
+async def play_client(host, port, results, rng, think_time=0.0):
+   '''
+   Connect to the server and play one match to the end.
+
+   Keyword arguments:
+   host -- server address
+   port -- server port
+   results -- LoadResults to record into
+   rng -- random.Random used to order the shots
+   think_time -- seconds to idle before each move (default = 0)
+   '''
+   reader, writer = await asyncio.open_connection(host, port)
+   results.active += 1
+   results.peak_active = max(results.peak_active, results.active)
+
+   try:
+      _, grid_size, _ = (await reader.readline()).decode().split()
+      grid_size = int(grid_size)
+      targets = [(row, col) for row in range(grid_size) for col in range(grid_size)]
+      rng.shuffle(targets)
+
+      sent = None
+      while True:
+         line = await reader.readline()
+         if not line:
+            raise ConnectionError('server closed the connection')
+
+         message = line.decode().split()
+         if message[0] == 'TURN':
+            if think_time:
+               await asyncio.sleep(think_time)
+            row, col = targets.pop()
+            sent = time.perf_counter()
+            writer.write(f'{row},{col}\n'.encode())
+         elif message[0] == 'RESULT':
+            results.latencies.append(time.perf_counter() - sent)
+         elif message[0] == 'GAMEOVER':
+            results.games += 1
+            results.wins += message[1] == 'WIN'
+            break
+   except (ConnectionError, ValueError, IndexError):
+      results.errors += 1
+   finally:
+      results.active -= 1
+      writer.close()
+
+
+async def generate_load(host, port, n_clients, think_time=0.0, seed=None):
+   '''
+   Play n_clients concurrent matches against a running server.
+   Returns a LoadResults.
+
+   Keyword arguments:
+   host -- server address
+   port -- server port
+   n_clients -- number of concurrent matches
+   think_time -- seconds each player idles before each move (default = 0)
+   seed -- any seed accepted by seeding.seed_sequence (default = None)
+   '''
+   results = LoadResults()
+   seeds = seed_sequence(seed).spawn(n_clients)
+
+   start = time.perf_counter()
+   await asyncio.gather(*(play_client(host, port, results, make_rng(s), think_time)
+                          for s in seeds))
+   results.elapsed = time.perf_counter() - start
+
+   return results
+
+
+async def measure_server(n_clients=1000, think_time=0.0, seed=None, **kwargs):
+   '''
+   Start a BattleshipServer on a free localhost port and load it with
+   n_clients concurrent matches.  Returns (LoadResults, BattleshipServer).
+
+   Keyword arguments:
+   n_clients -- number of concurrent matches (default = 1000)
+   think_time -- seconds each player idles before each move (default = 0)
+   seed -- seeds both the server and the clients (default = None)
+   kwargs -- passed to BattleshipServer
+   '''
+   server = BattleshipServer(port=0, seed=seed, **kwargs)
+   listener = await server.start()
+
+   async with listener:
+      results = await generate_load(server.host, server.port, n_clients,
+                                    think_time, seed)
+
+   return results, server
+
+
+if __name__ == "__main__":
+
+   n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+   think_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+
+   results, server = asyncio.run(measure_server(n_clients, think_time, seed=42))
+   for key, value in results.summary().items():
+      print(f'{key}: {value:.3f}' if isinstance(value, float) else f'{key}: {value}')
+   print(f'server peak concurrent games: {server.peak_active}')
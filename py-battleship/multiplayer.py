@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+N-player battleship on rectangular or irregular boards
+
+Classes:
+
+1. BoardShape -- the playable cells of a rows X cols board, optionally masked
+2. ShapedGameBoard -- a GameBoard whose storage is proportional to the playable area
+3. ShapePlacementIndex -- the placements of a ship on the playable cells of a BoardShape
+4. ShapedDeployEngine -- randomly deploys ships onto the playable cells of a BoardShape
+5. ShapedRandomTargetController -- targets each playable cell once in a random order
+6. Player -- a named fleet, its team and its target controller factory
+7. MultiplayerGame -- free-for-all or team game between any number of players
+
+Functions:
+
+1. make_players -- create players with freshly deployed boards
+
+Playable cells are numbered 0 to area - 1 in row major order.  An
+unmasked board computes the number from (row, col); a masked board keeps
+a sorted array of the playable cells, so a board stores one entry per
+playable cell rather than per cell of its bounding rectangle.
+
+Players take turns in a fixed order.  Eliminated players are dropped
+from the order, so each round of turns is linear in the players left.
+A player shoots at the next opponent still afloat after them in the turn
+order (target_policy='next') or at a random opponent ('random').  The
+game ends when every remaining player is on the same team.
+
+"""
+
+from array import array
+from bisect import bisect_left
+
+from classic_battleship import Game, GameBoard, HIT, MISSED, RandomDeployEngine, UNKNOWN
+from events import Eliminated
+from seeding import make_rng, spawn
+
+#codes used in ShapedGameBoard.state
+STATE_UNKNOWN = 0
+STATE_MISSED = 1
+STATE_HIT = 2
+
+#shown for cells outside the playable area
+BLOCKED = ' '
+
+
+class BoardShape(object):
+   """
+   The playable cells of a rows X cols board
+   """
+
+   def __init__(self, rows, cols, mask=None):
+      '''
+      Keyword arguments:
+      rows -- number of rows
+      cols -- number of columns
+      mask -- optional rows X cols nested sequence (e.g. lists of bool or a
+      numpy bool array), truthy where a cell is playable
+      (default = None i.e. every cell is playable)
+      '''
+      self.rows = rows
+      self.cols = cols
+
+      if mask is None:
+         self._keys = None
+         self.area = rows * cols
+      else:
+         self._keys = array('q', (row * cols + col for row in range(rows)
+                                  for col in range(cols) if mask[row][col]))
+         self.area = len(self._keys)
+
+   @classmethod
+   def from_strings(cls, lines, blocked='#'):
+      '''
+      Create a shape from a picture of the board e.g.
+
+      BoardShape.from_strings(['..##',
+                               '....',
+                               '##..'])
+
+      Keyword arguments:
+      lines -- one str per row, blocked marks a cell that is not playable
+      blocked -- character of a cell outside the board (default = '#')
+      '''
+      cols = max(len(line) for line in lines)
+      mask = [[col < len(line) and line[col] != blocked for col in range(cols)]
+              for line in lines]
+      return cls(len(lines), cols, mask)
+
+   def index(self, row, col):
+      '''
+      Returns the number of playable cell (row, col) or -1 if the cell is
+      not playable
+      '''
+      if not (0 <= row < self.rows and 0 <= col < self.cols):
+         return -1
+
+      key = row * self.cols + col
+      if self._keys is None:
+         return key
+
+      i = bisect_left(self._keys, key)
+      return i if i < self.area and self._keys[i] == key else -1
+
+   def coordinate(self, index):
+      '''
+      Returns [row, col] of playable cell number index
+      '''
+      key = index if self._keys is None else self._keys[index]
+      return list(divmod(key, self.cols))
+
+   def __contains__(self, coordinate):
+      return self.index(coordinate[0], coordinate[1]) >= 0
+
+   def runs(self):
+      '''
+      Returns (across, down): arrays of the number of playable cells in a
+      row from each playable cell to the right and downwards, itself
+      included
+      '''
+      across = array('l', [0]) * self.area
+      down = array('l', [0]) * self.area
+
+      for index in range(self.area - 1, -1, -1):
+         row, col = self.coordinate(index)
+         right = self.index(row, col + 1)
+         below = self.index(row + 1, col)
+         across[index] = 1 + (across[right] if right >= 0 else 0)
+         down[index] = 1 + (down[below] if below >= 0 else 0)
+
+      return across, down
+
+
+class ShapedGameBoard(object):
+   """
+   Encapsulates a game board of any BoardShape.  Same interface as
+   GameBoard.
+
+   state holds one byte per playable cell (STATE_UNKNOWN, STATE_MISSED or
+   STATE_HIT) and only the cells of deployed ships are mapped to a ship.
+   """
+
+   def __init__(self, shape, deploy_engine, name='PLAYER'):
+      self.shape = shape
+      self.deploy_engine = deploy_engine
+      self.name = name
+      self.state = bytearray(shape.area)
+      self.battleships = []
+      self.last_sunk_size = None
+
+      self._ship_at = {}
+      self._cells_remaining = []
+      self._afloat = 0
+      self._unhidden = False
+
+   def deploy_battleships(self):
+      self.set_battleships(self.deploy_engine.deploy())
+
+   def set_battleships(self, battleships):
+      '''
+      Place a list of Battleships on the board
+
+      Keyword arguments:
+      battleships -- list of Battleship e.g. from a deploy engine
+      '''
+      self.battleships = battleships
+      self._ship_at = {}
+      self._cells_remaining = []
+
+      for ship_index, ship in enumerate(battleships):
+         for row, col in ship.coordinates:
+            self._ship_at[self.shape.index(row, col)] = ship_index
+         self._cells_remaining.append(ship.length)
+
+      self._afloat = len(battleships)
+
+   def battleships_remaining(self):
+      return self._afloat
+
+   #same instrumentation surface as GameBoard
+   _TIMED_METHODS = GameBoard._TIMED_METHODS
+   enable_timing = GameBoard.enable_timing
+   disable_timing = GameBoard.disable_timing
+
+   def unhide_ships(self):
+      self._unhidden = True
+
+   @property
+   def board(self):
+      '''
+      The board as a list of lists of str (for display only)
+      '''
+      symbols = {STATE_UNKNOWN: UNKNOWN, STATE_MISSED: MISSED, STATE_HIT: HIT}
+      rows = [[BLOCKED] * self.shape.cols for _ in range(self.shape.rows)]
+
+      for index, code in enumerate(self.state):
+         row, col = self.shape.coordinate(index)
+         symbol = symbols[code]
+         if self._unhidden and code == STATE_UNKNOWN and index in self._ship_at:
+            symbol = str(self._ship_at[index] + 1)
+         rows[row][col] = symbol
+
+      return rows
+
+   def missile_on_target(self, coordinate):
+      hit = False
+      sunk = False
+
+      ship_index = self._ship_at.pop(self.shape.index(coordinate[0], coordinate[1]), None)
+      if ship_index is not None:
+         hit = True
+         self._cells_remaining[ship_index] -= 1
+
+         if self._cells_remaining[ship_index] == 0:
+            self.last_sunk_size = self.battleships[ship_index].length
+            self._afloat -= 1
+            sunk = True
+
+      return hit, sunk
+
+   def record_hit(self, coordinate):
+      self.state[self.shape.index(coordinate[0], coordinate[1])] = STATE_HIT
+
+   def record_miss(self, coordinate):
+      self.state[self.shape.index(coordinate[0], coordinate[1])] = STATE_MISSED
+
+   def missile_out_of_bounds(self, coordinate):
+      '''
+      Returns True if coordinate is not a playable cell
+      '''
+      return self.shape.index(coordinate[0], coordinate[1]) < 0
+
+   def previously_targetted(self, coordinate):
+      return self.state[self.shape.index(coordinate[0], coordinate[1])] != STATE_UNKNOWN
+
+
+class ShapePlacementIndex(object):
+   """
+   All placements of a ship of length ship_size that lie wholly on the
+   playable cells of a BoardShape.  Has the ids, start(), end() and mask()
+   of placements.PlacementIndex that RandomDeployEngine deploys from.
+
+   A placement is stored as the number of its first playable cell, so the
+   index is proportional to the playable area.  Masks are bitmasks of
+   playable cell numbers: the cells of a horizontal placement are
+   numbered consecutively.
+
+   0 .. n_horizontal - 1 -- horizontal placements
+   n_horizontal .. len - 1 -- vertical placements
+   """
+
+   def __init__(self, shape, ship_size, runs=None):
+      '''
+      Keyword arguments:
+      shape -- BoardShape
+      ship_size -- length of the ship
+      runs -- (across, down) from shape.runs() to share between ship
+      sizes (default = None i.e. computed here)
+      '''
+      self.shape = shape
+      self.ship_size = ship_size
+      across, down = shape.runs() if runs is None else runs
+
+      self.starts = array('l', (index for index in range(shape.area)
+                                if across[index] >= ship_size))
+      self.n_horizontal = len(self.starts)
+
+      #a ship of length 1 is the same in either orientation
+      if ship_size > 1:
+         self.starts.extend(index for index in range(shape.area)
+                            if down[index] >= ship_size)
+
+      self.ids = array('l', range(len(self.starts)))
+
+   def __len__(self):
+      return len(self.starts)
+
+   def start(self, placement):
+      '''
+      Returns the [row, col] start (top left) of a placement
+      '''
+      return self.shape.coordinate(self.starts[placement])
+
+   def end(self, placement):
+      '''
+      Returns the [row, col] end (bottom right) of a placement
+      '''
+      row, col = self.start(placement)
+      if placement < self.n_horizontal:
+         return [row, col + self.ship_size - 1]
+      return [row + self.ship_size - 1, col]
+
+   def mask(self, placement):
+      '''
+      Returns the playable cells occupied by a placement as an int bitmask
+      '''
+      first = self.starts[placement]
+      if placement < self.n_horizontal:
+         return ((1 << self.ship_size) - 1) << first
+
+      row, col = self.shape.coordinate(first)
+      mask = 0
+      for i in range(self.ship_size):
+         mask |= 1 << self.shape.index(row + i, col)
+      return mask
+
+
+class ShapedDeployEngine(RandomDeployEngine):
+   """
+   Randomly deploys ships on the playable cells of a BoardShape.
+
+   A RandomDeployEngine drawing from a ShapePlacementIndex per ship size,
+   so every legal placement is equally likely, a dead end backtracks
+   rather than retrying and nothing is allocated for cells outside the
+   shape.  There is no square grid, so grid_size is None and
+   deploy_batch() is not supported.
+
+   Key method is deploy()
+   """
+
+   def __init__(self, ship_sizes, shape, rng=None, max_backtracks=10000):
+      '''
+      Keyword arguments:
+      ship_sizes -- list of the lengths of ships to deploy
+      shape -- BoardShape to deploy on
+      rng -- random.Random (or any seed accepted by seeding.make_rng)
+      (default = None)
+      max_backtracks -- deploy() gives up with a ValueError after this many
+      backtracks (default = 10000)
+      '''
+      self.shape = shape
+      self._runs = shape.runs()
+      super().__init__(ship_sizes, None, rng, max_backtracks)
+
+   def _placement_index(self, size):
+      return ShapePlacementIndex(self.shape, size, self._runs)
+
+   def _board_description(self):
+      return f'a {self.shape.rows} X {self.shape.cols} board of {self.shape.area} playable cells'
+
+   def deploy_batch(self, n, packed=False, rng=None):
+      raise NotImplementedError('batch deployment needs a square board')
+
+
+class ShapedRandomTargetController(object):
+   """
+   Targets every playable cell of a BoardShape exactly once in a uniformly
+   random order.  The order is drawn lazily (a Fisher-Yates shuffle that
+   only records the cells it has swapped) so memory grows with the shots
+   fired, not with the area.
+   """
+
+   def __init__(self, shape, rng=None):
+      self.shape = shape
+      self.rng = make_rng(rng)
+      self._remaining = shape.area
+      self._swapped = {}
+
+   @classmethod
+   def from_board(cls, board, rng=None):
+      return cls(board.shape, rng)
+
+   def select_target(self):
+      if self._remaining == 0:
+         raise ValueError('Every cell has been targeted')
+
+      i = self.rng.randrange(self._remaining)
+      self._remaining -= 1
+      last = self._remaining
+      cell = self._swapped.get(i, i)
+      self._swapped[i] = self._swapped.pop(last, last)
+
+      return self.shape.coordinate(cell)
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      pass
+
+
+class Player(object):
+   """
+   A player in a MultiplayerGame: a name, the board holding their fleet,
+   their team and a factory for the target controllers they use against
+   each opponent
+   """
+
+   def __init__(self, name, board, team=None,
+                controller=ShapedRandomTargetController.from_board):
+      '''
+      Keyword arguments:
+      name -- player name
+      board -- the player's own board
+      team -- players with the same team are allies (default = None i.e.
+      a team of one named after the player)
+      controller -- factory(board, rng) returning a target controller
+      '''
+      self.name = name
+      self.board = board
+      self.team = name if team is None else team
+      self.controller = controller
+      self.controllers = {}
+
+   def controller_for(self, opponent, rng):
+      '''
+      Returns this player's target controller for opponent's board
+      '''
+      controller = self.controllers.get(opponent.name)
+      if controller is None:
+         controller = self.controllers[opponent.name] = self.controller(opponent.board, rng)
+      return controller
+
+   def __repr__(self):
+      return f'Player({self.name!r}, team={self.team!r})'
+
+
+class MultiplayerGame(Game):
+   """
+   Free-for-all or team battleship between any number of players on
+   boards of any shape.  Publishes the same shot events as Game plus
+   Eliminated.
+
+   Key method is play()
+   """
+
+   def __init__(self, players, seed=None, target_policy='next',
+                buffer_events=None):
+      '''
+      Keyword arguments:
+      players -- list of Players in turn order
+      seed -- any seed accepted by seeding.spawn (default = None)
+      target_policy -- 'next' to shoot at the next opponent afloat in turn
+      order or 'random' for a random opponent (default = 'next')
+      buffer_events -- as for Game (default = None)
+      '''
+      if len({player.team for player in players}) < 2:
+         raise ValueError('A game needs players from at least two teams')
+      if len({player.name for player in players}) < len(players):
+         raise ValueError('Player names must be unique')
+      if target_policy not in ('next', 'random'):
+         raise ValueError(f'Unknown target_policy {target_policy!r}')
+
+      super().__init__(players[0].board, players[1].board, buffer_events)
+      self.players = list(players)
+      self.target_policy = target_policy
+
+      #one stream to choose targets plus one per player's controllers
+      streams = [make_rng(child) for child in spawn(seed, len(players) + 1)]
+      self.rng = streams[0]
+      self._rngs = {player.name: rng for player, rng in zip(players, streams[1:])}
+
+      self.alive = list(players)
+      self.eliminated = []
+      self._team_alive = {}
+      for player in players:
+         self._team_alive[player.team] = self._team_alive.get(player.team, 0) + 1
+
+      self.turns = 0
+
+   def enable_timing(self, timings=None):
+      timings = super().enable_timing(timings)
+      for player in self.players[2:]:
+         player.board.enable_timing(timings)
+      return timings
+
+   def disable_timing(self):
+      if self.timings is not None:
+         for player in self.players[2:]:
+            player.board.disable_timing()
+      super().disable_timing()
+
+   def teams_alive(self):
+      return len(self._team_alive)
+
+   def play(self, max_turns=None):
+      '''
+      Play until one team is left.  Returns the list of players on the
+      winning team, or None if the game was stopped after max_turns.
+
+      Keyword arguments:
+      max_turns -- optional limit on the total number of turns
+      (default = None i.e. unlimited)
+      '''
+      position = 0
+
+      while len(self._team_alive) > 1:
+         if max_turns is not None and self.turns >= max_turns:
+            self.flush_events()
+            return None
+
+         shooter = self.alive[position]
+         target = self._choose_target(position)
+         self.take_turn(target.board, shooter.controller_for(target, self._rngs[shooter.name]))
+         self.turns += 1
+
+         if target.board.battleships_remaining() == 0:
+            removed = self._eliminate(target)
+            if removed < position:
+               position -= 1
+
+         position = (position + 1) % len(self.alive)
+
+      self.flush_events()
+      winners = next(iter(self._team_alive))
+      return [player for player in self.players if player.team == winners]
+
+   def _choose_target(self, position):
+      '''
+      Returns the opponent targeted by the player at position in alive
+      '''
+      alive = self.alive
+      team = alive[position].team
+
+      if self.target_policy == 'random':
+         #rejection is quick unless nearly everyone left is an ally
+         for _ in range(8):
+            target = alive[self.rng.randrange(len(alive))]
+            if target.team != team:
+               return target
+         return self.rng.choice([p for p in alive if p.team != team])
+
+      for step in range(1, len(alive)):
+         target = alive[(position + step) % len(alive)]
+         if target.team != team:
+            return target
+
+   def _eliminate(self, player):
+      '''
+      Remove player from the turn order.  Returns their old position.
+      '''
+      position = self.alive.index(player)
+      del self.alive[position]
+      self.eliminated.append(player)
+
+      self._team_alive[player.team] -= 1
+      if self._team_alive[player.team] == 0:
+         del self._team_alive[player.team]
+
+      self._broadcast(Eliminated, player)
+      return position
+
+
+def make_players(n_players, shape, ship_sizes=(5, 4, 3, 3, 2), teams=None,
+                 controller=ShapedRandomTargetController.from_board,
+                 seed=None):
+   '''
+   Returns a list of n_players Players with freshly deployed boards
+
+   Keyword arguments:
+   n_players -- number of players
+   shape -- BoardShape shared by every board
+   ship_sizes -- sizes of the ships in each fleet
+   teams -- optional number of teams, players are dealt to teams in turn
+   (default = None i.e. free-for-all)
+   controller -- factory(board, rng) of every player's target controllers
+   seed -- any seed accepted by seeding.spawn (default = None)
+   '''
+   players = []
+
+   for i, child in enumerate(spawn(seed, n_players)):
+      name = f'P{i}'
+      board = ShapedGameBoard(shape, ShapedDeployEngine(ship_sizes, shape, child), name)
+      board.deploy_battleships()
+      team = name if teams is None else f'T{i % teams}'
+      players.append(Player(name, board, team, controller))
+
+   return players
+
+
+if __name__ == "__main__":
+
+   import time
+
+   shape = BoardShape.from_strings(['####......####',
+                                    '##..........##',
+                                    '..............',
+                                    '..............',
+                                    '##..........##',
+                                    '####......####'])
+
+   players = make_players(6, shape, ship_sizes=(4, 3, 2), teams=2, seed=42)
+   game = MultiplayerGame(players, seed=42)
+   winners = game.play()
+   print(f'{shape.area} playable cells, {game.turns} turns, winners {winners}')
+
+   for n_players in (50, 100, 200):
+      players = make_players(n_players, BoardShape(20, 30), seed=1)
+      game = MultiplayerGame(players, seed=1, target_policy='random')
+      start = time.perf_counter()
+      winners = game.play()
+      elapsed = time.perf_counter() - start
+      print(f'{n_players} player free-for-all: {game.turns} turns in {elapsed:.2f}s '
+            f'({elapsed / game.turns * 1e6:.1f} us per turn), winner {winners}')
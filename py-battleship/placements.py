@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Legal placements of a 1 x k ship on an n x n board
+
+Classes:
+
+1. PlacementIndex -- enumerates placements of a ship and the placements covering each cell
+2. PlacementPool -- set of placement (or cell) ids with O(1) removal, restore and uniform sampling
+
+Functions:
+
+1. placement_index -- shared, LRU cached PlacementIndex for a (grid_size, ship_size)
+
+Cells are numbered row * grid_size + col.  Placements are numbered
+arithmetically:
+
+0 .. n_horizontal - 1 -- horizontal placements, row major by start cell
+n_horizontal .. len - 1 -- vertical placements, row major by start cell
+
+Single placements are computed on demand (cells, bitmask, covering).  The
+NumPy tables used by vectorized code (cell_table and the cell to placement
+reverse index) are built the first time they are used and kept by the
+index, so always obtain indexes through placement_index() to share them.
+
+"""
+
+from array import array
+from functools import cached_property, lru_cache
+
+import numpy as np
+
+#number of (grid_size, ship_size) indexes kept by placement_index()
+PLACEMENT_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=PLACEMENT_CACHE_SIZE)
+def placement_index(grid_size, ship_size):
+   '''
+   Returns the shared PlacementIndex for a ship of length ship_size on a
+   grid_size X grid_size board.  The least recently used indexes are
+   evicted once PLACEMENT_CACHE_SIZE board/ship sizes are cached.
+
+   Keyword arguments:
+   grid_size -- size of the n X n board
+   ship_size -- length of the ship
+   '''
+   return PlacementIndex(grid_size, ship_size)
+
+
+class PlacementIndex(object):
+   """
+   All legal placements of a ship of length ship_size on a
+   grid_size X grid_size board.
+   """
+
+   def __init__(self, grid_size, ship_size):
+      self.grid_size = grid_size
+      self.ship_size = ship_size
+
+      #number of start positions along a row or column
+      self.span = max(grid_size - ship_size + 1, 0)
+      self.n_horizontal = grid_size * self.span
+
+      #a ship of length 1 is the same in either orientation
+      self.n_vertical = self.n_horizontal if ship_size > 1 else 0
+
+      #bitmasks of a ship starting at cell 0
+      self._row_mask = (1 << ship_size) - 1
+      self._col_mask = sum(1 << (i * grid_size) for i in range(ship_size))
+
+      #every placement id. Copied (memcpy) to create a full PlacementPool
+      self.ids = array('l', range(len(self)))
+
+   def __len__(self):
+      return self.n_horizontal + self.n_vertical
+
+   def is_vertical(self, placement):
+      return placement >= self.n_horizontal
+
+   def placement(self, row, col, vertical):
+      '''
+      Returns the id of the placement starting at [row, col]
+
+      Keyword arguments:
+      row -- start row
+      col -- start col
+      vertical -- True if the ship runs down the board from [row, col]
+      '''
+      if vertical and self.n_vertical:
+         return self.n_horizontal + row * self.grid_size + col
+      return row * self.span + col
+
+   def start(self, placement):
+      '''
+      Returns the [row, col] start (top left) of a placement
+      '''
+      if placement < self.n_horizontal:
+         return list(divmod(placement, self.span))
+      return list(divmod(placement - self.n_horizontal, self.grid_size))
+
+   def end(self, placement):
+      '''
+      Returns the [row, col] end (bottom right) of a placement
+      '''
+      row, col = self.start(placement)
+      if placement < self.n_horizontal:
+         return [row, col + self.ship_size - 1]
+      return [row + self.ship_size - 1, col]
+
+   def cells(self, placement):
+      '''
+      Returns a range of the cells occupied by a placement
+      '''
+      row, col = self.start(placement)
+      base = row * self.grid_size + col
+      if placement < self.n_horizontal:
+         return range(base, base + self.ship_size)
+      return range(base, base + self.ship_size * self.grid_size, self.grid_size)
+
+   def mask(self, placement):
+      '''
+      Returns the cells occupied by a placement as an int bitmask
+      '''
+      if placement < self.n_horizontal:
+         row, col = divmod(placement, self.span)
+         return self._row_mask << (row * self.grid_size + col)
+      return self._col_mask << (placement - self.n_horizontal)
+
+   @cached_property
+   def cell_table(self):
+      '''
+      (n_placements, ship_size) int array of the cells of each placement
+      '''
+      n = self.grid_size
+      offsets = np.arange(self.ship_size)
+
+      rows, cols = np.divmod(np.arange(self.n_horizontal), max(self.span, 1))
+      horizontal = (rows * n + cols)[:, None] + offsets
+
+      vertical = np.arange(self.n_vertical)[:, None] + offsets * n
+
+      return np.concatenate([horizontal, vertical]).astype(np.intp)
+
+   @cached_property
+   def _cover_table(self):
+      '''
+      Reverse index from cell to placements in compressed sparse row form.
+      The placements covering cell c are ids[offsets[c]:offsets[c + 1]]
+      '''
+      cells = self.cell_table.ravel()
+      order = np.argsort(cells, kind='stable')
+      ids = (order // self.ship_size).astype(np.intp)
+      counts = np.bincount(cells, minlength=self.grid_size * self.grid_size)
+      offsets = np.concatenate([[0], np.cumsum(counts)])
+      return offsets, ids
+
+   def coverage(self):
+      '''
+      Returns a new int array of the number of placements covering each cell
+      '''
+      offsets, _ = self._cover_table
+      return np.diff(offsets)
+
+   def covering_array(self, cell):
+      '''
+      Returns an int array (a view, do not modify) of the placements that
+      occupy cell
+      '''
+      offsets, ids = self._cover_table
+      return ids[offsets[cell]:offsets[cell + 1]]
+
+   def covering(self, cell):
+      '''
+      Returns a list of the placements that occupy cell
+      '''
+      row, col = divmod(cell, self.grid_size)
+      first = max(col - self.ship_size + 1, 0)
+      last = min(col, self.span - 1)
+      covering = [row * self.span + c for c in range(first, last + 1)]
+
+      if self.n_vertical:
+         first = max(row - self.ship_size + 1, 0)
+         last = min(row, self.span - 1)
+         covering.extend(self.n_horizontal + r * self.grid_size + col
+                         for r in range(first, last + 1))
+
+      return covering
+
+
+class PlacementPool(object):
+   """
+   A set of placement ids supporting O(1) remove, restore and uniform
+   random choice (swap-remove over a packed array).
+   """
+
+   def __init__(self, index):
+      '''
+      Create a pool holding every placement in index
+
+      Keyword arguments:
+      index -- a PlacementIndex
+      '''
+      self.ids = index.ids[:]
+      self.position = index.ids[:]
+
+   @classmethod
+   def of(cls, ids, size):
+      '''
+      Create a pool holding some of the ids 0 .. size - 1 e.g. the cells
+      of a board still to be targeted
+
+      Keyword arguments:
+      ids -- iterable of distinct ids
+      size -- one more than the largest id the pool may hold
+      '''
+      pool = cls.__new__(cls)
+      pool.ids = array('l', ids)
+      position = np.full(size, -1, dtype='l')
+      position[np.frombuffer(pool.ids, dtype='l')] = np.arange(len(pool.ids))
+      pool.position = array('l', position.tobytes())
+      return pool
+
+   def __len__(self):
+      return len(self.ids)
+
+   def __contains__(self, placement):
+      return self.position[placement] >= 0
+
+   def remove(self, placement):
+      '''
+      Remove placement.  Returns True if it was in the pool.
+      '''
+      index = self.position[placement]
+      if index < 0:
+         return False
+
+      last = self.ids.pop()
+      if last != placement:
+         self.ids[index] = last
+         self.position[last] = index
+
+      self.position[placement] = -1
+      return True
+
+   def restore(self, placement):
+      '''
+      Return a previously removed placement to the pool
+      '''
+      self.position[placement] = len(self.ids)
+      self.ids.append(placement)
+
+   def choice(self, rng):
+      '''
+      Returns a uniformly distributed placement from the pool
+
+      Keyword arguments:
+      rng -- random.Random
+      '''
+      return self.ids[int(rng.random() * len(self.ids))]
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Compact binary game records
+
+Classes:
+
+1. RecordWriter -- append-only streaming writer a Game can emit into
+2. RecordReader -- mmap based reader that scans records as numpy arrays
+3. GameRecord -- one decoded game: grid size, fleets, shot log and loser
+
+File format (little endian)
+
+An 8 byte file header: b'BSREC', format version, coordinate width in
+bytes (1 or 2) and a reserved byte.  It is followed by fixed width
+records of two coordinate fields (a, b) and a code byte i.e. 3 bytes per
+record for boards up to 256 X 256 and 5 bytes per record up to
+65536 X 65536.  The top 2 bits of code give the kind of record.
+
+kind  code       a, b              meaning
+00    00BBBRRR   row, col          shot at board B with result code R
+01    01BBBBBB   row, col          ship on board B; records come in (start, end) pairs
+10    10000000   grid_size - 1, n  start of a game between n boards
+11    11LLLLLL   0, 0              end of a game, board L lost (63 = unfinished)
+
+Result codes are the index of the result in RESULTS.  A game can have at
+most MAX_BOARDS boards, the most a shot record can address.  The row or
+col of an out of bounds shot that does not fit in a coordinate field is
+stored as the largest value the field holds.
+
+Because every record has the same width the whole file can be mapped as
+one numpy structured array and filtered without building Python objects
+per shot.
+
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from events import AlreadyTargeted, GameOver, Hit, Miss, OutOfBounds, Sunk
+
+MAGIC = b'BSREC'
+VERSION = 1
+HEADER = struct.Struct('<5sBBx')
+
+RESULTS = ('miss', 'hit', 'sunk', 'gone', 'out_bounds')
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+KIND_SHOT = 0
+KIND_SHIP = 1
+KIND_GAME = 2
+KIND_END = 3
+
+UNFINISHED = 0x3F
+
+#boards a shot record's 3 board bits can address
+MAX_BOARDS = 8
+
+
+def record_dtype(coord_bytes):
+   '''
+   Returns the numpy dtype of a record with coord_bytes wide coordinates
+   '''
+   coord = {1: 'u1', 2: '<u2'}[coord_bytes]
+   return np.dtype([('a', coord), ('b', coord), ('code', 'u1')])
+
+
+class RecordWriter(object):
+   """
+   Appends game records to a file.  Records are packed into an in memory
+   buffer and written every buffer_records records, on flush() and on
+   close().
+
+   Either call write_game(), write_shot() and write_end() directly or let
+   attach(game) subscribe the writer to a Game's events.
+   """
+
+   def __init__(self, path, coord_bytes=1, buffer_records=65536):
+      '''
+      Keyword arguments:
+      path -- file to append to.  A new file gets a header, an existing
+      file must have been written with the same coord_bytes.
+      coord_bytes -- bytes per coordinate field: 1 for boards up to
+      256 X 256, 2 for larger boards (default = 1)
+      buffer_records -- records held in memory between writes
+      (default = 65536)
+      '''
+      if coord_bytes not in (1, 2):
+         raise ValueError('coord_bytes must be 1 or 2')
+
+      self.coord_bytes = coord_bytes
+      self.max_grid_size = 256 ** coord_bytes
+      self.buffer_records = buffer_records
+      self.records = 0
+
+      self._struct = struct.Struct('<BBB' if coord_bytes == 1 else '<HHB')
+      self._mask = self.max_grid_size - 1
+      self._buffer = bytearray()
+      self._buffered = 0
+      self._boards = ()
+      self._pending = None
+
+      exists = os.path.exists(path) and os.path.getsize(path) > 0
+      if exists:
+         with open(path, 'rb') as f:
+            _, width = _read_header(f)
+         if width != coord_bytes:
+            raise ValueError(f'{path} has {width} byte coordinates')
+
+      self._file = open(path, 'ab')
+      if not exists:
+         self._file.write(HEADER.pack(MAGIC, VERSION, coord_bytes))
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exc_info):
+      self.close()
+
+   def write_game(self, boards):
+      '''
+      Start a new game: write a game record and the fleet deployed on
+      each board.  Call after the ships are deployed and before any shots.
+
+      Keyword arguments:
+      boards -- sequence of GameBoards in play, shots refer to boards by
+      their index in this sequence
+      '''
+      grid_size = boards[0].grid_size
+      if grid_size > self.max_grid_size:
+         raise ValueError(f'grid_size {grid_size} needs coord_bytes=2')
+      if len(boards) > MAX_BOARDS:
+         raise ValueError(f'a record holds at most {MAX_BOARDS} boards per game')
+
+      self._emit_pending()
+      self._boards = tuple(boards)
+      self._append(grid_size - 1, len(boards), KIND_GAME << 6)
+
+      for index, board in enumerate(boards):
+         for ship in board.battleships:
+            start, end = ship.start, ship.end
+            self._append(start[0], start[1], KIND_SHIP << 6 | index)
+            self._append(end[0], end[1], KIND_SHIP << 6 | index)
+
+   def write_shot(self, board_index, coordinate, result):
+      '''
+      Append a shot to the log
+
+      Keyword arguments:
+      board_index -- index of the board targeted
+      coordinate -- [row, col]
+      result -- 'miss', 'hit', 'sunk', 'gone' or 'out_bounds'
+      '''
+      if not 0 <= board_index < MAX_BOARDS:
+         raise ValueError(f'board_index must be less than {MAX_BOARDS}')
+
+      mask = self._mask
+      row, col = coordinate[0], coordinate[1]
+      if not (0 <= row <= mask and 0 <= col <= mask):
+         if result != 'out_bounds':
+            raise ValueError(f'coordinate {coordinate} does not fit in the record')
+         row = row if 0 <= row <= mask else mask
+         col = col if 0 <= col <= mask else mask
+
+      self._emit_pending()
+      self._append(row, col, board_index << 3 | RESULT_CODES[result])
+
+   def write_end(self, loser=None):
+      '''
+      End the current game
+
+      Keyword arguments:
+      loser -- index of the board whose fleet was sunk (default = None
+      i.e. the game was abandoned)
+      '''
+      self._emit_pending()
+      self._append(0, 0, KIND_END << 6 | (UNFINISHED if loser is None else loser))
+      self._boards = ()
+
+   def attach(self, game):
+      '''
+      Record game: writes its deployed fleets now and subscribes to its
+      shot and GameOver events.  Boards are indexed 0 = player_board,
+      1 = enemy_board.
+      '''
+      self.write_game((game.player_board, game.enemy_board))
+
+      game.subscribe(Hit, self.on_hit)
+      game.subscribe(Sunk, self.on_sunk)
+      game.subscribe(Miss, self.on_shot)
+      game.subscribe(OutOfBounds, self.on_shot)
+      game.subscribe(AlreadyTargeted, self.on_shot)
+      game.subscribe(GameOver, self.on_game_over)
+
+   def on_hit(self, event):
+      #a Sunk event for the same shot may follow so hold the record back
+      self._emit_pending()
+      self._pending = [self._boards.index(event.board), event.coordinate, 'hit']
+
+   def on_sunk(self, event):
+      self._pending[2] = 'sunk'
+
+   _EVENT_RESULTS = {Miss: 'miss', OutOfBounds: 'out_bounds',
+                     AlreadyTargeted: 'gone'}
+
+   def on_shot(self, event):
+      self.write_shot(self._boards.index(event.board), event.coordinate,
+                      self._EVENT_RESULTS[type(event)])
+
+   def on_game_over(self, event):
+      self.write_end(self._boards.index(event.loser))
+
+   def flush(self):
+      '''
+      Write buffered records to the file
+      '''
+      self._file.write(self._buffer)
+      self._file.flush()
+      self._buffer.clear()
+      self._buffered = 0
+
+   def close(self):
+      self._emit_pending()
+      self.flush()
+      self._file.close()
+
+   def _emit_pending(self):
+      if self._pending is not None:
+         pending, self._pending = self._pending, None
+         self.write_shot(*pending)
+
+   def _append(self, a, b, code):
+      self._buffer += self._struct.pack(a, b, code)
+      self.records += 1
+      self._buffered += 1
+      if self._buffered >= self.buffer_records:
+         self.flush()
+
+
+class GameRecord(object):
+   """
+   A decoded game.
+
+   ships[board] is a list of ([row, col] start, [row, col] end) pairs.
+   boards, rows, cols and results are numpy arrays with one entry per shot
+   in the order they were fired.
+   """
+
+   def __init__(self, grid_size, ships, boards, rows, cols, results, loser):
+      self.grid_size = grid_size
+      self.ships = ships
+      self.boards = boards
+      self.rows = rows
+      self.cols = cols
+      self.results = results
+      self.loser = loser
+
+   def __len__(self):
+      return len(self.results)
+
+   def shot(self, k):
+      '''
+      Returns (board, [row, col], result) for the k-th shot
+      '''
+      return (int(self.boards[k]), [int(self.rows[k]), int(self.cols[k])],
+              RESULTS[self.results[k]])
+
+
+class RecordReader(object):
+   """
+   Reads a record file through a read only numpy memmap.  Scans are done
+   a chunk of records at a time so memory use is bounded by the chunk size,
+   not the file size.
+   """
+
+   def __init__(self, path, chunk_records=1 << 22):
+      '''
+      Keyword arguments:
+      path -- record file
+      chunk_records -- records examined per step of a scan
+      (default = 4194304)
+      '''
+      with open(path, 'rb') as f:
+         self.version, self.coord_bytes = _read_header(f)
+
+      self.dtype = record_dtype(self.coord_bytes)
+      self.chunk_records = chunk_records
+
+      #ignore a partly written final record
+      n_records = (os.path.getsize(path) - HEADER.size) // self.dtype.itemsize
+      if n_records:
+         self.records = np.memmap(path, dtype=self.dtype, mode='r',
+                                  offset=HEADER.size, shape=(n_records,))
+      else:
+         self.records = np.empty(0, dtype=self.dtype)
+
+      self._game_starts = None
+
+   def __len__(self):
+      return len(self.records)
+
+   def chunks(self):
+      '''
+      Yields (offset, records) views of the file chunk_records at a time
+      '''
+      for offset in range(0, len(self.records), self.chunk_records):
+         yield offset, self.records[offset:offset + self.chunk_records]
+
+   def result_counts(self):
+      '''
+      Returns a dict of result: number of shots with that result
+      '''
+      counts = np.zeros(8, dtype=np.int64)
+      for _, chunk in self.chunks():
+         codes = chunk['code']
+         counts += np.bincount(codes[codes >> 6 == KIND_SHOT] & 7, minlength=8)
+
+      return {result: int(counts[code]) for code, result in enumerate(RESULTS)}
+
+   def n_shots(self):
+      return sum(self.result_counts().values())
+
+   def game_starts(self):
+      '''
+      Returns a numpy array of the record index at which each game starts
+      '''
+      if self._game_starts is None:
+         starts = [offset + np.flatnonzero(chunk['code'] == KIND_GAME << 6)
+                   for offset, chunk in self.chunks()]
+         self._game_starts = np.concatenate(starts) if starts else np.empty(0, np.int64)
+
+      return self._game_starts
+
+   def n_games(self):
+      return len(self.game_starts())
+
+   def game(self, i):
+      '''
+      Returns the i-th game in the file as a GameRecord
+      '''
+      starts = self.game_starts()
+      start = starts[i]
+      stop = starts[i + 1] if i + 1 < len(starts) else len(self.records)
+      records = np.asarray(self.records[start:stop])
+
+      a = records['a'].astype(np.int64)
+      b = records['b'].astype(np.int64)
+      codes = records['code']
+      kinds = codes >> 6
+
+      grid_size = int(a[0]) + 1
+      ships = [[] for _ in range(int(b[0]))]
+      ship_rows = np.flatnonzero(kinds == KIND_SHIP)
+      for first, second in zip(ship_rows[::2], ship_rows[1::2]):
+         ships[codes[first] & 0x3F].append(([int(a[first]), int(b[first])],
+                                            [int(a[second]), int(b[second])]))
+
+      shots = kinds == KIND_SHOT
+      loser = None
+      ends = np.flatnonzero(kinds == KIND_END)
+      if len(ends) and codes[ends[0]] & 0x3F != UNFINISHED:
+         loser = int(codes[ends[0]] & 0x3F)
+
+      return GameRecord(grid_size, ships, codes[shots] >> 3, a[shots], b[shots],
+                        codes[shots] & 7, loser)
+
+   def close(self):
+      #the file is unmapped once the last view of it is released
+      self.records = np.empty(0, dtype=self.dtype)
+      self._game_starts = None
+
+
+def _read_header(f):
+   '''
+   Returns (version, coord_bytes) from the header of an open record file
+   '''
+   data = f.read(HEADER.size)
+   if len(data) < HEADER.size:
+      raise ValueError('not a battleship record file')
+
+   magic, version, coord_bytes = HEADER.unpack(data)
+   if magic != MAGIC:
+      raise ValueError('not a battleship record file')
+   if version != VERSION:
+      raise ValueError(f'unsupported record version {version}')
+
+   return version, coord_bytes
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Incremental terminal renderer
+
+Classes:
+
+1. IncrementalTerminalView -- draws both boards once then only redraws changed cells
+
+Same role as BattleshipTerminalView but instead of reprinting both boards
+every turn the view keeps a cached frame.  Shots (Hit/Sunk/Miss events)
+mark cells dirty and on BoardsUpdated only the dirty cells whose character
+changed are redrawn using ANSI cursor moves.  Each frame is written to the
+stream with a single write() so large boards and fast AI vs AI spectating
+stay usable.
+
+"""
+
+import sys
+
+from classic_battleship import HIT, MISSED
+from events import BoardsUpdated, GameOver, Hit, Miss, OutOfBounds, Sunk
+
+#ANSI escape sequences
+CLEAR_SCREEN = '\x1b[2J'
+CLEAR_LINE = '\x1b[2K'
+
+
+def move_to(row, col):
+   '''
+   Returns the ANSI sequence moving the cursor to (1 based) row, col
+   '''
+   return f'\x1b[{row};{col}H'
+
+
+class IncrementalTerminalView(object):
+   """
+   Encapsulates an incrementally redrawn view of the Battleship game in
+   the Terminal
+
+   Screen layout (1 based rows):
+
+   ENEMY board header, blank line, grid_size rows
+   blank line
+   PLAYER board header, blank line, grid_size rows
+   blank line
+   status line
+   prompt line
+   """
+
+   def __init__(self, observable, stream=None):
+      '''
+      Keyword arguments:
+      observable -- the Game to view
+      stream -- file like object to draw on (default = None i.e. sys.stdout)
+      '''
+      self.stream = sys.stdout if stream is None else stream
+      self.frames = 0
+      self.cells_drawn = 0
+
+      self._frame = None
+      self._dirty = []
+      self._status = ''
+
+      observable.subscribe(Hit, self.on_shot)
+      observable.subscribe(Miss, self.on_shot)
+      observable.subscribe(Sunk, self.on_sunk)
+      observable.subscribe(OutOfBounds, self.on_out_bounds)
+      observable.subscribe(BoardsUpdated, self.on_boards_updated)
+      observable.subscribe(GameOver, self.on_game_over)
+
+   def on_shot(self, event):
+      symbol = HIT if type(event) is Hit else MISSED
+      self._dirty.append((event.board, event.coordinate, symbol))
+
+   def on_sunk(self, event):
+      self._status = 'Battleship sunk!'
+
+   def on_out_bounds(self, event):
+      self._status = 'Sector is out of game play bounds'
+
+   def on_game_over(self, event):
+      if event.player_won:
+         self._status = 'You sunk all my battleships!  You WIN!'
+      else:
+         self._status = 'The enemy has sunk all of your battleships. You lose!'
+
+      #draw the winning shot(s) made since the last BoardsUpdated
+      if self._frame is None:
+         self._write(self._status + '\n')
+      else:
+         self._draw_changes()
+
+   def on_boards_updated(self, event):
+      boards = (event.enemy_board, event.player_board)
+
+      if self._frame is None or self._frame['boards'] != boards:
+         self._draw_full(boards)
+      else:
+         self._draw_changes()
+
+   def _draw_full(self, boards):
+      '''
+      Draw both boards and cache the frame
+      '''
+      grid_size = boards[0].grid_size
+      label_width = max(len(str(grid_size - 1)), *(len(b.name) for b in boards)) + 1
+
+      frame = {'boards': boards, 'label_width': label_width, 'top': {},
+               'cells': {}}
+      lines = []
+
+      for board in boards:
+         frame['top'][id(board)] = len(lines) + 3
+         cells = [list(row) for row in board.board]
+         frame['cells'][id(board)] = cells
+
+         lines.append(board.name.ljust(label_width) + ' '.join(str(c % 10) for c in range(grid_size)))
+         lines.append('')
+         for row, symbols in enumerate(cells):
+            lines.append(str(row).ljust(label_width) + ' '.join(symbols))
+         lines.append('')
+
+      frame['status_row'] = len(lines) + 1
+      self._frame = frame
+      self._dirty = []
+      self.cells_drawn += 2 * grid_size * grid_size
+
+      self._write(CLEAR_SCREEN + move_to(1, 1) + '\n'.join(lines)
+                  + self._status_line() + self._prompt_line())
+
+   def _draw_changes(self):
+      '''
+      Redraw only the cells that changed since the last frame
+      '''
+      frame = self._frame
+      label_width = frame['label_width']
+      parts = []
+
+      for board, coordinate, symbol in self._dirty:
+         row, col = coordinate[0], coordinate[1]
+         cells = frame['cells'].get(id(board))
+         if cells is None or cells[row][col] == symbol:
+            continue
+
+         cells[row][col] = symbol
+         parts.append(move_to(frame['top'][id(board)] + row,
+                              label_width + 2 * col + 1) + symbol)
+
+      self.cells_drawn += len(parts)
+      self._dirty = []
+      self._write(''.join(parts) + self._status_line() + self._prompt_line())
+
+   def _status_line(self):
+      if self._frame is None:
+         return ''
+      status = self._status
+      self._status = ''
+      return move_to(self._frame['status_row'], 1) + CLEAR_LINE + status
+
+   def _prompt_line(self):
+      if self._frame is None:
+         return ''
+      return move_to(self._frame['status_row'] + 1, 1) + CLEAR_LINE
+
+   def _write(self, text):
+      self.frames += 1
+      self.stream.write(text)
+      self.stream.flush()
+
+   def display_title(self):
+      self._write('\nBATTLESHIP!\n')
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Replay recorded games and seek to any shot
+
+Classes:
+
+1. GameReplay -- rebuilds the GameBoards of a recorded game at shot k
+2. RecordedDeployEngine -- deploys a recorded fleet
+
+Shots are replayed straight onto GameBoards with missile_on_target,
+record_hit and record_miss so no events are published.  The game is
+replayed once when a GameReplay is created, keeping a snapshot of every
+board each snapshot_interval shots, so seeking to shot k restores the
+nearest earlier snapshot and replays fewer than snapshot_interval shots.
+
+e.g.
+
+reader = RecordReader('games.bsr')
+replay = GameReplay.from_record(reader.game(0), snapshot_interval=50)
+player_board, enemy_board = replay.seek(120)
+
+"""
+
+from classic_battleship import Battleship, GameBoard
+
+
+class RecordedDeployEngine(object):
+   """
+   Deploys a fixed fleet.  Same interface as RandomDeployEngine.
+   """
+
+   def __init__(self, ships):
+      '''
+      Keyword arguments:
+      ships -- list of ([row, col] start, [row, col] end) pairs
+      '''
+      self.ships = ships
+
+   def deploy(self):
+      return [Battleship(start, end) for start, end in self.ships]
+
+
+class GameReplay(object):
+   """
+   Reconstructs the state of every board in a recorded game after any
+   number of shots.
+
+   Key method is seek()
+   """
+
+   def __init__(self, grid_size, ships, shots, snapshot_interval=100,
+                verify=True):
+      '''
+      Keyword arguments:
+      grid_size -- boards are grid_size X grid_size
+      ships -- list with the recorded fleet of each board, a fleet is a
+      list of ([row, col] start, [row, col] end) pairs
+      shots -- sequence of (board index, [row, col], result)
+      snapshot_interval -- shots between snapshots (default = 100)
+      verify -- raise ValueError if a replayed shot does not have its
+      recorded result (default = True)
+
+      The whole game is replayed here to take the snapshots.
+      '''
+      if snapshot_interval < 1:
+         raise ValueError('snapshot_interval must be at least 1')
+
+      self.grid_size = grid_size
+      self.ships = ships
+      self.shots = list(shots)
+      self.snapshot_interval = snapshot_interval
+      self.verify = verify
+
+      #snapshots[i] is the state of every board after i * snapshot_interval shots
+      boards = self._new_boards()
+      self._snapshots = [self._snapshot(boards)]
+      for shot in range(len(self.shots)):
+         self._apply(boards, shot)
+         if (shot + 1) % snapshot_interval == 0:
+            self._snapshots.append(self._snapshot(boards))
+
+   @classmethod
+   def from_record(cls, record, snapshot_interval=100, verify=True):
+      '''
+      Create a GameReplay from a record.GameRecord
+      '''
+      shots = [record.shot(k) for k in range(len(record))]
+      return cls(record.grid_size, record.ships, shots, snapshot_interval,
+                 verify)
+
+   def __len__(self):
+      return len(self.shots)
+
+   def seek(self, k):
+      '''
+      Returns a list of GameBoards, one per board, in their state after
+      the first k shots.  The boards are new objects the caller may modify.
+
+      Keyword arguments:
+      k -- number of shots to replay, 0 <= k <= len(self)
+      '''
+      if not 0 <= k <= len(self.shots):
+         raise IndexError(f'shot {k} is outside the game (0 to {len(self.shots)})')
+
+      index = k // self.snapshot_interval
+      boards = self._restore(self._snapshots[index])
+
+      for shot in range(index * self.snapshot_interval, k):
+         self._apply(boards, shot)
+
+      return boards
+
+   def board(self, k, index):
+      '''
+      Returns board index in its state after the first k shots
+      '''
+      return self.seek(k)[index]
+
+   def _new_boards(self):
+      names = ('PLAYER', 'ENEMY') if len(self.ships) == 2 else \
+              [f'BOARD {i}' for i in range(len(self.ships))]
+
+      boards = []
+      for fleet, name in zip(self.ships, names):
+         board = GameBoard(self.grid_size, RecordedDeployEngine(fleet), name)
+         board.deploy_battleships()
+         boards.append(board)
+
+      return boards
+
+   def _apply(self, boards, k):
+      '''
+      Replay shot k onto boards
+      '''
+      index, coordinate, recorded = self.shots[k]
+
+      #out of bounds coordinates are not stored exactly and change nothing
+      if recorded == 'out_bounds':
+         return
+
+      board = boards[index]
+      hit, sunk = board.missile_on_target(coordinate)
+
+      if hit:
+         board.record_hit(coordinate)
+         result = 'sunk' if sunk else 'hit'
+      elif board.previously_targetted(coordinate):
+         result = 'gone'
+      else:
+         board.record_miss(coordinate)
+         result = 'miss'
+
+      if self.verify and result != recorded:
+         raise ValueError(f'shot {k} at {coordinate} on board {index} '
+                          f'replayed as {result} but was recorded as {recorded}')
+
+   def _snapshot(self, boards):
+      '''
+      Returns a copy of the state of boards that _restore() can rebuild
+      '''
+      return [board.snapshot() for board in boards]
+
+   def _restore(self, snapshot):
+      '''
+      Returns new GameBoards in the state captured by snapshot
+      '''
+      boards = self._new_boards()
+
+      for board, state in zip(boards, snapshot):
+         board.restore(state)
+
+      return boards
@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Stream fleet layouts consistent with a partly revealed board
+
+Classes:
+
+1. LayoutSampler -- many Markov chains over consistent layouts, advanced in lockstep with NumPy
+
+Functions:
+
+1. sample_layouts -- generator of layouts from independently seeded samplers in a process pool
+2. initial_layout -- one consistent layout by randomized backtracking
+3. cell_words -- cells as multiword uint64 bitmasks
+
+Drawing whole fleets with RandomDeployEngine and rejecting those that
+disagree with the hits and misses needs exponentially many draws as the
+game goes on.  Instead layouts are drawn ship by ship the way
+RandomDeployEngine deploys a fleet, but only from each ship's legal
+placements (Position.legal_placements) that do not overlap the ships
+already drawn, favouring placements through hits not yet covered.  The
+chains of a LayoutSampler start from such draws resampled by importance
+weight and then take Metropolis-Hastings steps that keep them consistent:
+
+single ship move -- one ship proposes a placement drawn uniformly from its
+legal placements
+pair move -- two ships propose new placements at once, so a hit can be
+handed from one ship to another
+redeploy move -- a whole new layout drawn ship by ship, accepted with
+probability min(1, q(old) / q(new)) where q is the probability of drawing
+a layout, so a chain can jump between groups of layouts that differ in
+which ships cover the hits
+
+A move is rejected if the ships overlap or a hit is left uncovered.  The
+chains converge to the uniform distribution over consistent layouts, the
+distribution solver.py assumes.  Every chain of a sampler takes the same
+kind of step at the same time so a step is a handful of NumPy operations
+on arrays of uint64 bitmasks with one entry per chain.  If no draw is
+consistent the chains start from layouts found by initial_layout(), a
+backtracking search like RandomDeployEngine.deploy_placements().
+
+Consecutive sweeps of a chain are correlated; use thin to keep every
+thin-th sweep.  Layouts are (n_layouts, n_ships) arrays of placement ids,
+ship i in the order of Position.ships() and its id in
+placement_index(grid_size, size).
+
+e.g.
+
+position = Position(10, [5, 4, 3, 3, 2], misses=[0, 1, 2], hits=[44, 45])
+for layouts in sample_layouts(position, 10 ** 7, seed=42):
+   ...
+
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from placements import placement_index
+from seeding import make_generator, make_rng, seed_sequence
+from solver import Position
+
+#distinct layouts from initial_layout() shared out between the chains of a
+#sampler when none of its first draws is consistent
+DEFAULT_STARTS = 32
+
+#layouts whose options are worked out at once by LayoutSampler._options
+OPTIONS_BLOCK = 256
+
+#sweeps between the redeploy moves of a chain
+DEFAULT_REDEPLOY_EVERY = 64
+
+
+def initial_layout(position, rng=None, max_backtracks=10000):
+   '''
+   Returns a list of placement ids, one per ship of position.ships(), of a
+   fleet layout consistent with position.  Raises ValueError if there is
+   none or max_backtracks is exceeded.
+
+   Ships are placed in turn, each at a random legal placement that does
+   not overlap those already placed, preferring placements through hits
+   not yet covered.  The search backtracks when the hits left uncovered
+   need more cells than the remaining ships have.
+
+   Keyword arguments:
+   position -- solver.Position
+   rng -- random.Random (or any seed accepted by seeding.make_rng)
+   (default = None)
+   max_backtracks -- give up after this many backtracks (default = 10000)
+   '''
+   rng = make_rng(rng)
+   ships = position.ships()
+   n = position.grid_size
+   hits = 0
+   for cell in position.hits:
+      hits |= 1 << cell
+
+   candidates = []
+   for size, sunk in ships:
+      index = placement_index(n, size)
+      legal = position.legal_placements(size, sunk).tolist()
+      if not legal:
+         raise ValueError('no fleet configuration is consistent with the position')
+      candidates.append([(p, index.mask(p)) for p in legal])
+
+   #cells in the ships still to place at each depth
+   remaining = [sum(size for size, _ in ships[depth:]) for depth in range(len(ships) + 1)]
+   chosen = []
+   backtracks = 0
+
+   def place(depth, occupied):
+      nonlocal backtracks
+      uncovered = hits & ~occupied
+      if depth == len(ships):
+         return uncovered == 0
+      if bin(uncovered).count('1') > remaining[depth]:
+         return False
+
+      options = [(p, mask) for p, mask in candidates[depth] if not mask & occupied]
+      rng.shuffle(options)
+      options.sort(key=lambda option: not option[1] & uncovered)
+
+      for p, mask in options:
+         chosen.append(p)
+         if place(depth + 1, occupied | mask):
+            return True
+         chosen.pop()
+         backtracks += 1
+         if backtracks > max_backtracks:
+            raise ValueError(f'Gave up finding a consistent layout after '
+                             f'{max_backtracks} backtracks')
+      return False
+
+   if not place(0, 0):
+      raise ValueError('no fleet configuration is consistent with the position')
+
+   return chosen
+
+
+class LayoutSampler(object):
+   """
+   chains Markov chains over the fleet layouts consistent with a
+   Position, advanced together.
+
+   Key method is samples()
+   """
+
+   def __init__(self, position, chains=8192, rng=None,
+                redeploy_every=DEFAULT_REDEPLOY_EVERY, hit_mix=0.5):
+      '''
+      Keyword arguments:
+      position -- solver.Position
+      chains -- number of chains (default = 8192)
+      rng -- numpy.random.Generator (or any seed accepted by
+      seeding.make_generator) (default = None)
+      redeploy_every -- each chain makes a redeploy move once every
+      redeploy_every sweeps, 0 = never (default = DEFAULT_REDEPLOY_EVERY)
+      hit_mix -- probability a drawn ship is placed through a hit not yet
+      covered, if it can be (default = 0.5)
+      '''
+      self.position = position
+      self.chains = chains
+      self.rng = make_generator(rng)
+      self.redeploy_every = redeploy_every
+      self.hit_mix = hit_mix
+      self.ships = position.ships()
+
+      n_cells = position.grid_size * position.grid_size
+      self.n_words = (n_cells + 63) // 64
+
+      #legal placement ids of each ship and, per word, their cells as uint64 bitmasks
+      self.legal = []
+      self.masks = []
+      for size, sunk in self.ships:
+         index = placement_index(position.grid_size, size)
+         legal = position.legal_placements(size, sunk)
+         if len(legal) == 0:
+            raise ValueError('no fleet configuration is consistent with the position')
+         cells = index.cell_table[legal]
+         self.legal.append(legal.astype(np.uint16 if len(index) <= 1 << 16 else np.int64))
+         self.masks.append(list(cell_words(cells, self.n_words)))
+
+      self.hits = cell_words(np.array([sorted(position.hits)]), self.n_words)[:, 0]
+      self._dtype = np.uint16 if max(len(legal) for legal in self.legal) <= 1 << 16 else np.int64
+
+      #state[i, c] is the index into self.legal[i] of ship i in chain c
+      self.state = self._starts()
+
+      #occupied[w] is word w of the cells occupied in every chain
+      self.occupied = self._occupied(self.state)
+
+      self.proposed = 0
+      self.accepted = 0
+      self.redeploys_proposed = 0
+      self.redeploys_accepted = 0
+      self._sweeps = 0
+
+   def sweep(self):
+      '''
+      Advance every chain by one sweep: a single ship move for each ship
+      in turn, a pair move for a random pair of ships and a redeploy move
+      for the next block of chains // redeploy_every chains
+      '''
+      n_ships = len(self.ships)
+      for i in range(n_ships):
+         self._move((i,))
+      if n_ships > 1:
+         pair = self.rng.choice(n_ships, size=2, replace=False)
+         self._move(tuple(int(i) for i in pair))
+
+      if self.redeploy_every:
+         size = -(-self.chains // self.redeploy_every)
+         start = self._sweeps % self.redeploy_every * size
+         if start < self.chains:
+            self._redeploy(slice(start, start + size))
+      self._sweeps += 1
+
+   def run(self, sweeps):
+      '''
+      Advance every chain by sweeps sweeps without keeping the layouts
+      e.g. to burn in
+      '''
+      for _ in range(sweeps):
+         self.sweep()
+
+   def samples(self, sweeps=None, thin=1):
+      '''
+      Generator of (chains, n_ships) arrays of placement ids: the layout of
+      every chain after each thin sweeps
+
+      Keyword arguments:
+      sweeps -- number of arrays to yield (default = None i.e. forever)
+      thin -- sweeps between arrays (default = 1)
+      '''
+      taken = 0
+      while sweeps is None or taken < sweeps:
+         self.run(thin)
+         taken += 1
+         yield self.layouts()
+
+   def layouts(self):
+      '''
+      Returns the current layouts as a (chains, n_ships) array of placement ids
+      '''
+      return np.stack([legal.take(state) for legal, state in zip(self.legal, self.state)],
+                      axis=1)
+
+   def acceptance_rate(self):
+      '''
+      Returns the fractions of ship moves and of redeploy moves accepted
+      '''
+      return (self.accepted / self.proposed if self.proposed else 0.0,
+              self.redeploys_accepted / self.redeploys_proposed
+              if self.redeploys_proposed else 0.0)
+
+   def occupancy(self, layouts):
+      '''
+      Returns a (len(layouts), grid_size * grid_size) bool array of the
+      cells occupied in each layout
+
+      Keyword arguments:
+      layouts -- (n_layouts, n_ships) placement ids as yielded by samples()
+      '''
+      n = self.position.grid_size
+      occupied = np.zeros((len(layouts), n * n), dtype=bool)
+      rows = np.arange(len(layouts))[:, None]
+      for i, (size, _) in enumerate(self.ships):
+         occupied[rows, placement_index(n, size).cell_table[layouts[:, i]]] = True
+      return occupied
+
+   def _starts(self):
+      '''
+      Returns the starting state of every chain: layouts drawn by _draw()
+      resampled in proportion to 1 / (probability of drawing them), or if
+      none of the draws is consistent, layouts found by initial_layout()
+      '''
+      state, consistent, log_q, _ = self._draw(self.chains)
+
+      if consistent.any():
+         weights = np.exp(np.where(consistent, log_q.min() - log_q, -np.inf))
+         chosen = self.rng.choice(self.chains, self.chains, p=weights / weights.sum())
+         return state[:, chosen]
+
+      py_rng = make_rng(seed_sequence(self.rng))
+      layouts = [initial_layout(self.position, py_rng)
+                 for _ in range(min(DEFAULT_STARTS, self.chains))]
+      start = np.array([np.searchsorted(legal, placements)
+                        for legal, placements in zip(self.legal, zip(*layouts))],
+                       dtype=self._dtype)
+      return start[:, np.arange(self.chains) % len(layouts)]
+
+   def _occupied(self, state):
+      occupied = [np.zeros(state.shape[1], dtype=np.uint64) for _ in range(self.n_words)]
+      for masks, placements in zip(self.masks, state):
+         for word, mask in zip(occupied, masks):
+            word |= mask.take(placements)
+      return occupied
+
+   def _move(self, ships):
+      '''
+      Metropolis step of every chain in which the given ships propose new
+      placements together
+      '''
+      chains = self.chains
+      state = self.state
+      proposals = [self.rng.integers(0, len(self.legal[i]), chains, dtype=self._dtype)
+                   for i in ships]
+
+      ok = np.ones(chains, dtype=bool)
+      new = []
+      for w, occupied in enumerate(self.occupied):
+         #take the moving ships off the board (ships never overlap so xor removes them)
+         word = occupied.copy()
+         for i in ships:
+            word ^= self.masks[i][w].take(state[i])
+
+         for i, proposal in zip(ships, proposals):
+            mask = self.masks[i][w].take(proposal)
+            ok &= (word & mask) == 0
+            word |= mask
+
+         if self.hits[w]:
+            ok &= (word & self.hits[w]) == self.hits[w]
+         new.append(word)
+
+      self.occupied = [np.where(ok, word, occupied)
+                       for word, occupied in zip(new, self.occupied)]
+      for i, proposal in zip(ships, proposals):
+         state[i] = np.where(ok, proposal, state[i])
+
+      self.proposed += chains
+      self.accepted += int(np.count_nonzero(ok))
+
+   def _redeploy(self, block):
+      '''
+      Metropolis-Hastings step of a block of chains that proposes a whole
+      new layout drawn by _draw()
+      '''
+      state = self.state[:, block]
+      proposal, ok, log_q, log_q_old = self._draw(state.shape[1], state)
+      ok &= np.log(self.rng.random(len(ok))) < log_q_old - log_q
+
+      state = np.where(ok, proposal, state)
+      self.state[:, block] = state
+      for word, new in zip(self.occupied, self._occupied(state)):
+         word[block] = new
+
+      self.redeploys_proposed += len(ok)
+      self.redeploys_accepted += int(np.count_nonzero(ok))
+
+   def _draw(self, n, old=None):
+      '''
+      Draw n layouts ship by ship.  Each ship is drawn from its legal
+      placements that do not overlap the ships already drawn: with
+      probability hit_mix uniformly from those through a hit not yet
+      covered (if there are any), otherwise uniformly from all of them.
+
+      Returns (state, consistent, log_q, log_q_old): the layouts as
+      indexes into self.legal, whether each covers every hit, the log
+      probability of drawing each and, if old layouts are given, the log
+      probability of drawing those.
+      '''
+      rng = self.rng
+      state = np.zeros((len(self.ships), n), dtype=self._dtype)
+      occupied = [np.zeros(n, dtype=np.uint64) for _ in range(self.n_words)]
+      old_occupied = [np.zeros(n, dtype=np.uint64) for _ in range(self.n_words)]
+      consistent = np.ones(n, dtype=bool)
+      log_q = np.zeros(n)
+      log_q_old = np.zeros(n) if old is not None else None
+
+      for i, masks in enumerate(self.masks):
+         available, targets = self._options(masks, occupied)
+         n_available = available.sum(axis=1)
+         n_targets = targets.sum(axis=1)
+         mix = np.where(n_targets > 0, self.hit_mix, 0.0)
+
+         from_targets = rng.random(n) < mix
+         options = np.where(from_targets[:, None], targets, available)
+         counts = np.where(from_targets, n_targets, n_available)
+         consistent &= counts > 0
+
+         #the draw-th option of each layout
+         draw = (rng.random(n) * counts).astype(np.int64)
+         pick = np.minimum((np.cumsum(options, axis=1, dtype=np.int32) <= draw[:, None]).sum(axis=1),
+                           len(masks[0]) - 1)
+         state[i] = pick
+         log_q += _log_q(pick, n_available, targets, n_targets, mix)
+
+         for word, mask in zip(occupied, masks):
+            word |= mask.take(pick)
+
+         if old is not None:
+            available, targets = self._options(masks, old_occupied)
+            n_targets = targets.sum(axis=1)
+            log_q_old += _log_q(old[i], available.sum(axis=1), targets, n_targets,
+                                np.where(n_targets > 0, self.hit_mix, 0.0))
+            for word, mask in zip(old_occupied, masks):
+               word |= mask.take(old[i])
+
+      for word, hits in zip(occupied, self.hits):
+         consistent &= (word & hits) == hits
+
+      return state, consistent, log_q, log_q_old
+
+   def _options(self, masks, occupied):
+      '''
+      Returns (available, targets) (layouts, legal) bool arrays: the legal
+      placements of a ship that do not overlap occupied, and those of them
+      covering a hit occupied leaves uncovered
+      '''
+      n = len(occupied[0])
+      available = np.empty((n, len(masks[0])), dtype=bool)
+      targets = np.empty_like(available)
+
+      #a block of rows at a time so the uint64 temporaries stay in cache
+      for start in range(0, n, OPTIONS_BLOCK):
+         rows = slice(start, start + OPTIONS_BLOCK)
+         overlap = None
+         for mask, word, hits in zip(masks, occupied, self.hits):
+            word = word[rows, None]
+            if overlap is None:
+               overlap = word & mask
+               cover = (hits & ~word) & mask
+            else:
+               overlap |= word & mask
+               cover |= (hits & ~word) & mask
+         np.equal(overlap, 0, out=available[rows])
+         np.not_equal(cover, 0, out=targets[rows])
+         targets[rows] &= available[rows]
+
+      return available, targets
+
+
+def sample_layouts(position, n_layouts=None, workers=None, seed=None,
+                   chains=8192, burn_in=16, thin=1, task_sweeps=128):
+   '''
+   Generator of (n, n_ships) arrays of placement ids of layouts consistent
+   with position, sampled in a process pool.  Arrays are yielded in the
+   order the tasks were submitted, so the same seed always gives the
+   same layouts whatever the number of workers.
+
+   Each task builds a LayoutSampler with its own seed spawned from seed,
+   burns it in and returns chains * task_sweeps layouts.
+
+   Keyword arguments:
+   position -- solver.Position
+   n_layouts -- stop after this many layouts (default = None i.e. never)
+   workers -- number of worker processes (default = None i.e. one per
+   CPU, 0 = sample in this process)
+   seed -- root seed, any seed accepted by seeding.seed_sequence
+   (default = None)
+   chains -- chains per task (default = 8192)
+   burn_in -- sweeps discarded at the start of each task (default = 16)
+   thin -- sweeps between kept layouts (default = 1)
+   task_sweeps -- kept sweeps per task (default = 128)
+   '''
+   #a child of seed of our own, so the tasks never repeat the streams of
+   #children the caller spawns from it
+   root = seed_sequence(seed).spawn(1)[0]
+
+   def tasks():
+      while True:
+         yield (position, root.spawn(1)[0], chains, burn_in, thin, task_sweeps)
+
+   if workers == 0:
+      yield from _take((_sample_task(*task) for task in tasks()), n_layouts)
+      return
+
+   with ProcessPoolExecutor(max_workers=workers) as executor:
+      in_flight = 2 * (workers or os.cpu_count() or 1)
+      pending = deque()
+      try:
+         def results():
+            for task in tasks():
+               pending.append(executor.submit(_sample_task, *task))
+               if len(pending) >= in_flight:
+                  yield pending.popleft().result()
+
+         yield from _take(results(), n_layouts)
+      finally:
+         for future in pending:
+            future.cancel()
+
+
+def _take(results, n_layouts):
+   '''
+   Yields arrays from results until n_layouts rows have been yielded
+   '''
+   remaining = n_layouts
+   for layouts in results:
+      if remaining is not None:
+         layouts = layouts[:remaining]
+         remaining -= len(layouts)
+      yield layouts
+      if remaining == 0:
+         return
+
+
+def _sample_task(position, seed, chains, burn_in, thin, sweeps):
+   '''
+   Returns chains * sweeps layouts from a new LayoutSampler.  Runs in a
+   worker process.
+   '''
+   sampler = LayoutSampler(position, chains, seed)
+   sampler.run(burn_in)
+   return np.concatenate(list(sampler.samples(sweeps, thin)))
+
+
+def _log_q(pick, n_available, targets, n_targets, mix):
+   '''
+   Returns the log probability a redeploy drew option pick of each chain
+   '''
+   rows = np.arange(len(pick))
+   q = (1.0 - mix) / np.maximum(n_available, 1)
+   q = q + targets[rows, pick] * mix / np.maximum(n_targets, 1)
+   with np.errstate(divide='ignore'):
+      return np.log(q)
+
+
+def cell_words(cells, n_words):
+   '''
+   Returns the cells in each row of a 2D int array as an
+   (n_words, rows) array of uint64 bitmasks, least significant word first:
+   cell c is bit c % 64 of word c // 64
+
+   Keyword arguments:
+   cells -- 2D array like of cell numbers row * grid_size + col, one
+   layout, ship or placement per row
+   n_words -- words per bitmask, at least (grid_size ** 2 + 63) // 64
+   '''
+   cells = np.asarray(cells, dtype=np.int64)
+   words = np.zeros((n_words, len(cells)), dtype=np.uint64)
+   columns = np.broadcast_to(np.arange(len(cells))[:, None], cells.shape)
+   np.bitwise_or.at(words, (cells >> 6, columns),
+                    np.left_shift(np.uint64(1), (cells & 63).astype(np.uint64)))
+   return words
+
+
+if __name__ == "__main__":
+
+   import time
+
+   from classic_battleship import GameBoard, RandomDeployEngine
+   from solver import solve_exact
+   from targeting import ProbabilityTargetController
+
+   board = GameBoard(10, RandomDeployEngine([5, 4, 3, 3, 2], 10, 7))
+   board.deploy_battleships()
+   controller = ProbabilityTargetController.from_board(board, 7)
+
+   #play 20 shots then sample layouts of the position
+   for _ in range(20):
+      coordinate = controller.select_target()
+      hit, sunk = board.missile_on_target(coordinate)
+      if hit:
+         board.record_hit(coordinate)
+      else:
+         board.record_miss(coordinate)
+      controller.record_result(coordinate, 'sunk' if sunk else 'hit' if hit else 'miss',
+                               board.last_sunk_size if sunk else None)
+
+   position = Position.from_board(board)
+
+   sampler = LayoutSampler(position, rng=42)
+   sampler.run(16)
+   start = time.perf_counter()
+   layouts = np.concatenate(list(sampler.samples(128)))
+   elapsed = time.perf_counter() - start
+   moves, redeploys = sampler.acceptance_rate()
+   print(f'one process: {len(layouts) / elapsed:,.0f} layouts/s, '
+         f'acceptance {moves:.3f} (redeploys {redeploys:.3f})')
+
+   estimate = sampler.occupancy(layouts).mean(axis=0)
+   exact = solve_exact(position).probabilities.ravel()
+   print(f'largest difference from exact probabilities: {np.abs(estimate - exact).max():.4f}')
+
+   start = time.perf_counter()
+   total = sum(len(layouts) for layouts in sample_layouts(position, 10 ** 7, seed=42))
+   elapsed = time.perf_counter() - start
+   print(f'process pool: {total:,} layouts in {elapsed:.2f}s '
+         f'({total / elapsed:,.0f} layouts/s)')
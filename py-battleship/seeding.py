@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Seedable random number generators for every random component
+
+Functions:
+
+1. make_rng -- random.Random from a seed, Random, numpy Generator or SeedSequence
+2. make_generator -- numpy.random.Generator from the same inputs
+3. seed_sequence -- numpy SeedSequence from the same inputs
+4. spawn -- n independent child SeedSequences (e.g. one per worker)
+
+Engines and controllers accept any of
+
+None -- fresh entropy from the operating system
+int -- a seed
+random.Random -- used as is (or drawn from to seed a Generator)
+numpy.random.Generator -- used as is (or drawn from to seed a Random)
+numpy.random.SeedSequence -- e.g. a child returned by spawn()
+
+so a benchmark can be replayed exactly shot for shot and split across
+workers without correlated streams.
+
+"""
+
+from random import Random
+
+import numpy as np
+from numpy.random import Generator, SeedSequence, default_rng
+
+
+def seed_sequence(seed=None):
+   '''
+   Returns a numpy SeedSequence
+
+   Keyword arguments:
+   seed -- None, int, random.Random, numpy Generator or SeedSequence
+   '''
+   if isinstance(seed, SeedSequence):
+      return seed
+   if isinstance(seed, Random):
+      return SeedSequence(seed.getrandbits(128))
+   if isinstance(seed, Generator):
+      return SeedSequence(seed.integers(0, 2**63, size=2).tolist())
+   return SeedSequence(seed)
+
+
+def make_rng(seed=None):
+   '''
+   Returns a random.Random
+
+   Keyword arguments:
+   seed -- None, int, random.Random, numpy Generator or SeedSequence
+   '''
+   if isinstance(seed, Random):
+      return seed
+   if seed is None or isinstance(seed, int):
+      return Random(seed)
+
+   state = seed_sequence(seed).generate_state(2, dtype=np.uint64)
+   return Random(int(state[0]) << 64 | int(state[1]))
+
+
+def make_generator(seed=None):
+   '''
+   Returns a numpy.random.Generator
+
+   Keyword arguments:
+   seed -- None, int, random.Random, numpy Generator or SeedSequence
+   '''
+   if isinstance(seed, Generator):
+      return seed
+   if isinstance(seed, Random):
+      return default_rng(seed.getrandbits(64))
+   return default_rng(seed)
+
+
+def spawn(seed, n):
+   '''
+   Returns a list of n independent child SeedSequences
+
+   Keyword arguments:
+   seed -- None, int, random.Random, numpy Generator or SeedSequence
+   n -- number of children
+   '''
+   return seed_sequence(seed).spawn(n)
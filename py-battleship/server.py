@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Asyncio battleship game server
+
+Classes:
+
+1. NetworkTargetController -- async target controller reading moves from a TCP client
+2. BattleshipServer -- hosts one Game per connection, each match is a coroutine
+
+Functions:
+
+1. play_async -- async equivalent of Game.play() for controllers whose
+   select_target() may be a coroutine
+
+A single process can host thousands of concurrent, mostly idle, matches
+because a match waiting for its player's move is just a suspended
+coroutine.
+
+Line protocol (UTF-8, one message per line)
+
+server: READY <grid_size> <ship sizes comma separated>
+server: TURN                       -- waiting for the player's move
+client: <row>,<col>
+server: RESULT <result>            -- hit, sunk, out_bounds, gone or miss
+server: ENEMY <row>,<col> <result> -- the computer's shot at the player
+server: ERROR <message>            -- the move could not be parsed, send again
+server: GAMEOVER WIN|LOSE
+
+"""
+
+import asyncio
+import inspect
+
+from classic_battleship import (GameBoard, Game, RandomDeployEngine,
+                                RandomTargetController, parse_coordinate)
+from seeding import make_rng, seed_sequence
+
+#longest line, in bytes, accepted from a client
+MAX_LINE = 1024
+
+
+async def play_async(game, player_target_controller, enemy_target_controller):
+   '''
+   Async version of Game.play().  The player and the enemy take turns
+   until one fleet is sunk.  select_target() may return a coroutine.
+
+   Returns True if the player won.
+
+   Keyword arguments:
+   game -- a Game with deployed boards
+   player_target_controller -- targets the enemy board
+   enemy_target_controller -- targets the player board
+   '''
+   turns = ((game.enemy_board, player_target_controller),
+            (game.player_board, enemy_target_controller))
+
+   while True:
+      for board, controller in turns:
+         coordinate = controller.select_target()
+         if inspect.isawaitable(coordinate):
+            coordinate = await coordinate
+
+         result, sunk_size = game.resolve_shot(board, coordinate)
+         controller.record_result(coordinate, result, sunk_size)
+         game.end_turn()
+
+         if board.battleships_remaining() == 0:
+            game._display_winner()
+            game.flush_events()
+            return board is game.enemy_board
+
+
+class NetworkTargetController(object):
+   """
+   Selects targets from moves sent by a client over a
+   (StreamReader, StreamWriter) pair.  Same interface as
+   UserTargetController except select_target() is a coroutine.
+   """
+
+   def __init__(self, reader, writer, timeout=None):
+      '''
+      Keyword arguments:
+      reader -- asyncio.StreamReader
+      writer -- asyncio.StreamWriter
+      timeout -- seconds to wait for a move before giving up
+      (default = None i.e. wait forever)
+      '''
+      self.reader = reader
+      self.writer = writer
+      self.timeout = timeout
+
+   async def select_target(self):
+      '''
+      Prompt the client for a move and return it as [row, col].
+      Raises ConnectionError if the client disconnects or sends a line
+      longer than the reader's limit.
+      '''
+      self.send('TURN')
+
+      while True:
+         await self.drain()
+         try:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+         except (ValueError, asyncio.LimitOverrunError) as error:
+            raise ConnectionError('client sent a line that is too long') from error
+         if not line:
+            raise ConnectionError('client disconnected')
+
+         try:
+            return parse_coordinate(line.decode().strip())
+         except ValueError:
+            self.send('ERROR expected row,col')
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      self.send(f'RESULT {result}')
+
+   def send(self, message):
+      self.writer.write(message.encode() + b'\n')
+
+   async def drain(self):
+      '''
+      Wait until the messages sent are below the writer's buffer limit, so
+      a slow client cannot make the buffer grow without bound
+      '''
+      await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+
+class _EnemyReporter(object):
+   """
+   Wraps the computer's target controller so the client is told about
+   every shot at its own board
+   """
+
+   def __init__(self, controller, player):
+      self.controller = controller
+      self.player = player
+
+   def select_target(self):
+      return self.controller.select_target()
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      self.controller.record_result(coordinate, result, sunk_size)
+      self.player.send(f'ENEMY {coordinate[0]},{coordinate[1]} {result}')
+
+
+class BattleshipServer(object):
+   """
+   Hosts a player vs computer match for every TCP connection.
+
+   Key methods are start() and serve_forever()
+   """
+
+   def __init__(self, host='127.0.0.1', port=8765, grid_size=10,
+                ship_sizes=(5, 4, 3, 3, 2),
+                enemy_controller=RandomTargetController.from_board,
+                seed=None, move_timeout=300):
+      '''
+      Keyword arguments:
+      host -- interface to listen on (default = localhost)
+      port -- TCP port (default = 8765, 0 = any free port)
+      grid_size -- boards are grid_size X grid_size (default = 10)
+      ship_sizes -- sizes of the ships in each fleet
+      enemy_controller -- factory for the computer's target controller
+      seed -- any seed accepted by seeding.seed_sequence (default = None)
+      move_timeout -- seconds a player may take over a move before the
+      match is abandoned (default = 300)
+      '''
+      self.host = host
+      self.port = port
+      self.grid_size = grid_size
+      self.ship_sizes = list(ship_sizes)
+      self.enemy_controller = enemy_controller
+      self.move_timeout = move_timeout
+      self.seed_sequence = seed_sequence(seed)
+
+      self.active = 0
+      self.peak_active = 0
+      self.completed = 0
+      self.abandoned = 0
+      self._server = None
+
+   async def start(self):
+      '''
+      Start listening.  Returns the asyncio.Server
+      '''
+      self._server = await asyncio.start_server(self.handle_client,
+                                                self.host, self.port,
+                                                limit=MAX_LINE, backlog=4096)
+      self.port = self._server.sockets[0].getsockname()[1]
+      return self._server
+
+   async def serve_forever(self):
+      if self._server is None:
+         await self.start()
+      async with self._server:
+         await self._server.serve_forever()
+
+   def new_game(self):
+      '''
+      Returns a Game with freshly deployed boards for a match.  Each match
+      draws from its own stream spawned from the server's seed.
+      '''
+      rng = make_rng(self.seed_sequence.spawn(1)[0])
+      player_board = GameBoard(self.grid_size,
+                               RandomDeployEngine(self.ship_sizes, self.grid_size, rng))
+      enemy_board = GameBoard(self.grid_size,
+                              RandomDeployEngine(self.ship_sizes, self.grid_size, rng),
+                              name='ENEMY')
+      game = Game(player_board, enemy_board)
+      player_board.deploy_battleships()
+      enemy_board.deploy_battleships()
+      return game, rng
+
+   async def handle_client(self, reader, writer):
+      '''
+      Play one match against the client connected on reader, writer
+      '''
+      self.active += 1
+      self.peak_active = max(self.peak_active, self.active)
+
+      game, rng = self.new_game()
+      player = NetworkTargetController(reader, writer, self.move_timeout)
+      enemy = _EnemyReporter(self.enemy_controller(game.player_board, rng), player)
+
+      try:
+         sizes = ','.join(str(size) for size in self.ship_sizes)
+         player.send(f'READY {self.grid_size} {sizes}')
+
+         player_won = await play_async(game, player, enemy)
+
+         player.send('GAMEOVER WIN' if player_won else 'GAMEOVER LOSE')
+         await player.drain()
+         self.completed += 1
+      except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+              asyncio.LimitOverrunError):
+         self.abandoned += 1
+      finally:
+         self.active -= 1
+         writer.close()
+
+
+if __name__ == "__main__":
+
+   server = BattleshipServer()
+   print(f'Battleship server listening on {server.host}:{server.port}')
+   asyncio.run(server.serve_forever())
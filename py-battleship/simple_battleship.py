@@ -8,9 +8,18 @@ Simplfications
 1. One player game - its just you and limited ammo
 2. Battleships are limited to 1x1 
 
+Classes:
+
+1. SimpleGame -- a board, its battleships and the missiles fired, with no module level state
+
+Battleships are held in a set of (row, col) tuples so checking a target
+and removing a sunk battleship are O(1).  They are deployed by sampling
+cells without replacement so boards with 10^6 cells and 10^5 battleships
+deploy in one pass without collisions.
+
 """
 
-from random import randint
+from seeding import make_rng
 
 UNKNOWN = 'O'
 MISSED = 'X'
@@ -36,33 +45,113 @@ def setup_board(grid_size):
    return board
         
    
-def random_deployment(grid_size):
+def random_deployment(grid_size, rng=None):
    """1
    Returns a uniformly distributed random number
    between 0 and grid_size - 1 representing a deployment of a Battleship
+   
+   Keyword arguments:
+   grid_size -- size of the nXn game playing board
+   rng -- random.Random (or any seed accepted by seeding.make_rng)
    """
-   return randint(0, grid_size - 1)
+   return make_rng(rng).randint(0, grid_size - 1)
 
 
-def deploy_battleships(grid_size, n):
+def deploy_battleships(grid_size, n, rng=None):
    """
    Randomly allocates n 1X1 battleships to a grid_size x grid_size grid of ocean sectors.
    There is no overlapping of battleships.
+   
+   Returns a set of (row, col) tuples.  The sectors are sampled without 
+   replacement so no deployment is ever retried.  Raises ValueError if n 
+   is larger than the number of sectors.
+   
+   Keyword arguments:
+   grid_size -- size of the nXn game playing board
+   n -- number of battleships
+   rng -- random.Random (or any seed accepted by seeding.make_rng)
    """
+   if n > grid_size * grid_size:
+      raise ValueError(f'Cannot deploy {n} battleships on a {grid_size} X {grid_size} board')
    
-   battleships = []
-   for battleship in range(n):
-      while True:
-         bs_row = random_deployment(grid_size)
-         bs_col = random_deployment(grid_size)
-         
-         if([bs_row, bs_col] not in battleships):
-            battleships.append([bs_row, bs_col])
-            break
-      
-   return battleships
+   cells = make_rng(rng).sample(range(grid_size * grid_size), n)
+   return {divmod(cell, grid_size) for cell in cells}
 
 
+def fire_missile(board, battleships, coordinate):
+   '''
+   Resolve a missile fired at coordinate.  Updates board and battleships.
+   
+   Returns 'sunk', 'out_bounds', 'gone' (already targeted) or 'miss'
+   
+   Keyword arguments:
+   board -- a list of lists.  Each list is a row on the board.
+   battleships -- set of (row, col) locations of the battleships afloat
+   coordinate -- list with 2 items [row, col]
+   '''
+   if missile_on_target(battleships, coordinate):
+      record_hit(board, coordinate, battleships)
+      return 'sunk'
+   
+   if missile_out_of_bounds(coordinate, len(board)):
+      return 'out_bounds'
+   
+   if previously_targetted(board, coordinate):
+      return 'gone'
+   
+   record_miss(board, coordinate)
+   return 'miss'
+
+
+class SimpleGame(object):
+   """
+   A one player game: a grid_size X grid_size board, the battleships 
+   still afloat and the missiles fired.  All state is held by the 
+   instance so games can be created and played side by side.
+   
+   Key method is fire()
+   """
+   
+   def __init__(self, grid_size, n_battleships, missiles=None, rng=None):
+      '''
+      Keyword arguments:
+      grid_size -- size of the nXn game playing board
+      n_battleships -- number of 1X1 battleships to deploy
+      missiles -- the number of missiles available (default = None i.e. 
+      unlimited)
+      rng -- random.Random (or any seed accepted by seeding.make_rng)
+      '''
+      self.grid_size = grid_size
+      self.board = setup_board(grid_size)
+      self.battleships = deploy_battleships(grid_size, n_battleships, rng)
+      self.missiles = missiles
+      self.fired = 0
+   
+   def fire(self, coordinate):
+      '''
+      Fire a missile at coordinate [row, col].
+      
+      Returns 'sunk', 'out_bounds', 'gone' or 'miss'.  Raises ValueError 
+      if the game is over.
+      '''
+      if self.is_over():
+         raise ValueError('The game is over')
+      
+      self.fired += 1
+      return fire_missile(self.board, self.battleships, coordinate)
+   
+   def missiles_left(self):
+      '''
+      Returns the number of missiles left (None if unlimited)
+      '''
+      return None if self.missiles is None else self.missiles - self.fired
+   
+   def won(self):
+      return len(self.battleships) == 0
+   
+   def is_over(self):
+      return self.won() or self.missiles_left() == 0
+
  
 def play_game(board, battleships, missiles=10): 
    '''
@@ -73,42 +162,39 @@ def play_game(board, battleships, missiles=10):
    Keyword arguments:
 
    board -- a list of lists.  Each list is a row on the board.
-   battleships -- a list of lists.  Each list is a coordiate pair location of a bettleship
+   battleships -- set of (row, col) locations of the battleships
    missiles -- the number of missiles available (default = 10)
    '''
    #This would not be included in the shipped version of the game.  It is just there so we can test our code.
-   print('DEBUG: Battleship locations are {0}\n'.format(battleships))
+   print('DEBUG: Battleship locations are {0}\n'.format(sorted(battleships)))
 
    for missile in range(missiles):
       show_board(board)
       print("Missile #{0} of {1}".format(missile + 1, missiles))
 
       coordinate = read_coordinate('Row, Col to target')
+      result = fire_missile(board, battleships, coordinate)
       
-      if missile_on_target(battleships, coordinate):
-         
+      if result == 'sunk':
          print("You sunk my Battleship!")
-         record_hit(board, coordinate, battleships)
          
          if len(battleships) == 0:  
             print("You sunk all of my Battleships!")
             break
          
-      elif missile_out_of_bounds(coordinate, grid_size):
+      elif result == 'out_bounds':
          print("Sector is out of game play bounds")
       
-      elif previously_targetted(coordinate):
+      elif result == 'gone':
          print("This sector of the ocean grid has already been targeted.")
       
       else:
-         
          print("Missed")
-         record_miss(board, coordinate)
      
      
       if missile == missiles - 1 :
          print("You have no more missiles.  You lose.  Game Over")
-         print('Remaining enemy battleship locations were {0}\n'.format(battleships))
+         print('Remaining enemy battleship locations were {0}\n'.format(sorted(battleships)))
 
 
 
@@ -159,11 +245,12 @@ def read_coordinate(prompt):
 def missile_on_target(battleships, coordinate):
     """
     Returns True/False indicating if a missile target contains a Battleship.
+    
+    Keyword arguments:
+    battleships -- set of (row, col) locations of the battleships afloat
+    coordinate -- list with 2 items [row, col]
     """
-    if coordinate in battleships:
-        return True
-    else:
-        return False
+    return (coordinate[0], coordinate[1]) in battleships
      
       
 def record_hit(board, coordinate, battleships):
@@ -173,10 +260,10 @@ def record_hit(board, coordinate, battleships):
    Keyword arguments:
    board -- a list of lists.  Each list is a row on the board.
    coordinate -- list with 2 items [row, col]
-   battleships -- a list of lists.  Each list is a coordiate pair location of a bettleship
+   battleships -- set of (row, col) locations of the battleships afloat
    '''
    board[coordinate[0]][coordinate[1]] = HIT
-   battleships.remove([coordinate[0], coordinate[1]])
+   battleships.discard((coordinate[0], coordinate[1]))
    
 def record_miss(board, coordinate):
    '''
@@ -199,11 +286,12 @@ def missile_out_of_bounds(coordinate, grid_size):
    return (coordinate[0] < 0 or coordinate[0] >= grid_size) or (coordinate[1] < 0 or coordinate[1] >= grid_size)
 
 
-def previously_targetted(coordinate):
+def previously_targetted(board, coordinate):
    '''
    Returns booleaning indicating if target has been hit by a missile previously
    
    Keyword arguments:
+   board -- a list of lists.  Each list is a row on the board.
    coordinate -- list with 2 items [row, col]
    '''
    return (board[coordinate[0]][coordinate[1]] == MISSED or board[coordinate[0]][coordinate[1]] == HIT)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Headless battleship simulation
+
+Classes:
+
+1. Simulator -- plays N matches between two target controllers with no terminal I/O
+2. SimulationResults -- aggregate statistics (win rate, shots-to-win, hit ratio)
+
+Used to benchmark targeting AIs against each other.
+
+A controller factory is any callable that accepts the GameBoard to be
+targeted and a random.Random and returns a target controller
+e.g. RandomTargetController.from_board.  Both default to
+ShuffledTargetController.from_board, random targeting without repeats.
+
+With no recorder, timings or debug events each shot is applied straight
+to the board with GameBoard.apply_shot().  The defaults then play about
+100k games per minute on one core (python benchmark.py --simulator).
+
+Deployment and each controller draw from their own stream spawned from
+the simulator's seed, so changing how one controller uses randomness does
+not change the fleets or the other controller's choices.
+
+"""
+
+from collections import Counter
+
+from classic_battleship import Game, GameBoard, RandomDeployEngine, debug_enabled
+from seeding import make_rng, spawn
+from targeting import ShuffledTargetController
+
+
+class SimulationResults(object):
+   """
+   Aggregate statistics for a series of headless matches between
+   controller 'a' and controller 'b'.
+   """
+
+   def __init__(self):
+      self.games = 0
+      self.wins = {'a': 0, 'b': 0}
+      self.shots = {'a': 0, 'b': 0}
+      self.hits = {'a': 0, 'b': 0}
+      self.shots_to_win = {'a': Counter(), 'b': Counter()}
+
+   def record_game(self, winner, shots, hits):
+      '''
+      Record the outcome of a single match
+
+      Keyword arguments:
+      winner -- 'a' or 'b'
+      shots -- dict of shots fired by each controller
+      hits -- dict of hits made by each controller
+      '''
+      self.games += 1
+      self.wins[winner] += 1
+      self.shots_to_win[winner][shots[winner]] += 1
+
+      for side in ('a', 'b'):
+         self.shots[side] += shots[side]
+         self.hits[side] += hits[side]
+
+   def merge(self, other):
+      '''
+      Combine the results of another SimulationResults into this one.
+      Returns self.
+      '''
+      self.games += other.games
+
+      for side in ('a', 'b'):
+         self.wins[side] += other.wins[side]
+         self.shots[side] += other.shots[side]
+         self.hits[side] += other.hits[side]
+         self.shots_to_win[side].update(other.shots_to_win[side])
+
+      return self
+
+   def win_rate(self, side):
+      '''
+      Proportion of games won by side ('a' or 'b')
+      '''
+      if self.games == 0:
+         return 0.0
+      return self.wins[side] / self.games
+
+   def hit_ratio(self, side):
+      '''
+      Proportion of shots fired by side ('a' or 'b') that hit a ship
+      '''
+      if self.shots[side] == 0:
+         return 0.0
+      return self.hits[side] / self.shots[side]
+
+   def mean_shots_to_win(self, side):
+      '''
+      Mean number of shots side ('a' or 'b') needed to win a game
+      '''
+      wins = self.wins[side]
+      if wins == 0:
+         return float('nan')
+      total = sum(shots * count for shots, count in self.shots_to_win[side].items())
+      return total / wins
+
+   def summary(self):
+      '''
+      Returns a dict summarising the results
+      '''
+      summary = {'games': self.games}
+      for side in ('a', 'b'):
+         summary[side] = {'wins': self.wins[side],
+                          'win_rate': self.win_rate(side),
+                          'hit_ratio': self.hit_ratio(side),
+                          'mean_shots_to_win': self.mean_shots_to_win(side),
+                          'shots_to_win': dict(sorted(self.shots_to_win[side].items()))}
+      return summary
+
+
+class Simulator(object):
+   """
+   Runs full headless matches between two pluggable target controllers.
+
+   Each match uses freshly deployed boards.  Controller 'a' targets
+   board 'b' and vice versa.  The side that fires first alternates between
+   games so that neither controller benefits from moving first.
+
+   Key method is run()
+   """
+
+   def __init__(self, controller_a=ShuffledTargetController.from_board,
+                controller_b=ShuffledTargetController.from_board,
+                grid_size=10, ship_sizes=(5, 4, 3, 3, 2), max_shots=None,
+                seed=None, board_class=GameBoard, recorder=None, timings=None):
+      '''
+      Keyword arguments:
+      controller_a -- factory returning a target controller for a board
+      (default = ShuffledTargetController.from_board)
+      controller_b -- factory returning a target controller for a board
+      (default = ShuffledTargetController.from_board)
+      grid_size -- boards are grid_size X grid_size (default = 10)
+      ship_sizes -- sizes of the ships in each fleet
+      max_shots -- optional limit on shots per side before a match is
+      abandoned (default = None i.e. unlimited)
+      seed -- None, int, random.Random, numpy Generator or SeedSequence.
+      Runs with the same seed are reproducible shot for shot 
+      (default = None)
+      board_class -- board implementation e.g. GameBoard or
+      bitboard.BitboardGameBoard (default = GameBoard)
+      recorder -- optional record.RecordWriter that every match is written
+      to with board 'a' as board 0 and board 'b' as board 1
+      (default = None)
+      timings -- optional instrumentation.PhaseTimings that every match
+      adds its per phase counts and timings to (default = None)
+      '''
+      self.controller_a = controller_a
+      self.controller_b = controller_b
+      self.grid_size = grid_size
+      self.ship_sizes = list(ship_sizes)
+      self.max_shots = max_shots
+      self.deploy_rng, self.rng_a, self.rng_b = [make_rng(child) 
+                                                 for child in spawn(seed, 3)]
+      self.board_class = board_class
+      self.recorder = recorder
+      self.timings = timings
+
+   def run(self, n_games):
+      '''
+      Play n_games matches and return a SimulationResults
+
+      Keyword arguments:
+      n_games -- number of matches to play
+      '''
+      results = SimulationResults()
+
+      for game_index in range(n_games):
+         outcome = self.play_match(first='a' if game_index % 2 == 0 else 'b')
+         if outcome is not None:
+            results.record_game(*outcome)
+
+      return results
+
+   def play_match(self, first='a'):
+      '''
+      Play a single headless match.
+
+      Returns a tuple of (winner, shots, hits) or None if the match was
+      abandoned after max_shots.
+
+      Keyword arguments:
+      first -- the side that fires first, 'a' or 'b' (default = 'a')
+      '''
+      boards = {'a': self._new_board(), 'b': self._new_board()}
+
+      game = Game(boards['a'], boards['b'])
+      if self.timings is not None:
+         game.enable_timing(self.timings)
+      recorder = self.recorder
+      if recorder is not None:
+         recorder.attach(game)
+
+      #each controller targets the opposing board
+      turns = {'a': (boards['b'], self.controller_a(boards['b'], self.rng_a)),
+               'b': (boards['a'], self.controller_b(boards['a'], self.rng_b))}
+
+      order = ('a', 'b') if first == 'a' else ('b', 'a')
+      shots = {'a': 0, 'b': 0}
+      hits = {'a': 0, 'b': 0}
+
+      #with nothing watching the game shots go straight to the board:
+      #the same outcomes as take_turn without building or publishing events
+      if self.timings is None and recorder is None and not debug_enabled():
+         return self._play_direct(turns, order, shots, hits)
+
+      max_shots = self.max_shots
+
+      while True:
+         for side in order:
+            board, controller = turns[side]
+
+            result = game.take_turn(board, controller)
+            shots[side] += 1
+
+            if result == 'hit' or result == 'sunk':
+               hits[side] += 1
+
+               if board.battleships_remaining() == 0:
+                  game.flush_events()
+                  if recorder is not None:
+                     recorder.write_end(1 if side == 'a' else 0)
+                  return side, shots, hits
+
+         if max_shots is not None and shots[order[1]] >= max_shots:
+            game.flush_events()
+            if recorder is not None:
+               recorder.write_end()
+            return None
+
+   def _play_direct(self, turns, order, shots, hits):
+      '''
+      Play a match with each shot applied straight to the board.  Takes and
+      returns the same values as the loop in play_match().
+      '''
+      first, second = order
+      board_1, controller_1 = turns[first]
+      board_2, controller_2 = turns[second]
+      select_1, record_1, apply_1 = (controller_1.select_target,
+                                     controller_1.record_result, board_1.apply_shot)
+      select_2, record_2, apply_2 = (controller_2.select_target,
+                                     controller_2.record_result, board_2.apply_shot)
+      max_shots = self.max_shots
+      limit = float('inf') if max_shots is None else max_shots
+      fired = hits_1 = hits_2 = 0
+
+      #fired counts whole rounds: the side that fires first has fired one
+      #more shot than that when it wins mid round
+      while fired < limit:
+         coordinate = select_1()
+         result = apply_1(coordinate)
+         if result == 'hit':
+            hits_1 += 1
+            record_1(coordinate, result, None)
+         elif result == 'sunk':
+            hits_1 += 1
+            record_1(coordinate, result, board_1.last_sunk_size)
+            if board_1.battleships_remaining() == 0:
+               shots[first], shots[second] = fired + 1, fired
+               hits[first], hits[second] = hits_1, hits_2
+               return first, shots, hits
+         else:
+            record_1(coordinate, result, None)
+
+         coordinate = select_2()
+         result = apply_2(coordinate)
+         fired += 1
+         if result == 'hit':
+            hits_2 += 1
+            record_2(coordinate, result, None)
+         elif result == 'sunk':
+            hits_2 += 1
+            record_2(coordinate, result, board_2.last_sunk_size)
+            if board_2.battleships_remaining() == 0:
+               shots[first] = shots[second] = fired
+               hits[first], hits[second] = hits_1, hits_2
+               return second, shots, hits
+         else:
+            record_2(coordinate, result, None)
+
+      return None
+
+   def _new_board(self):
+      board = self.board_class(self.grid_size,
+                               RandomDeployEngine(self.ship_sizes, self.grid_size,
+                                                  self.deploy_rng))
+      board.deploy_battleships()
+      return board
+
+
+if __name__ == "__main__":
+
+   import time
+
+   n_games = 10000
+   simulator = Simulator()
+
+   start = time.perf_counter()
+   results = simulator.run(n_games)
+   elapsed = time.perf_counter() - start
+
+   print(results.summary())
+   print(f'{n_games} games in {elapsed:.2f}s ({n_games / elapsed * 60:.0f} games per minute)')
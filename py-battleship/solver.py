@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Hit probabilities and expected remaining shots for a partly revealed board
+
+Classes:
+
+1. Position -- what a player knows: misses, hits and the sizes of the ships sunk
+2. Solution -- per cell hit probabilities and the expected remaining shots
+
+Functions:
+
+1. solve_exact -- enumerate every consistent fleet configuration
+2. solve_monte_carlo -- importance sampled estimate for large boards
+3. solve -- exact if the position is small enough, otherwise Monte Carlo
+
+Every fleet configuration consistent with the position is taken to be
+equally likely.  A configuration is consistent if no ship covers a miss,
+every hit is covered, each ship reported sunk lies entirely on hits and
+no ship still afloat lies entirely on hits.
+
+solve_exact places the ships one at a time (most constrained first) and
+keeps a dict of occupied bitmask: number of ways to reach it, so partial
+configurations that cover the same cells are merged and extended once.
+Layers are pruned as soon as a hit can no longer be covered by the ships
+still to place.
+
+solve_monte_carlo draws each ship from the placements that are legal
+given the ships already drawn, favouring placements through hits not yet
+covered, and weights each layout by 1 / (probability of drawing it).
+
+The expected remaining shots are for a player who fires at the unknown
+cells in decreasing order of their hit probability: the expected rank of
+the last unknown cell occupied by a ship.
+
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+
+from classic_battleship import HIT, MISSED
+from placements import placement_index
+from seeding import make_rng
+from targeting import CELL_HIT, CELL_MISSED, CELL_SUNK
+
+#solve() falls back to Monte Carlo if a layer of the exact solver grows beyond this
+DEFAULT_MAX_STATES = 200000
+
+#largest board (in cells) solve_exact will attempt
+EXACT_MAX_CELLS = 256
+
+
+class Position(object):
+   """
+   A partly revealed grid_size X grid_size board.  Cells are numbered
+   row * grid_size + col.
+   """
+
+   def __init__(self, grid_size, ship_sizes, misses=(), hits=(), sunk_sizes=()):
+      '''
+      Keyword arguments:
+      grid_size -- size of the n X n board
+      ship_sizes -- lengths of every ship in the fleet, sunk or afloat
+      misses -- cells known to be empty (or [row, col] coordinates)
+      hits -- cells known to hold a ship
+      sunk_sizes -- lengths of the ships reported sunk
+      '''
+      self.grid_size = grid_size
+      self.misses = {self._cell(c) for c in misses}
+      self.hits = {self._cell(c) for c in hits}
+
+      afloat = Counter(ship_sizes)
+      afloat.subtract(sunk_sizes)
+      if min(afloat.values(), default=0) < 0:
+         raise ValueError(f'sunk ships {list(sunk_sizes)} are not in the fleet {list(ship_sizes)}')
+
+      self.sunk_sizes = sorted(sunk_sizes, reverse=True)
+      self.afloat_sizes = sorted(afloat.elements(), reverse=True)
+
+   @classmethod
+   def from_board(cls, board, ship_sizes=None, sunk_sizes=None):
+      '''
+      The position seen by the player targeting a GameBoard
+
+      Keyword arguments:
+      board -- GameBoard
+      ship_sizes -- the fleet (default = None i.e. the board's deploy engine's
+      ship_sizes)
+      sunk_sizes -- lengths of the ships sunk (default = None i.e. the
+      ships no longer on the board, as reported when they were sunk)
+      '''
+      if ship_sizes is None:
+         ship_sizes = board.deploy_engine.ship_sizes
+      if sunk_sizes is None:
+         sunk = Counter(ship_sizes)
+         sunk.subtract(ship.length for ship in board.battleships)
+         sunk_sizes = list(sunk.elements())
+
+      n = board.grid_size
+      rows = board.board
+      misses = [r * n + c for r in range(n) for c in range(n) if rows[r][c] == MISSED]
+      hits = [r * n + c for r in range(n) for c in range(n) if rows[r][c] == HIT]
+
+      return cls(n, ship_sizes, misses, hits, sunk_sizes)
+
+   @classmethod
+   def from_controller(cls, controller):
+      '''
+      The position seen by a targeting.ProbabilityTargetController.  The
+      cells of the ships it has identified as sunk are treated as misses
+      and those ships are left out of the fleet.
+      '''
+      status = controller.status
+      misses = np.flatnonzero((status == CELL_MISSED) | (status == CELL_SUNK)).tolist()
+      hits = np.flatnonzero(status == CELL_HIT).tolist()
+      ship_sizes = [size for size, count in controller.remaining.items()
+                    for _ in range(count)]
+
+      return cls(controller.grid_size, ship_sizes, misses, hits)
+
+   def ships(self):
+      '''
+      Returns a list of (size, sunk) for every ship in the fleet
+      '''
+      return ([(size, True) for size in self.sunk_sizes]
+              + [(size, False) for size in self.afloat_sizes])
+
+   def legal_placements(self, size, sunk):
+      '''
+      Returns the ids (in placement_index(grid_size, size)) of the
+      placements of a ship that agree with the misses and hits on their own
+      '''
+      index = placement_index(self.grid_size, size)
+      table = index.cell_table
+      status = self.status()
+
+      legal = ~np.any(status[table] == CELL_MISSED, axis=1)
+      on_hits = np.all(status[table] == CELL_HIT, axis=1)
+      legal &= on_hits if sunk else ~on_hits
+
+      return np.flatnonzero(legal)
+
+   def status(self):
+      '''
+      Returns a flat uint8 array of CELL_UNKNOWN, CELL_MISSED or CELL_HIT
+      '''
+      status = np.zeros(self.grid_size * self.grid_size, dtype=np.uint8)
+      status[list(self.misses)] = CELL_MISSED
+      status[list(self.hits)] = CELL_HIT
+      return status
+
+   def _cell(self, cell):
+      if isinstance(cell, (int, np.integer)):
+         return int(cell)
+      return cell[0] * self.grid_size + cell[1]
+
+
+class Solution(object):
+   """
+   Result of a solver.
+
+   probabilities -- grid_size X grid_size array of the probability that
+   each cell holds a ship (1 for hits, 0 for misses)
+   expected_shots -- expected shots still needed to hit every ship cell
+   firing in decreasing order of probability
+   method -- 'exact' or 'monte_carlo'
+   configurations -- number of consistent configurations (exact) or
+   layouts sampled (Monte Carlo)
+   effective_samples -- Kish effective sample size (Monte Carlo only)
+   """
+
+   def __init__(self, probabilities, expected_shots, method, configurations,
+                effective_samples=None):
+      self.probabilities = probabilities
+      self.expected_shots = expected_shots
+      self.method = method
+      self.configurations = configurations
+      self.effective_samples = effective_samples
+
+   def best_target(self):
+      '''
+      Returns the [row, col] of the unknown cell most likely to hold a ship
+      '''
+      unknown = np.where(self.probabilities < 1, self.probabilities, -1)
+      return [int(i) for i in np.unravel_index(int(np.argmax(unknown)), unknown.shape)]
+
+   def __repr__(self):
+      return (f'Solution(method={self.method!r}, configurations={self.configurations}, '
+              f'expected_shots={self.expected_shots:.2f})')
+
+
+def solve_exact(position, max_states=DEFAULT_MAX_STATES):
+   '''
+   Solve position by enumerating every consistent configuration.
+   Returns a Solution.  Raises ValueError if the position is inconsistent,
+   the board has more than EXACT_MAX_CELLS cells or a layer of partial
+   configurations grows beyond max_states.
+
+   Keyword arguments:
+   position -- Position
+   max_states -- limit on distinct partial configurations per ship
+   (default = DEFAULT_MAX_STATES)
+   '''
+   n = position.grid_size
+   if n * n > EXACT_MAX_CELLS:
+      raise ValueError(f'boards over {EXACT_MAX_CELLS} cells are too large to '
+                       f'solve exactly, use solve_monte_carlo')
+
+   n_words = (n * n + 63) // 64
+   hits = _mask(position.hits)
+
+   #place the ships with the fewest legal placements first
+   fleet = []
+   for size, sunk in position.ships():
+      index = placement_index(n, size)
+      fleet.append([index.mask(int(p)) for p in position.legal_placements(size, sunk)])
+   fleet.sort(key=len)
+
+   #hits the ships after each layer cannot cover
+   stranded = [hits] * (len(fleet) + 1)
+   for i in range(len(fleet) - 1, -1, -1):
+      reachable = 0
+      for mask in fleet[i]:
+         reachable |= mask
+      stranded[i] = stranded[i + 1] & ~reachable
+
+   #each layer is the distinct occupied bitmasks, stored as n_words rows of
+   #uint64 words with one column per bitmask, and the number of ways to
+   #reach each of them
+   states = np.zeros((n_words, 1), dtype=np.uint64)
+   ways = np.ones(1, dtype=np.int64)
+   hit_words = _words([hits], n_words)[:, 0]
+
+   for i, masks in enumerate(fleet):
+      if states.shape[1] * len(masks) > 100 * max_states:
+         raise ValueError(f'more than {100 * max_states} partial configurations '
+                          f'to extend for ship {i + 1} of {len(fleet)}')
+
+      masks = _words(masks, n_words)
+      stranded_words = _words([stranded[i + 1]], n_words)[:, 0]
+
+      unions = []
+      counts = []
+      chunk = max(1, 4000000 // max(masks.shape[1], 1))
+      for first in range(0, states.shape[1], chunk):
+         block = states[:, first:first + chunk]
+
+         overlap = np.zeros((block.shape[1], masks.shape[1]), dtype=bool)
+         for w in range(n_words):
+            overlap |= (block[w][:, None] & masks[w][None, :]) != 0
+         rows, cols = np.nonzero(~overlap)
+
+         #drop unions leaving a hit no later ship can cover
+         union = [block[w][rows] | masks[w][cols] for w in range(n_words)]
+         keep = np.ones(len(rows), dtype=bool)
+         for w in range(n_words):
+            keep &= (hit_words[w] & ~union[w] & stranded_words[w]) == 0
+
+         unions.append(np.stack([words[keep] for words in union]))
+         counts.append(ways[first:first + chunk][rows[keep]])
+
+      states, ways = _merge(np.concatenate(unions, axis=1), np.concatenate(counts))
+
+      if states.shape[1] > max_states:
+         raise ValueError(f'more than {max_states} partial configurations '
+                          f'after {i + 1} of {len(fleet)} ships')
+
+   total = int(ways.sum())
+   if total == 0:
+      raise ValueError('no fleet configuration is consistent with the position')
+
+   layouts, cells = np.nonzero(_unpack(states, n * n))
+   probabilities, expected = _summarise(position, layouts, cells, ways / total)
+
+   return Solution(probabilities.reshape(n, n), expected, 'exact', total)
+
+
+def solve_monte_carlo(position, n_samples=20000, rng=None, hit_mix=0.5):
+   '''
+   Estimate hit probabilities by importance sampling fleet layouts.
+   Returns a Solution.  Raises ValueError if no sampled layout was
+   consistent with the position.
+
+   Each ship in turn is drawn from the placements that do not overlap the
+   ships already drawn: with probability hit_mix uniformly from those that
+   cover a hit not yet covered (if there are any), otherwise uniformly from
+   all of them.
+
+   Keyword arguments:
+   position -- Position
+   n_samples -- number of layouts to draw (default = 20000)
+   rng -- random.Random (or any seed accepted by seeding.make_rng)
+   (default = None)
+   hit_mix -- probability of drawing a placement through an uncovered hit
+   (default = 0.5)
+   '''
+   n = position.grid_size
+   rng = make_rng(rng)
+   hits = _mask(position.hits)
+   status = position.status()
+
+   ships = []
+   for size, sunk in position.ships():
+      index = placement_index(n, size)
+      legal = position.legal_placements(size, sunk)
+      if len(legal) == 0:
+         raise ValueError('no fleet configuration is consistent with the position')
+
+      is_legal = np.zeros(len(index), dtype=np.uint8)
+      is_legal[legal] = 1
+      is_legal = bytearray(is_legal)
+
+      on_hit = np.any(status[index.cell_table[legal]] == CELL_HIT, axis=1)
+      through_hits = [(p, index.mask(p)) for p in legal[on_hit].tolist()]
+      legal = legal.tolist()
+      #legal placements covering each cell, filled in as cells are drawn
+      covers = {}
+      ships.append((index, legal, is_legal, covers, through_hits))
+
+   layouts = []
+   log_weights = []
+
+   for _ in range(n_samples):
+      occupied = 0
+      cells = []
+      log_q = 0.0
+
+      for index, legal, is_legal, covers, through_hits in ships:
+         #legal placements overlapping the ships already drawn
+         blocked = set()
+         for c in cells:
+            covering = covers.get(c)
+            if covering is None:
+               covering = covers[c] = [p for p in index.covering(c) if is_legal[p]]
+            blocked.update(covering)
+         n_available = len(legal) - len(blocked)
+         if n_available == 0:
+            break
+
+         uncovered = hits & ~occupied
+         targets = [p for p, mask in through_hits
+                    if mask & uncovered and not mask & occupied] if uncovered else []
+         mix = hit_mix if targets else 0.0
+
+         if rng.random() < mix:
+            placement = targets[int(rng.random() * len(targets))]
+         elif n_available * 4 >= len(legal):
+            placement = legal[int(rng.random() * len(legal))]
+            while placement in blocked:
+               placement = legal[int(rng.random() * len(legal))]
+         else:
+            available = [p for p in legal if p not in blocked]
+            placement = available[int(rng.random() * len(available))]
+
+         mask = index.mask(placement)
+         q = (1.0 - mix) / n_available
+         if mix and mask & uncovered:
+            q += mix / len(targets)
+         log_q += math.log(q)
+
+         occupied |= mask
+         cells.extend(index.cells(placement))
+      else:
+         if hits & ~occupied == 0:
+            layouts.append(cells)
+            log_weights.append(-log_q)
+
+   if not layouts:
+      raise ValueError('no sampled layout was consistent with the position')
+
+   log_weights = np.array(log_weights)
+   weights = np.exp(log_weights - log_weights.max())
+   weights /= weights.sum()
+
+   cells = np.concatenate([np.asarray(layout) for layout in layouts])
+   rows = np.repeat(np.arange(len(layouts)), [len(layout) for layout in layouts])
+   probabilities, expected = _summarise(position, rows, cells, weights)
+
+   return Solution(probabilities.reshape(n, n), expected, 'monte_carlo',
+                   len(layouts), 1.0 / np.sum(weights ** 2))
+
+
+def solve(position, max_states=DEFAULT_MAX_STATES, n_samples=20000, rng=None):
+   '''
+   Solve position exactly if no layer of the exact solver exceeds
+   max_states partial configurations, otherwise by Monte Carlo.
+   Returns a Solution.
+   '''
+   try:
+      return solve_exact(position, max_states)
+   except ValueError:
+      return solve_monte_carlo(position, n_samples, rng)
+
+
+def _mask(cells):
+   mask = 0
+   for cell in cells:
+      mask |= 1 << int(cell)
+   return mask
+
+
+def _words(masks, n_words):
+   '''
+   Returns int bitmasks as an (n_words, len(masks)) array of uint64 words,
+   least significant word first
+   '''
+   words = np.zeros((n_words, len(masks)), dtype=np.uint64)
+   for column, mask in enumerate(masks):
+      for w in range(n_words):
+         words[w, column] = (mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF
+   return words
+
+
+def _merge(states, ways):
+   '''
+   Returns the distinct columns of states and the sum of ways for each
+   '''
+   if states.shape[1] == 0:
+      return states, ways
+
+   order = np.lexsort(states)
+   states = states[:, order]
+   ways = ways[order]
+
+   first = np.ones(states.shape[1], dtype=bool)
+   first[1:] = np.any(states[:, 1:] != states[:, :-1], axis=0)
+   starts = np.flatnonzero(first)
+
+   return states[:, starts], np.add.reduceat(ways, starts)
+
+
+def _unpack(states, n_cells):
+   '''
+   Returns a (number of bitmasks, n_cells) bool array of the cells set in
+   each column of uint64 words
+   '''
+   octets = np.ascontiguousarray(states.T).astype('<u8').view(np.uint8)
+   return np.unpackbits(octets, axis=1, bitorder='little')[:, :n_cells].astype(bool)
+
+
+def _summarise(position, layouts, cells, weights):
+   '''
+   Returns (flat array of hit probabilities, expected remaining shots)
+   from weighted fleet layouts.  The expected shots are for firing at the
+   unknown cells in decreasing order of probability until every ship cell
+   has been hit.
+
+   Keyword arguments:
+   position -- Position
+   layouts -- layout number of each occupied cell
+   cells -- the occupied cells, parallel to layouts
+   weights -- probability of each layout
+   '''
+   n_cells = position.grid_size * position.grid_size
+   probabilities = np.bincount(cells, weights=weights[layouts], minlength=n_cells)
+   probabilities[list(position.hits)] = 1.0
+
+   #rank[c] is the shot (1 based) at which unknown cell c is fired at
+   known = np.zeros(n_cells, dtype=bool)
+   known[list(position.hits | position.misses)] = True
+   order = np.argsort(-probabilities, kind='stable')
+   order = order[~known[order]]
+   rank = np.zeros(n_cells, dtype=np.int64)
+   rank[order] = np.arange(1, len(order) + 1)
+
+   shots = np.zeros(len(weights), dtype=np.int64)
+   np.maximum.at(shots, layouts, rank[cells])
+
+   return probabilities, float(weights @ shots)
+
+
+if __name__ == "__main__":
+
+   import time
+
+   from classic_battleship import GameBoard, RandomDeployEngine
+   from targeting import ProbabilityTargetController
+
+   board = GameBoard(10, RandomDeployEngine([5, 4, 3, 3, 2], 10, 7))
+   board.deploy_battleships()
+   controller = ProbabilityTargetController.from_board(board, 7)
+
+   #play 20 shots then analyse the position
+   for _ in range(20):
+      coordinate = controller.select_target()
+      hit, sunk = board.missile_on_target(coordinate)
+      if hit:
+         board.record_hit(coordinate)
+      else:
+         board.record_miss(coordinate)
+      controller.record_result(coordinate, 'sunk' if sunk else 'hit' if hit else 'miss',
+                               board.last_sunk_size if sunk else None)
+
+   position = Position.from_board(board)
+   for method in (solve_exact, solve_monte_carlo):
+      start = time.perf_counter()
+      solution = method(position)
+      print(f'{solution} best target {solution.best_target()} '
+            f'in {time.perf_counter() - start:.3f}s')
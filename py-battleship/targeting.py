@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Target controllers that learn from the outcome of each shot
+
+Classes:
+
+1. ProbabilityTargetController -- hunt/target using a placement probability heat map
+2. ShuffledTargetController -- random targets without repeats (lazy Fisher-Yates shuffle)
+3. HuntTargetController -- random hunting without repeats, then the neighbours of hits
+4. ParityTargetController -- HuntTargetController hunting only a lattice of cells
+
+Same interface as RandomTargetController: select_target() returns a
+[row, col] to fire at and Game.take_turn reports the outcome through
+record_result(coordinate, result, sunk_size).
+
+RandomTargetController draws with replacement so it keeps firing at
+cells it has already targeted.  ShuffledTargetController,
+HuntTargetController and ParityTargetController never fire at a cell
+twice and do O(1) (amortized) work per shot with O(n^2) memory at most.
+
+"""
+
+import numpy as np
+
+from placements import PlacementPool, placement_index
+from seeding import make_rng
+
+#status of each cell as seen by a controller
+CELL_UNKNOWN = 0
+CELL_MISSED = 1
+CELL_HIT = 2
+CELL_SUNK = 3
+
+
+class ProbabilityTargetController(object):
+   """
+   Fires at the cell covered by the most legal placements of the ships
+   still afloat.
+
+   For each ship size the controller keeps a flag for every placement
+   (still possible or ruled out by a miss / sunk ship) and a heat map of
+   the number of possible placements covering each cell.  The combined
+   density is the heat maps weighted by the number of ships of each size
+   still afloat.  A miss or sink only touches the placements covering the
+   cells involved so each update is incremental.
+
+   The unknown cells with the highest density are kept in a PlacementPool.
+   Cells that have since been fired at or cooled by a miss are dropped as
+   they are drawn, and the board is only searched again when the pool is
+   empty or a ship has been sunk.
+
+   Hunt mode: fire at a random cell from the pool of the hottest.
+   Target mode: while there are hits that do not belong to a sunk ship,
+   fire at the unknown cell covered by the most possible placements that
+   pass through those hits.
+   """
+
+   def __init__(self, grid_size, ship_sizes, rng=None):
+      '''
+      Keyword arguments:
+      grid_size -- size of the n X n board to target
+      ship_sizes -- the lengths of the ships in the enemy fleet
+      rng -- random.Random (or any seed accepted by seeding.make_rng) used
+      to break ties (default = None i.e. seeded from the operating system)
+      '''
+      self.grid_size = grid_size
+      self.rng = make_rng(rng)
+
+      self.remaining = {}
+      for size in ship_sizes:
+         self.remaining[size] = self.remaining.get(size, 0) + 1
+
+      n_cells = grid_size * grid_size
+      self.status = np.zeros(n_cells, dtype=np.uint8)
+      self.density = np.zeros(n_cells, dtype=np.int64)
+      self.unresolved = set()
+
+      #scratch scores of _target_cell(), zero between calls
+      self._scores = np.zeros(n_cells, dtype=np.int64)
+
+      #unknown cells with density _best (and some that no longer are),
+      #None until searched for
+      self._hottest = None
+      self._best = None
+
+      self._indexes = {}
+      self._cells = {}
+      self._possible = {}
+      self._heat = {}
+
+      for size, count in self.remaining.items():
+         index = placement_index(grid_size, size)
+         cells = index.cell_table
+         self._indexes[size] = index
+         self._cells[size] = cells
+         self._possible[size] = np.ones(len(index), dtype=bool)
+         self._heat[size] = index.coverage()
+         self.density += count * self._heat[size]
+
+   @classmethod
+   def from_board(cls, board, rng=None):
+      '''
+      Create a controller that targets board
+
+      Keyword arguments:
+      board -- the GameBoard to be targeted
+      rng -- random.Random used to break ties
+      '''
+      return cls(board.grid_size, board.deploy_engine.ship_sizes, rng)
+
+   def select_target(self):
+      '''
+      Returns the [row, col] to target
+      '''
+      cell = None
+
+      if self.unresolved:
+         cell = self._target_cell()
+
+      if cell is None:
+         cell = self._hunt_cell()
+
+      return list(divmod(cell, self.grid_size))
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      '''
+      Update the heat maps with the outcome of a shot
+
+      Keyword arguments:
+      coordinate -- the [row, col] targeted
+      result -- 'hit', 'sunk', 'out_bounds', 'gone' or 'miss'
+      sunk_size -- length of the ship sunk if result is 'sunk'
+      '''
+      if result == 'out_bounds' or result == 'gone':
+         return
+
+      cell = coordinate[0] * self.grid_size + coordinate[1]
+
+      if result == 'miss':
+         self.status[cell] = CELL_MISSED
+         self._rule_out(cell)
+         return
+
+      self.status[cell] = CELL_HIT
+      self.unresolved.add(cell)
+
+      if result == 'sunk' and sunk_size in self.remaining:
+         self._sink(cell, sunk_size)
+
+   def _hunt_cell(self):
+      hottest = self._hottest
+
+      while hottest is not None and len(hottest):
+         cell = hottest.choice(self.rng)
+         if self.status[cell] == CELL_UNKNOWN and self.density.item(cell) == self._best:
+            return cell
+         hottest.remove(cell)
+
+      density = np.where(self.status == CELL_UNKNOWN, self.density, -1)
+      self._best = int(density.max())
+      candidates = np.flatnonzero(density == self._best)
+      self._hottest = PlacementPool.of(candidates.tolist(), len(density))
+      return self._hottest.choice(self.rng)
+
+   def _target_cell(self):
+      '''
+      Returns the unknown cell covered by the most possible placements
+      through the unresolved hits.  Placements are weighted by the number
+      of unresolved hits they cover.  Returns None if there is no
+      candidate.
+      '''
+      scores = self._scores
+      cells = []
+
+      #a placement through k hits is added once per hit, which weights it by k
+      for size, count in self.remaining.items():
+         if count == 0:
+            continue
+
+         index = self._indexes[size]
+         placements = np.concatenate([index.covering_array(hit) for hit in self.unresolved])
+         placements = placements[self._possible[size][placements]]
+         covered = self._cells[size][placements].ravel()
+         np.add.at(scores, covered, count)
+         cells.append(covered)
+
+      cells = np.unique(np.concatenate(cells)) if cells else np.empty(0, dtype=np.intp)
+      cell_scores = scores[cells]
+      scores[cells] = 0
+
+      unknown = self.status[cells] == CELL_UNKNOWN
+      cells = cells[unknown]
+      if not len(cells):
+         return None
+
+      cell_scores = cell_scores[unknown]
+      candidates = cells[cell_scores == cell_scores.max()]
+      return int(candidates[int(self.rng.random() * len(candidates))])
+
+   def _rule_out(self, cell):
+      '''
+      Mark every placement covering cell as impossible and remove it from
+      the heat maps
+      '''
+      for size, index in self._indexes.items():
+         possible = self._possible[size]
+         covering = index.covering_array(cell)
+         covering = covering[possible[covering]]
+
+         if len(covering) == 0:
+            continue
+
+         possible[covering] = False
+         covered = self._cells[size][covering].ravel()
+         np.subtract.at(self._heat[size], covered, 1)
+         np.subtract.at(self.density, covered, self.remaining[size])
+
+   def _sink(self, cell, size):
+      '''
+      A ship of length size was sunk by the hit on cell.  Resolve which
+      hits it occupied, rule out placements through them and remove the
+      ship from the density.
+      '''
+      index = self._indexes[size]
+      unresolved = self.unresolved
+
+      ship = None
+      for placement in index.covering(cell):
+         cells = index.cells(placement)
+         if all(c in unresolved for c in cells):
+            ship = cells
+            break
+
+      #fall back to the sinking cell if the ship cannot be identified
+      for c in (ship if ship is not None else (cell,)):
+         unresolved.discard(c)
+         self.status[c] = CELL_SUNK
+         self._rule_out(c)
+
+      self.remaining[size] -= 1
+      self.density -= self._heat[size]
+      self._hottest = None
+
+
+class ShuffledTargetController(object):
+   """
+   Targets every cell exactly once in a uniformly random order.  The
+   order is drawn lazily (a Fisher-Yates shuffle that only records the
+   cells it has swapped) so memory grows with the shots fired.
+   """
+
+   def __init__(self, grid_size, rng=None):
+      '''
+      Keyword arguments:
+      grid_size -- size of the n X n board to target
+      rng -- random.Random (or any seed accepted by seeding.make_rng)
+      (default = None i.e. seeded from the operating system)
+      '''
+      self.grid_size = grid_size
+      self.rng = make_rng(rng)
+      self._remaining = grid_size * grid_size
+      self._swapped = {}
+
+   @classmethod
+   def from_board(cls, board, rng=None):
+      return cls(board.grid_size, rng)
+
+   def select_target(self):
+      remaining = self._remaining
+      if remaining == 0:
+         raise ValueError('Every cell has been targeted')
+
+      i = int(self.rng.random() * remaining)
+      last = self._remaining = remaining - 1
+      swapped = self._swapped
+      cell = swapped.get(i, i)
+      swapped[i] = swapped.pop(last, last)
+
+      grid_size = self.grid_size
+      return [cell // grid_size, cell % grid_size]
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      pass
+
+
+class HuntTargetController(object):
+   """
+   Hunt / target without repeats.
+
+   Hunt mode: fire at a random cell from a pool of cells not yet targeted
+   (a PlacementPool of cell ids, O(1) swap-remove).  A drawn cell that
+   cannot hold the smallest ship still afloat, because the unknown cells
+   through it in both directions are too few, is dropped for good.
+   Target mode: while there are hits that do not belong to a sunk ship,
+   fire at the unknown neighbours of hits, most recent hit first.
+   """
+
+   def __init__(self, grid_size, ship_sizes, rng=None):
+      '''
+      Keyword arguments:
+      grid_size -- size of the n X n board to target
+      ship_sizes -- the lengths of the ships in the enemy fleet
+      rng -- random.Random (or any seed accepted by seeding.make_rng)
+      (default = None i.e. seeded from the operating system)
+      '''
+      self.grid_size = grid_size
+      self.rng = make_rng(rng)
+
+      self.remaining = {}
+      for size in ship_sizes:
+         self.remaining[size] = self.remaining.get(size, 0) + 1
+      self.smallest = min(self.remaining)
+
+      self.status = bytearray(grid_size * grid_size)
+      #hits not yet accounted for by the ships reported sunk
+      self.open_hits = 0
+      #neighbours of hits still to try
+      self.stack = []
+
+      self.pool = self._hunt_pool()
+
+   @classmethod
+   def from_board(cls, board, rng=None):
+      return cls(board.grid_size, board.deploy_engine.ship_sizes, rng)
+
+   def select_target(self):
+      '''
+      Returns the [row, col] to target
+      '''
+      status = self.status
+      cell = None
+
+      while self.open_hits and self.stack:
+         candidate = self.stack.pop()
+         if status[candidate] == CELL_UNKNOWN:
+            cell = candidate
+            break
+
+      while cell is None and len(self.pool):
+         candidate = self.pool.choice(self.rng)
+         self.pool.remove(candidate)
+         if status[candidate] == CELL_UNKNOWN and self._fits(candidate):
+            cell = candidate
+
+      if cell is None:
+         #only reached if the position is inconsistent: fall back to any unknown cell
+         unknown = [c for c in range(len(status)) if status[c] == CELL_UNKNOWN]
+         if not unknown:
+            raise ValueError('Every cell has been targeted')
+         cell = unknown[int(self.rng.random() * len(unknown))]
+
+      if cell in self.pool:
+         self.pool.remove(cell)
+
+      return list(divmod(cell, self.grid_size))
+
+   def record_result(self, coordinate, result, sunk_size=None):
+      '''
+      Keyword arguments:
+      coordinate -- the [row, col] targeted
+      result -- 'hit', 'sunk', 'out_bounds', 'gone' or 'miss'
+      sunk_size -- length of the ship sunk if result is 'sunk'
+      '''
+      if result == 'out_bounds' or result == 'gone':
+         return
+
+      n = self.grid_size
+      row, col = coordinate[0], coordinate[1]
+      cell = row * n + col
+
+      if result == 'miss':
+         self.status[cell] = CELL_MISSED
+         return
+
+      self.status[cell] = CELL_HIT
+      self.open_hits += 1
+      neighbours = [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]
+      self.rng.shuffle(neighbours)
+      self.stack.extend(r * n + c for r, c in neighbours
+                        if 0 <= r < n and 0 <= c < n
+                        and self.status[r * n + c] == CELL_UNKNOWN)
+
+      if result == 'sunk' and self.remaining.get(sunk_size):
+         self.open_hits = max(self.open_hits - sunk_size, 0)
+         self.remaining[sunk_size] -= 1
+         if self.remaining[sunk_size] == 0:
+            del self.remaining[sunk_size]
+            if self.remaining and min(self.remaining) != self.smallest:
+               self.smallest = min(self.remaining)
+               self._smallest_changed()
+
+      if self.open_hits == 0:
+         self.stack.clear()
+
+   def _hunt_pool(self):
+      '''
+      Returns a PlacementPool of the cells to hunt
+      '''
+      return PlacementPool.of(range(len(self.status)), len(self.status))
+
+   def _smallest_changed(self):
+      '''
+      Called when the smallest ship afloat has been sunk
+      '''
+      pass
+
+   def _fits(self, cell):
+      '''
+      Returns True if the smallest ship afloat fits on unknown cells
+      through cell, horizontally or vertically
+      '''
+      n = self.grid_size
+      status = self.status
+      size = self.smallest
+      row, col = divmod(cell, n)
+
+      for step, limit in ((1, n - 1 - col), (n, n - 1 - row)):
+         back = min(col if step == 1 else row, size - 1)
+         run = 1
+         c = cell
+         for _ in range(min(limit, size - 1)):
+            c += step
+            if status[c] != CELL_UNKNOWN:
+               break
+            run += 1
+         c = cell
+         for _ in range(back):
+            c -= step
+            if status[c] != CELL_UNKNOWN:
+               break
+            run += 1
+         if run >= size:
+            return True
+
+      return False
+
+
+class ParityTargetController(HuntTargetController):
+   """
+   HuntTargetController that only hunts the cells with
+   (row + col) % smallest == offset, a checkerboard for ships of length 2.
+   Every ship afloat covers one of those cells.  The lattice is redrawn
+   with a random offset when the smallest ship afloat is sunk.
+   """
+
+   def _hunt_pool(self):
+      n = self.grid_size
+      size = self.smallest
+      offset = int(self.rng.random() * size)
+      cells = [c for c in range(n * n)
+               if (c // n + c % n) % size == offset and self.status[c] == CELL_UNKNOWN]
+      return PlacementPool.of(cells, n * n)
+
+   def _smallest_changed(self):
+      self.pool = self._hunt_pool()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Round-robin tournament between target controllers
+
+Classes:
+
+1. Tournament -- shards controller-vs-controller matches across a process pool
+2. TournamentResults -- merged round-robin table of SimulationResults
+
+Every pair of controllers plays games_per_pair matches.  The matches for
+a pair are split into shards of shard_size games and each shard is played
+in a worker process by a Simulator.  Each shard gets its own seed spawned
+from a numpy SeedSequence so results are reproducible and do not depend on
+the number of workers.
+
+Controller factories must be picklable e.g. module level functions or
+classmethods such as RandomTargetController.from_board
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from numpy.random import SeedSequence
+
+from classic_battleship import RandomTargetController
+from seeding import seed_sequence
+from simulation import SimulationResults, Simulator
+
+
+def play_shard(factory_a, factory_b, n_games, grid_size, ship_sizes, seed):
+   '''
+   Play n_games between two controllers in a worker process.
+   Returns a SimulationResults.
+
+   Keyword arguments:
+   factory_a -- controller factory for side 'a'
+   factory_b -- controller factory for side 'b'
+   n_games -- number of matches to play
+   grid_size -- boards are grid_size X grid_size
+   ship_sizes -- sizes of the ships in each fleet
+   seed -- the shard's SeedSequence
+   '''
+   simulator = Simulator(factory_a, factory_b, grid_size, ship_sizes,
+                         seed=seed)
+   return simulator.run(n_games)
+
+
+class TournamentResults(object):
+   """
+   Round-robin results.  Holds a SimulationResults for every pair of
+   controllers.  In results[(a, b)] side 'a' is the first named controller.
+   """
+
+   def __init__(self, names):
+      self.names = list(names)
+      self.results = {pair: SimulationResults()
+                      for pair in combinations(self.names, 2)}
+
+   def merge(self, pair, results):
+      '''
+      Merge a shard's SimulationResults into the results for pair
+      '''
+      self.results[pair].merge(results)
+
+   def head_to_head(self, name, opponent):
+      '''
+      Returns the SimulationResults for name vs opponent and the side
+      ('a' or 'b') that name played on.
+      '''
+      if (name, opponent) in self.results:
+         return self.results[(name, opponent)], 'a'
+      return self.results[(opponent, name)], 'b'
+
+   def table(self):
+      '''
+      Returns the round-robin table as a dict of dicts
+      table[name][opponent] = win rate of name against opponent
+      '''
+      table = {}
+      for name in self.names:
+         table[name] = {}
+         for opponent in self.names:
+            if opponent == name:
+               continue
+            results, side = self.head_to_head(name, opponent)
+            table[name][opponent] = results.win_rate(side)
+      return table
+
+   def standings(self):
+      '''
+      Returns a list of (name, wins, games, win_rate) sorted by win rate
+      '''
+      standings = []
+      for name in self.names:
+         wins = games = 0
+         for opponent in self.names:
+            if opponent == name:
+               continue
+            results, side = self.head_to_head(name, opponent)
+            wins += results.wins[side]
+            games += results.games
+         standings.append((name, wins, games, wins / games if games else 0.0))
+
+      return sorted(standings, key=lambda row: row[3], reverse=True)
+
+   def format_table(self):
+      '''
+      Returns the round-robin table as a string for display in the terminal
+      '''
+      width = max(len(name) for name in self.names) + 2
+      table = self.table()
+      lines = [''.ljust(width) + ''.join(name.rjust(width) for name in self.names)]
+
+      for name in self.names:
+         row = name.ljust(width)
+         for opponent in self.names:
+            cell = '-' if opponent == name else f'{table[name][opponent]:.3f}'
+            row += cell.rjust(width)
+         lines.append(row)
+
+      return '\n'.join(lines)
+
+
+class Tournament(object):
+   """
+   Round-robin tournament between named target controllers, played on a
+   concurrent.futures.ProcessPoolExecutor.
+
+   Key method is run()
+   """
+
+   def __init__(self, controllers, games_per_pair=1000, grid_size=10,
+                ship_sizes=(5, 4, 3, 3, 2), seed=None, workers=None,
+                shard_size=1000):
+      '''
+      Keyword arguments:
+      controllers -- dict of name: controller factory
+      games_per_pair -- matches played between every pair of controllers
+      grid_size -- boards are grid_size X grid_size (default = 10)
+      ship_sizes -- sizes of the ships in each fleet
+      seed -- root seed, any seed accepted by seeding.seed_sequence.  The
+      tournament spawns its own child from a SeedSequence, so it does not
+      repeat the streams of children the caller spawns from it
+      (default = None i.e. fresh entropy from the operating system)
+      workers -- number of worker processes (default = None i.e. one per CPU)
+      shard_size -- number of matches played per task (default = 1000)
+      '''
+      if len(controllers) < 2:
+         raise ValueError('A tournament requires at least two controllers')
+
+      self.controllers = dict(controllers)
+      self.games_per_pair = games_per_pair
+      self.grid_size = grid_size
+      self.ship_sizes = list(ship_sizes)
+      self.seed_sequence = seed_sequence(seed).spawn(1)[0]
+      self.workers = workers
+      self.shard_size = shard_size
+
+   def shards(self):
+      '''
+      Returns a list of (pair, n_games, seed) tasks covering every match
+      in the tournament.  The same root seed always produces the same tasks.
+      '''
+      tasks = []
+      for pair in combinations(self.controllers, 2):
+         remaining = self.games_per_pair
+         while remaining > 0:
+            n_games = min(self.shard_size, remaining)
+            tasks.append((pair, n_games))
+            remaining -= n_games
+
+      #spawn from a copy as spawning advances a SeedSequence
+      sequence = self.seed_sequence
+      root = SeedSequence(sequence.entropy, spawn_key=sequence.spawn_key,
+                          pool_size=sequence.pool_size,
+                          n_children_spawned=sequence.n_children_spawned)
+      seeds = root.spawn(len(tasks))
+
+      return [(pair, n_games, seed) for (pair, n_games), seed in zip(tasks, seeds)]
+
+   def run(self):
+      '''
+      Play every shard in the process pool and merge the results.
+      Returns a TournamentResults.
+      '''
+      results = TournamentResults(self.controllers)
+
+      with ProcessPoolExecutor(max_workers=self.workers) as executor:
+         futures = []
+         for pair, n_games, seed in self.shards():
+            future = executor.submit(play_shard,
+                                     self.controllers[pair[0]],
+                                     self.controllers[pair[1]],
+                                     n_games, self.grid_size,
+                                     self.ship_sizes, seed)
+            futures.append((pair, future))
+
+         for pair, future in futures:
+            results.merge(pair, future.result())
+
+      return results
+
+
+if __name__ == "__main__":
+
+   tournament = Tournament({'random_1': RandomTargetController.from_board,
+                            'random_2': RandomTargetController.from_board,
+                            'random_3': RandomTargetController.from_board},
+                           games_per_pair=2000, seed=42)
+
+   results = tournament.run()
+   print(results.format_table())
+   for name, wins, games, win_rate in results.standings():
+      print(f'{name}: {wins}/{games} ({win_rate:.3f})')